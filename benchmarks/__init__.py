@@ -0,0 +1,4 @@
+"""Benchmarks of zm-py against a local fake ZoneMinder server.
+
+Run them with ``python -m benchmarks``; see ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,83 @@
+"""Command line entry point of the benchmarks."""
+
+import argparse
+import json
+import sys
+
+from benchmarks.harness import ServerConfig, build_server, compare, run_scenario
+from benchmarks.scenarios import SCENARIOS
+
+
+def _parse_args(argv):
+    """Parse the command line."""
+    defaults = ServerConfig()
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure zm-py against a local fake ZoneMinder server.",
+    )
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default: all)")
+    parser.add_argument("--monitors", type=int, default=defaults.monitors)
+    parser.add_argument(
+        "--latency", type=float, default=defaults.latency, help="seconds added to each response"
+    )
+    parser.add_argument(
+        "--padding",
+        type=int,
+        default=defaults.padding,
+        help="extra bytes per monitor in monitors.json",
+    )
+    parser.add_argument("--events", type=int, default=defaults.events)
+    parser.add_argument("--frame-size", type=int, default=defaults.frame_size)
+    parser.add_argument("--frame-count", type=int, default=defaults.frame_count)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each scenario")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="fail on regressions from FILE")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed growth of wall time and memory over the baseline",
+    )
+    parser.add_argument("--list", action="store_true", help="list the scenarios")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    """Run the benchmarks, returning the exit status."""
+    args = _parse_args(argv)
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:28} {scenario.description}")
+        return 0
+
+    scenarios = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    config = ServerConfig(
+        args.monitors, args.latency, args.padding, args.events, args.frame_size, args.frame_count
+    )
+    print(f"{config}\n")
+    print(f"{'scenario':28} {'requests':>8} {'wall ms':>10} {'peak KiB':>10}")
+    results = []
+    with build_server(config) as fake:
+        for scenario in scenarios:
+            result = run_scenario(fake, scenario, args.repeat)
+            results.append(result)
+            print(
+                f"{result.scenario:28} {result.requests:8d} "
+                f"{result.wall_time * 1000:10.2f} {result.peak_memory / 1024:10.1f}"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"config": config._asdict(), "results": [r._asdict() for r in results]}, file)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
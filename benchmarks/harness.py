@@ -0,0 +1,117 @@
+"""Runs benchmark scenarios and compares their results with a baseline."""
+
+import gc
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple
+
+from zoneminder.zm import ZoneMinder
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class Scenario(NamedTuple):
+    """Something to measure: setup prepares a client and run is timed."""
+
+    name: str
+    description: str
+    setup: Callable
+    run: Callable
+
+
+class BenchmarkResult(NamedTuple):
+    """The measures of a scenario.
+
+    wall_time is the best of the repeated runs, in seconds; peak_memory is
+    the peak of the memory allocated by Python during a run, in bytes.
+    """
+
+    scenario: str
+    requests: int
+    wall_time: float
+    peak_memory: int
+
+
+class ServerConfig(NamedTuple):
+    """The shape of the fake ZoneMinder server the scenarios run against."""
+
+    monitors: int = 20
+    latency: float = 0.005
+    padding: int = 2000
+    events: int = 1000
+    frame_size: int = 64 * 1024
+    frame_count: int = 50
+
+
+def build_server(config) -> FakeZoneMinder:
+    """Build a fake ZoneMinder server shaped by a ServerConfig, to run with "with"."""
+    fake = FakeZoneMinder(monitor_count=config.monitors, monitor_padding=config.padding)
+    fake.frame_size = config.frame_size
+    fake.frame_count = config.frame_count
+    for i in range(config.events):
+        fake.add_event(1 + i % config.monitors, archived=i % 10 == 0, max_score=i % 100)
+    fake.latency = config.latency
+    return fake
+
+
+def _new_client(fake) -> ZoneMinder:
+    """Create a client of the fake server."""
+    return ZoneMinder(fake.url, None, None)
+
+
+def _measure(fake, scenario, trace) -> tuple:
+    """Run a scenario once on a new client, getting (requests, seconds, peak bytes)."""
+    with _new_client(fake) as client:
+        state = scenario.setup(client)
+        gc.collect()
+        with fake._lock:  # pylint: disable=protected-access
+            fake.requests.clear()
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        scenario.run(client, state)
+        elapsed = time.perf_counter() - started
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return len(fake.requests), elapsed, peak
+
+
+def run_scenario(fake, scenario, repeat=5) -> BenchmarkResult:
+    """Measure a scenario against a running fake server.
+
+    Wall time is measured without tracing allocations, which slows Python
+    down, in repeat runs; the peak memory is measured in one more run.
+    """
+    timings = [_measure(fake, scenario, trace=False) for _ in range(repeat)]
+    _, _, peak = _measure(fake, scenario, trace=True)
+    return BenchmarkResult(
+        scenario.name,
+        timings[0][0],
+        min(elapsed for _, elapsed, _ in timings),
+        peak,
+    )
+
+
+def compare(results, baseline, tolerance) -> List[str]:
+    """Get the regressions of results from a baseline of earlier results.
+
+    Any extra request is a regression; wall time and peak memory regress
+    when they grew by more than the tolerance (a fraction).
+    """
+    previous: Dict[str, dict] = {entry["scenario"]: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result.scenario)
+        if before is None:
+            continue
+        if result.requests > before["requests"]:
+            regressions.append(
+                f"{result.scenario}: {before['requests']} -> {result.requests} requests"
+            )
+        for field, unit in (("wall_time", "s"), ("peak_memory", "B")):
+            old, new = before[field], getattr(result, field)
+            if old and new > old * (1 + tolerance):
+                regressions.append(f"{result.scenario}: {field} {old:g}{unit} -> {new:g}{unit}")
+    return regressions
@@ -0,0 +1,107 @@
+"""The scenarios measured by the benchmarks, modelled on typical integrations."""
+
+from benchmarks.harness import Scenario
+from zoneminder.event_index import EventIndex
+from zoneminder.monitor import TimePeriod
+
+
+def _nothing(client):
+    """Prepare nothing."""
+    return None
+
+
+def _monitors(client):
+    """Fetch the monitors, outside of the measure."""
+    return client.get_monitors()
+
+
+def _dashboard_properties(client, monitors):
+    """Read every monitor's properties one by one, like most dashboards do."""
+    for monitor in monitors:
+        _ = (monitor.function, monitor.is_recording, monitor.is_available)
+
+
+def _dashboard_refresh_all(client, monitors):
+    """Refresh every monitor in bulk, then read its properties."""
+    client.refresh_all(monitors)
+    _dashboard_properties(client, monitors)
+
+
+def _event_counts_per_monitor(client, monitors):
+    """Count events of every monitor and period with Monitor.get_events."""
+    for monitor in monitors:
+        for time_period in TimePeriod:
+            monitor.get_events(time_period)
+
+
+def _event_index(client):
+    """Build an event index, outside of the measure."""
+    index = EventIndex(client)
+    index.sync()
+    return index
+
+
+def _stream_frames(client, monitors):
+    """Read the frames of a monitor's MJPEG stream until it ends."""
+    with monitors[0].stream_frames() as stream:
+        for _ in stream:
+            pass
+
+
+SCENARIOS = [
+    Scenario("get_monitors", "ZoneMinder.get_monitors()", _nothing, lambda c, _: c.get_monitors()),
+    Scenario(
+        "dashboard_properties",
+        "function, is_recording and is_available of every monitor",
+        _monitors,
+        _dashboard_properties,
+    ),
+    Scenario(
+        "dashboard_refresh_all",
+        "the same dashboard, through refresh_all",
+        _monitors,
+        _dashboard_refresh_all,
+    ),
+    Scenario(
+        "get_active_state",
+        "ZoneMinder.get_active_state()",
+        _nothing,
+        lambda c, _: c.get_active_state(),
+    ),
+    Scenario(
+        "event_counts_per_monitor",
+        "Monitor.get_events for every monitor and TimePeriod",
+        _monitors,
+        _event_counts_per_monitor,
+    ),
+    Scenario(
+        "event_counts",
+        "ZoneMinder.get_event_counts() for every TimePeriod",
+        _nothing,
+        lambda c, _: c.get_event_counts(),
+    ),
+    Scenario(
+        "event_index_sync",
+        "EventIndex.sync() of every event",
+        _nothing,
+        lambda c, _: EventIndex(c).sync(),
+    ),
+    Scenario(
+        "event_index_counts",
+        "EventIndex.counts() for every TimePeriod, once synced",
+        _event_index,
+        lambda c, index: index.counts(),
+    ),
+    Scenario(
+        "snapshots",
+        "ZoneMinder.get_snapshots() of every monitor",
+        _monitors,
+        lambda c, monitors: c.get_snapshots(monitors),
+    ),
+    Scenario(
+        "mjpeg_stream",
+        "every frame of one monitor's MJPEG stream",
+        _monitors,
+        _stream_frames,
+    ),
+]
@@ -0,0 +1,402 @@
+"""A small stand-in for the ZoneMinder HTTP API used by the tests."""
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from zoneminder.events import DATE_FORMAT
+
+
+def fake_jpeg(seed, size=1024):
+    """Build a fake JPEG image whose payload has no markers in it."""
+    return b"\xff\xd8" + bytes([seed % 200]) * size + b"\xff\xd9"
+
+
+def _raw_monitor(monitor_id, padding=0):
+    """Build a monitors.json entry the way ZoneMinder returns it.
+
+    padding adds about that many bytes of extra columns, like the many
+    other columns of ZoneMinder's Monitors table.
+    """
+    raw_monitor = {
+        "Id": str(monitor_id),
+        "Name": f"Camera {monitor_id}",
+        "Function": "Modect",
+        "Controllable": "1",
+        "StreamReplayBuffer": "0",
+    }
+    raw_monitor.update({f"Column{i}": "00000000" for i in range(padding // 24)})
+    return {
+        "Monitor": raw_monitor,
+        "Monitor_Status": {"MonitorId": str(monitor_id), "CaptureFPS": "5.00"},
+    }
+
+
+def _matches(field, operator, value):
+    """Evaluate one condition of a CakePHP named parameter filter."""
+    if field.isdigit() and value.isdigit():
+        field, value = int(field), int(value)
+    return {
+        "": field == value,
+        "=": field == value,
+        ">": field > value,
+        ">=": field >= value,
+        "<": field < value,
+        "<=": field <= value,
+    }[operator]
+
+
+class FakeZoneMinder:
+    """A threaded HTTP server answering a subset of the ZoneMinder API."""
+
+    def __init__(self, monitor_count=2, monitor_padding=0):
+        """Create the fake server with monitor_count monitors.
+
+        monitor_padding is roughly how many bytes each monitor adds to the
+        monitors.json payload beyond its few basic fields.
+        """
+        self.monitors = {i: _raw_monitor(i, monitor_padding) for i in range(1, monitor_count + 1)}
+        self.alarm_status = {i: "2" for i in self.monitors}
+        self.events = []
+        self.states = {1: "default", 2: "away", 3: "home"}
+        self.active_state = 1
+        # Run state Definitions, and how long changing one takes per camera
+        self.state_definitions = {}
+        self.camera_restart_time = 0.0
+        self.restarting = set()
+        self.latency = 0.0
+        self.frame_count = 10
+        self.frame_size = 1024
+        self.require_token = False
+        self.access_token_expires = 3600
+        self.logins = []
+        self.valid_tokens = set()
+        self.requests = []
+        self.controls = []
+        # Event videos by event id, served with Range support unless
+        # ranges is False; a transfer is cut after cut_media_after bytes
+        self.videos = {}
+        self.ranges = True
+        self.cut_media_after = None
+        self.range_requests = []
+        # The Content-Type of media responses instead of the file's, if set
+        self.media_content_type = None
+        # Paths answered with an error status instead of their route
+        self.failures = {}
+        # Paths whose JSON response is cut after that many bytes
+        self.cut_json_after = {}
+        # Monitors whose changes ZoneMinder fails to save
+        self.unsaved_monitors = set()
+        self.client_ports = set()
+        self._lock = threading.Lock()
+        self._routes = [
+            ("POST", r"/zm/api/host/login\.json", self._login),
+            ("GET", r"/zm/api/host/daemonCheck\.json", self._daemon_check),
+            ("GET", r"/zm/api/monitors\.json", self._get_monitors),
+            ("GET", r"/zm/api/monitors/(\d+)\.json", self._get_monitor),
+            ("POST", r"/zm/api/monitors/(\d+)\.json", self._set_monitor),
+            ("GET", r"/zm/api/monitors/alarm/id:(\d+)/command:status\.json", self._alarm),
+            ("GET", r"/zm/api/monitors/daemonStatus/id:(\d+)/daemon:zmc\.json", self._daemon),
+            (
+                "GET",
+                r"/zm/api/events/consoleEvents/(1 hour|1 day|1 week|1 month|100 year)"
+                r"(/Archived=:0)?\.json",
+                self._console_events,
+            ),
+            ("GET", r"/zm/api/events/index((?:/[^/]+)*)\.json", self._get_events),
+            ("GET", r"/zm/api/states\.json", self._get_states),
+            ("GET", r"/zm/api/states/change/(\w+)\.json", self._change_state),
+            ("POST", r"/zm/index\.php", self._index),
+            ("GET", r"/zm/index\.php", self._media),
+            ("GET", r"/zm/cgi-bin/nph-zms", self._zms),
+        ]
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        """Start serving in a background thread."""
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self) -> str:
+        """Get the base url of the fake server."""
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def add_event(self, monitor_id, age=timedelta(0), archived=False, max_score=10):
+        """Record an event that started age ago on a monitor."""
+        event_id = len(self.events) + 1
+        start = datetime.now().replace(microsecond=0) - age
+        self.events.append(
+            {
+                "Id": str(event_id),
+                "MonitorId": str(monitor_id),
+                "Name": f"Event {event_id}",
+                "Cause": "Motion",
+                "StartDateTime": start.strftime(DATE_FORMAT),
+                "EndDateTime": (start + timedelta(seconds=10)).strftime(DATE_FORMAT),
+                "Length": "10.00",
+                "Frames": "50",
+                "AlarmFrames": "5",
+                "TotScore": str(max_score * 5),
+                "AvgScore": str(max_score),
+                "MaxScore": str(max_score),
+                "Archived": str(int(archived)),
+            }
+        )
+        return event_id
+
+    def expire_tokens(self):
+        """Make the server reject every access token issued so far."""
+        with self._lock:
+            self.valid_tokens.clear()
+
+    def paths(self, method=None):
+        """Get the paths requested so far, optionally only for one method."""
+        with self._lock:
+            return [path for verb, path in self.requests if method in (None, verb)]
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, which Nagle's algorithm
+            # would hold up until the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):  # noqa: N802
+                fake._dispatch(self, "GET")
+
+            def do_POST(self):  # noqa: N802
+                fake._dispatch(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _dispatch(self, handler, method):
+        parts = urlsplit(handler.path)
+        path = unquote(parts.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        form = parse_qs(handler.rfile.read(length).decode()) if length else {}
+        with self._lock:
+            self.requests.append((method, path))
+            self.client_ports.add(handler.client_address[1])
+        query = parse_qs(parts.query)
+        time.sleep(self.latency)
+        for verb, pattern, route in [] if path in self.failures else self._routes:
+            match = re.fullmatch(pattern, path)
+            if verb == method and match:
+                if route == self._media and self._authorized(route, query):
+                    self._write_media(handler, *route(form=form, query=query))
+                    return
+                if self._authorized(route, query):
+                    status, body = route(*match.groups(), form=form, query=query)
+                else:
+                    status, body = 401, {"success": False}
+                break
+        else:
+            status, body = self.failures.get(path, 404), {"success": False}
+        if isinstance(body, list):
+            self._write_multipart(handler, body)
+            return
+        content_type = "image/jpeg"
+        payload = body
+        if not isinstance(body, bytes):
+            content_type = "application/json"
+            payload = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        if path in self.cut_json_after:
+            handler.wfile.write(payload[: self.cut_json_after[path]])
+            handler.wfile.flush()
+            handler.close_connection = True
+            return
+        handler.wfile.write(payload)
+
+    def _write_media(self, handler, status, payload):
+        """Send a file, or the part of it asked for by a Range header."""
+        content_type = "image/jpeg" if payload.startswith(b"\xff\xd8") else "video/mp4"
+        headers = {"Content-Type": self.media_content_type or content_type}
+        byte_range = handler.headers.get("Range")
+        if status == 200 and byte_range and self.ranges:
+            self.range_requests.append(byte_range)
+            start = int(re.fullmatch(r"bytes=(\d+)-", byte_range).group(1))
+            if start >= len(payload):
+                status, headers["Content-Range"] = 416, f"bytes */{len(payload)}"
+                payload = b""
+            else:
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{len(payload) - 1}/{len(payload)}"
+                payload = payload[start:]
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        if self.cut_media_after is not None and len(payload) > self.cut_media_after:
+            handler.wfile.write(payload[: self.cut_media_after])
+            handler.wfile.flush()
+            handler.close_connection = True
+            return
+        handler.wfile.write(payload)
+
+    @staticmethod
+    def _write_multipart(handler, frames):
+        """Stream frames the way nph-zms does, closing the connection at the end."""
+        handler.close_connection = True
+        handler.send_response(200)
+        handler.send_header("Content-Type", "multipart/x-mixed-replace; boundary=ZoneMinderFrame")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        for frame in frames:
+            handler.wfile.write(
+                b"--ZoneMinderFrame\r\nContent-Type: image/jpeg\r\n"
+                + f"Content-Length: {len(frame)}\r\n\r\n".encode()
+                + frame
+                + b"\r\n"
+            )
+            handler.wfile.flush()
+
+    def _authorized(self, route, query):
+        if not self.require_token or route in (self._login, self._index):
+            return True
+        with self._lock:
+            return query.get("token", [None])[0] in self.valid_tokens
+
+    def _login(self, form, query):
+        with self._lock:
+            kind = "refresh" if "token" in form else "password"
+            self.logins.append(kind)
+            access_token = f"token-{len(self.logins)}"
+            self.valid_tokens.add(access_token)
+        response = {
+            "access_token": access_token,
+            "access_token_expires": self.access_token_expires,
+            "version": "1.36.33",
+            "apiversion": "2.0",
+        }
+        if kind == "password":
+            response["refresh_token"] = f"refresh-{len(self.logins)}"
+            response["refresh_token_expires"] = 86400
+        return 200, response
+
+    def _daemon_check(self, form, query):
+        return 200, {"result": 1}
+
+    def _get_monitors(self, form, query):
+        return 200, {"monitors": list(self.monitors.values())}
+
+    def _get_monitor(self, monitor_id, form, query):
+        return 200, {"monitor": self.monitors[int(monitor_id)]}
+
+    def _set_monitor(self, monitor_id, form, query):
+        if int(monitor_id) in self.unsaved_monitors:
+            return 200, {"message": "Error"}
+        self.monitors[int(monitor_id)]["Monitor"]["Function"] = form["Monitor[Function]"][0]
+        return 200, {"message": "Saved"}
+
+    def _alarm(self, monitor_id, form, query):
+        return 200, {"status": self.alarm_status[int(monitor_id)]}
+
+    def _daemon(self, monitor_id, form, query):
+        if int(monitor_id) in self.restarting:
+            return 200, {"status": False, "statustext": "not running"}
+        return 200, {"status": True, "statustext": "running"}
+
+    def _console_events(self, period, unarchived_only, form, query):
+        spans = {"1 hour": 1 / 24, "1 day": 1, "1 week": 7, "1 month": 31, "100 year": 36500}
+        since = datetime.now() - timedelta(days=spans[period])
+        results = {}
+        for event in self.events:
+            start = datetime.strptime(event["StartDateTime"], DATE_FORMAT)
+            if start < since or (unarchived_only and event["Archived"] == "1"):
+                continue
+            key = str(event["MonitorId"])
+            results[key] = results.get(key, 0) + 1
+        # PHP encodes an empty associative array as a list
+        return 200, {"results": results or []}
+
+    def _get_events(self, filters, form, query):
+        events = self.events
+        for condition in filter(None, filters.split("/")):
+            field, operator, value = re.fullmatch(r"(\w+) ?([<>]?=?):(.*)", condition).groups()
+            events = [event for event in events if _matches(event[field], operator, value)]
+        events = sorted(events, key=lambda event: int(event["Id"]))
+        if query.get("direction") == ["desc"]:
+            events.reverse()
+        limit = int(query.get("limit", ["100"])[0])
+        page = int(query.get("page", ["1"])[0])
+        page_count = max(1, -(-len(events) // limit))
+        return 200, {
+            "events": [{"Event": event} for event in events[(page - 1) * limit : page * limit]],
+            "pagination": {
+                "page": page,
+                "count": len(events),
+                "pageCount": page_count,
+                "nextPage": page < page_count,
+                "prevPage": page > 1,
+                "limit": limit,
+            },
+        }
+
+    def _get_states(self, form, query):
+        states = [
+            {
+                "State": {
+                    "Id": str(i),
+                    "Name": name,
+                    "Definition": self.state_definitions.get(name, ""),
+                    "IsActive": int(i == self.active_state),
+                }
+            }
+            for i, name in self.states.items()
+        ]
+        return 200, {"states": states}
+
+    def _change_state(self, name, form, query):
+        self.active_state = next(i for i, state in self.states.items() if state == name)
+        targets = [
+            entry.split(":")
+            for entry in filter(None, self.state_definitions.get(name, "").split(","))
+        ]
+        self.restarting.update(int(monitor_id) for monitor_id, _, _ in targets)
+        for monitor_id, function, _ in targets:
+            time.sleep(self.camera_restart_time)
+            self.monitors[int(monitor_id)]["Monitor"]["Function"] = function
+            self.restarting.discard(int(monitor_id))
+        return 200, {"result": "Ok"}
+
+    def _zms(self, form, query):
+        monitor_id = int(query["monitor"][0])
+        if query["mode"][0] == "single":
+            return 200, fake_jpeg(monitor_id, self.frame_size)
+        return 200, [fake_jpeg(i, self.frame_size) for i in range(self.frame_count)]
+
+    def _media(self, form, query):
+        event_id = int(query["eid"][0])
+        if query["view"] == ["image"]:
+            return 200, fake_jpeg(event_id * 1000 + int(query["fid"][0]), self.frame_size)
+        if event_id not in self.videos:
+            return 404, b""
+        return 200, self.videos[event_id]
+
+    def _index(self, form, query):
+        if query.get("request") == ["control"]:
+            self.controls.append((int(query["id"][0]), query["control"][0]))
+        return 200, {"result": "Ok"}
@@ -0,0 +1,70 @@
+"""Tests to verify the aio module."""
+
+import asyncio
+import unittest
+
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.monitor import MonitorState, TimePeriod
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class TestAsyncZoneMinder(unittest.TestCase):
+    """Tests to verify the AsyncZoneMinder class against a fake server."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server."""
+        self.fake = FakeZoneMinder(monitor_count=20)
+        self.fake.__enter__()
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.fake.__exit__(None, None, None)
+
+    def run_client(self, coro_fn):
+        """Run coro_fn with a logged in client on a fresh event loop."""
+
+        async def runner():
+            async with AsyncZoneMinder(self.fake.url, "admin", "secret") as client:
+                self.assertTrue(await client.login())
+                return await coro_fn(client)
+
+        return asyncio.run(runner())
+
+    def test_concurrent_monitor_queries(self):
+        """Verifies that monitor queries can be gathered on one loop."""
+        self.fake.alarm_status[3] = "3"
+
+        async def query(client):
+            monitors = await client.get_monitors()
+            return await asyncio.gather(*(monitor.is_recording() for monitor in monitors))
+
+        recording = self.run_client(query)
+        self.assertEqual(20, len(recording))
+        self.assertEqual([3], [i + 1 for i, value in enumerate(recording) if value])
+
+    def test_function_round_trip(self):
+        """Verifies that a monitor function can be set and read back."""
+
+        async def round_trip(client):
+            monitor = (await client.get_monitors())[0]
+            await monitor.set_function(MonitorState.RECORD)
+            return await monitor.get_function(), await monitor.is_available()
+
+        self.assertEqual((MonitorState.RECORD, True), self.run_client(round_trip))
+
+    def test_get_events(self):
+        """Verifies that event counts are read from consoleEvents."""
+        self.fake.add_event(1)
+        self.fake.add_event(1)
+
+        async def events(client):
+            monitors = await client.get_monitors()
+            return await asyncio.gather(*(m.get_events(TimePeriod.HOUR) for m in monitors[:2]))
+
+        self.assertEqual([2, 0], self.run_client(events))
+
+    def test_truncated_monitors(self):
+        """Verifies that no Monitors are returned when monitors.json breaks off."""
+        self.fake.cut_json_after["/zm/api/monitors.json"] = 2000
+        self.assertEqual([], self.run_client(lambda client: client.get_monitors()))
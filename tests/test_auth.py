@@ -0,0 +1,47 @@
+"""Tests to verify the token lifecycle of the ZoneMinder client."""
+
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from zoneminder import zm
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class TestTokenLifecycle(unittest.TestCase):
+    """Tests to verify token refresh and single-flight re-login."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server that requires tokens."""
+        self.fake = FakeZoneMinder().__enter__()
+        self.fake.require_token = True
+        self.client = zm.ZoneMinder(self.fake.url, "admin", "secret")
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.client.close()
+        self.fake.__exit__(None, None, None)
+
+    def test_expiring_token_refreshed_ahead_of_time(self):
+        """Verifies that an expiring token is refreshed before the request."""
+        self.fake.access_token_expires = 0
+        self.assertTrue(self.client.login())
+        self.assertTrue(self.client.is_available)
+        self.assertEqual(["password", "refresh"], self.fake.logins)
+        self.assertEqual(3, len(self.fake.requests))
+
+    def test_rejected_token_renewed_with_refresh_token(self):
+        """Verifies that a rejected token is renewed without a password login."""
+        self.assertTrue(self.client.login())
+        self.fake.expire_tokens()
+        self.assertEqual(2, len(self.client.get_monitors()))
+        self.assertEqual(["password", "refresh"], self.fake.logins)
+
+    def test_concurrent_callers_share_one_login(self):
+        """Verifies that concurrent failures lead to a single re-login."""
+        self.assertTrue(self.client.login())
+        self.fake.expire_tokens()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: self.client.is_available, range(16)))
+        self.assertTrue(all(results))
+        self.assertEqual(["password", "refresh"], self.fake.logins)
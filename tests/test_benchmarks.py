@@ -0,0 +1,32 @@
+"""Tests to verify the benchmark harness."""
+
+from benchmarks.harness import (
+    BenchmarkResult,
+    ServerConfig,
+    build_server,
+    compare,
+    run_scenario,
+)
+from benchmarks.scenarios import SCENARIOS
+
+
+def test_scenarios_run():
+    """Verifies that every scenario runs and counts its requests."""
+    config = ServerConfig(monitors=3, latency=0, padding=100, events=20, frame_count=3)
+    with build_server(config) as fake:
+        results = {scenario.name: run_scenario(fake, scenario, repeat=1) for scenario in SCENARIOS}
+    assert 1 == results["get_monitors"].requests
+    assert 9 == results["dashboard_properties"].requests
+    assert 0 == results["event_index_counts"].requests
+    assert all(result.wall_time > 0 for result in results.values())
+    assert all(result.peak_memory > 0 for result in results.values())
+
+
+def test_compare():
+    """Verifies that extra requests and slower runs are regressions."""
+    baseline = [
+        {"scenario": "a", "requests": 2, "wall_time": 1.0, "peak_memory": 100},
+        {"scenario": "b", "requests": 2, "wall_time": 1.0, "peak_memory": 100},
+    ]
+    results = [BenchmarkResult("a", 3, 1.1, 100), BenchmarkResult("b", 1, 1.5, 90)]
+    assert ["a: 2 -> 3 requests", "b: wall_time 1s -> 1.5s"] == compare(results, baseline, 0.2)
@@ -0,0 +1,41 @@
+"""Tests to verify the cache module."""
+
+from unittest import mock
+
+from zoneminder.cache import StateCache, StateKind
+
+
+def test_get_respects_kind_ttl():
+    """Verifies that values expire after the TTL of their kind."""
+    cache = StateCache({StateKind.ALARM: 5})
+    with mock.patch("zoneminder.cache.time.monotonic", return_value=100.0):
+        cache.put(1, StateKind.ALARM, True)
+        cache.put(1, StateKind.DAEMON, True)
+    with mock.patch("zoneminder.cache.time.monotonic", return_value=104.0):
+        assert cache.get(1, StateKind.ALARM) == (True, 4.0)
+        assert cache.get(1, StateKind.DAEMON) is None
+        assert cache.peek(1, StateKind.DAEMON) == (True, 4.0)
+    with mock.patch("zoneminder.cache.time.monotonic", return_value=105.0):
+        assert cache.get(1, StateKind.ALARM) is None
+
+
+def test_put_ttl_extends_kind_ttl():
+    """Verifies that an explicit ttl only ever lengthens the kind's TTL."""
+    cache = StateCache({StateKind.FUNCTION: 10})
+    with mock.patch("zoneminder.cache.time.monotonic", return_value=0.0):
+        cache.put(1, StateKind.FUNCTION, "a", ttl=1)
+        cache.put(2, StateKind.FUNCTION, "b", ttl=30)
+    with mock.patch("zoneminder.cache.time.monotonic", return_value=20.0):
+        assert cache.get(1, StateKind.FUNCTION) is None
+        assert cache.get(2, StateKind.FUNCTION).value == "b"
+
+
+def test_invalidate_keeps_value_for_peek():
+    """Verifies that invalidated values expire but can still be peeked at."""
+    cache = StateCache({kind: 60 for kind in StateKind})
+    cache.put(1, StateKind.ALARM, True)
+    cache.put(2, StateKind.ALARM, False)
+    cache.invalidate(key=1)
+    assert cache.get(1, StateKind.ALARM) is None
+    assert cache.peek(1, StateKind.ALARM).value is True
+    assert cache.get(2, StateKind.ALARM).value is False
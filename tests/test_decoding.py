@@ -0,0 +1,92 @@
+"""Tests to verify the decoding module."""
+
+import json
+import unittest
+
+from zoneminder import zm
+from zoneminder.decoding import ArrayItemParser, loads
+
+from tests.fake_zm import FakeZoneMinder
+
+DOCUMENT = {
+    "note": "monitors",
+    "nested": [1, {"monitors": [2]}],
+    "monitors": [
+        {"Monitor": {"Name": 'a "quoted" \\ name ]} \u00e9\U0001f600', "Sizes": [1, [2, 3]]}},
+        "a ] string",
+        -1.5e-3,
+        12,
+        True,
+        None,
+        [],
+        {},
+    ],
+    "pagination": {"page": 1},
+}
+
+
+def parse(data, size, key="monitors") -> tuple:
+    """Feed data to a parser in chunks of size bytes, getting (items, parser)."""
+    parser = ArrayItemParser(key)
+    items = []
+    for i in range(0, len(data), size):
+        items += parser.feed(data[i : i + size])
+    items += parser.close()
+    return items, parser
+
+
+class TestArrayItemParser(unittest.TestCase):
+    """Tests to verify ArrayItemParser."""
+
+    def test_any_chunking(self):
+        """Verifies that the items are the same wherever the chunks are cut."""
+        for ensure_ascii in (True, False):
+            data = json.dumps(DOCUMENT, indent=1, ensure_ascii=ensure_ascii).encode()
+            for size in range(1, len(data) + 1):
+                items, parser = parse(data, size)
+                self.assertEqual(DOCUMENT["monitors"], items, size)
+                self.assertTrue(parser.found)
+
+    def test_items_as_they_arrive(self):
+        """Verifies that an item is returned by the chunk completing it."""
+        parser = ArrayItemParser("events")
+        self.assertEqual([], parser.feed(b'{"events": [{"Id": 1'))
+        self.assertEqual([{"Id": 1}], parser.feed(b'}, {"I'))
+        self.assertEqual([{"Id": 2}], parser.feed(b'd": 2}]}'))
+        parser.close()
+
+    def test_missing_key(self):
+        """Verifies that a complete document without the array has no items."""
+        for data in (b'{"success": false, "data": {"monitors": [1]}}', b'{"monitors": null}'):
+            items, parser = parse(data, 7)
+            self.assertEqual([], items)
+            self.assertFalse(parser.found)
+
+    def test_incomplete_document(self):
+        """Verifies that truncated or invalid documents raise ValueError."""
+        for data in (b'{"monitors": [1, {"a"', b'{"monitors": [1, {"a" 2}]}', b"<html>", b""):
+            with self.assertRaises(ValueError):
+                parse(data, 3)
+
+    def test_loads(self):
+        """Verifies that loads decodes bytes and str and raises ValueError."""
+        self.assertEqual({"a": [1]}, loads(b'{"a": [1]}'))
+        self.assertEqual({"a": [1]}, loads('{"a": [1]}'))
+        with self.assertRaises(ValueError):
+            loads(b"{")
+
+
+class TestStreamedMonitors(unittest.TestCase):
+    """Tests to verify that monitors.json is decoded as it is received."""
+
+    def test_get_monitors_streamed(self):
+        """Verifies that large monitors.json responses are decoded item by item."""
+        with FakeZoneMinder(monitor_count=30, monitor_padding=5000) as fake, zm.ZoneMinder(
+            fake.url, None, None
+        ) as client:
+            monitors = client.get_monitors()
+            stats = client.metrics.snapshot().endpoints[0]
+        self.assertEqual(list(range(1, 31)), [monitor.id for monitor in monitors])
+        self.assertEqual("api/monitors.json", stats.endpoint)
+        self.assertLess(30 * 5000, stats.bytes_received)
+        self.assertEqual(0, stats.errors)
@@ -0,0 +1,139 @@
+"""Tests to verify the download module."""
+
+from datetime import datetime
+import os
+import tempfile
+import unittest
+
+from zoneminder import zm
+from zoneminder.download import DownloadStatus, EventDownloader, MediaItem
+from zoneminder.events import Event
+
+from tests.fake_zm import FakeZoneMinder, fake_jpeg
+
+
+def event(event_id, monitor_id=1, frames=3) -> Event:
+    """Build an Event with the given ids and number of frames."""
+    return Event(event_id, monitor_id, "", "", datetime.now(), None, 1.0, frames, 0, 0, 0, 0, False)
+
+
+class TestEventDownloader(unittest.TestCase):
+    """Tests to verify EventDownloader against a fake server."""
+
+    def setUp(self):
+        """Start a fake server with a few videos and make a download directory."""
+        self.fake = FakeZoneMinder()
+        self.fake.videos = {i: bytes([i]) * (100_000 + i) for i in (1, 2, 3)}
+        self.fake.__enter__()
+        self.client = zm.ZoneMinder(self.fake.url, None, None)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Stop the fake server and remove the download directory."""
+        self.client.close()
+        self.fake.__exit__(None, None, None)
+        self.directory.cleanup()
+
+    def downloader(self, **kwargs) -> EventDownloader:
+        """Build a downloader saving to the download directory."""
+        return EventDownloader(self.client, self.directory.name, chunk_size=4096, **kwargs)
+
+    def read(self, *path) -> bytes:
+        """Read a downloaded file."""
+        with open(os.path.join(self.directory.name, *path), "rb") as file:
+            return file.read()
+
+    def test_download_videos(self):
+        """Verifies that videos are saved and skipped once downloaded."""
+        report = self.downloader(max_workers=2).download_events(event(i) for i in (1, 2, 3))
+        self.assertEqual([DownloadStatus.COMPLETE] * 3, [r.status for r in report.results])
+        self.assertEqual(300_006, report.bytes_received)
+        self.assertGreater(report.throughput, 0)
+        for i in (1, 2, 3):
+            self.assertEqual(self.fake.videos[i], self.read("1", f"{i}.mp4"))
+
+        report = self.downloader().download_events([event(1)])
+        self.assertEqual(DownloadStatus.SKIPPED, report.results[0].status)
+        self.assertEqual(0, report.bytes_received)
+
+    def test_download_frames(self):
+        """Verifies that frames are saved per event."""
+        report = self.downloader().download(MediaItem.frames(event(7, monitor_id=2), [1, 3]))
+        self.assertEqual([], report.failed)
+        self.assertEqual(fake_jpeg(7003, self.fake.frame_size), self.read("2", "7", "00003.jpg"))
+
+    def test_resume(self):
+        """Verifies that an interrupted download resumes with a Range request."""
+        self.fake.cut_media_after = 30_000
+        report = self.downloader().download_events([event(1)])
+        result = report.results[0]
+        self.assertEqual(DownloadStatus.FAILED, result.status)
+        # Up to the last whole chunk received
+        size = result.size
+        self.assertTrue(0 < size <= 30_000)
+        self.assertEqual(
+            size, os.path.getsize(os.path.join(self.directory.name, "1", "1.mp4.part"))
+        )
+
+        self.fake.cut_media_after = None
+        result = self.downloader().download_events([event(1)]).results[0]
+        self.assertEqual(DownloadStatus.COMPLETE, result.status)
+        self.assertEqual(size, result.resumed_from)
+        self.assertEqual(100_001 - size, result.bytes_received)
+        self.assertEqual([f"bytes={size}-"], self.fake.range_requests)
+        self.assertEqual(self.fake.videos[1], self.read("1", "1.mp4"))
+
+    def test_complete_part_file(self):
+        """Verifies that a partial file holding the whole file is only renamed."""
+        os.makedirs(os.path.join(self.directory.name, "1"))
+        with open(os.path.join(self.directory.name, "1", "2.mp4.part"), "wb") as file:
+            file.write(self.fake.videos[2])
+        result = self.downloader().download_events([event(2)]).results[0]
+        self.assertEqual(DownloadStatus.COMPLETE, result.status)
+        self.assertEqual(0, result.bytes_received)
+        self.assertEqual(self.fake.videos[2], self.read("1", "2.mp4"))
+
+    def test_no_range_support(self):
+        """Verifies that a server ignoring ranges has the file downloaded afresh."""
+        os.makedirs(os.path.join(self.directory.name, "1"))
+        with open(os.path.join(self.directory.name, "1", "3.mp4.part"), "wb") as file:
+            file.write(b"stale")
+        self.fake.ranges = False
+        result = self.downloader().download_events([event(3)]).results[0]
+        self.assertEqual(DownloadStatus.COMPLETE, result.status)
+        self.assertEqual(0, result.resumed_from)
+        self.assertEqual(self.fake.videos[3], self.read("1", "3.mp4"))
+
+    def test_missing_video(self):
+        """Verifies that a missing file fails without affecting the others."""
+        report = self.downloader().download_events([event(9), event(1)])
+        self.assertEqual(
+            [DownloadStatus.FAILED, DownloadStatus.COMPLETE], [r.status for r in report.results]
+        )
+
+    def test_token_auth(self):
+        """Verifies that files are requested with the access token."""
+        self.fake.require_token = True
+        with zm.ZoneMinder(self.fake.url, "admin", "secret") as client:
+            self.assertTrue(client.login())
+            report = EventDownloader(client, self.directory.name).download_events([event(1)])
+        self.assertEqual([], report.failed)
+
+    def test_not_media(self):
+        """Verifies that a page answered instead of the file is not saved."""
+        self.fake.media_content_type = "text/html; charset=UTF-8"
+        report = self.downloader().download_events([event(1)])
+        self.assertEqual(DownloadStatus.FAILED, report.results[0].status)
+        self.assertEqual([], os.listdir(os.path.join(self.directory.name, "1")))
+
+    def test_expired_token_renewed_once(self):
+        """Verifies that workers refused at once share a single renewal of the token."""
+        self.fake.require_token = True
+        with zm.ZoneMinder(self.fake.url, "admin", "secret") as client:
+            self.assertTrue(client.login())
+            self.fake.expire_tokens()
+            report = EventDownloader(client, self.directory.name, max_workers=3).download_events(
+                event(i) for i in (1, 2, 3)
+            )
+        self.assertEqual([], report.failed)
+        self.assertEqual(["password", "refresh"], self.fake.logins)
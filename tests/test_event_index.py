@@ -0,0 +1,100 @@
+"""Tests to verify the local event index."""
+
+from datetime import datetime, timedelta
+import unittest
+
+from zoneminder import zm
+from zoneminder.event_index import EventIndex
+from zoneminder.monitor import TimePeriod
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class TestEventIndex(unittest.TestCase):
+    """Tests to verify syncing and counting events locally."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server with events of various ages."""
+        self.fake = FakeZoneMinder().__enter__()
+        for hours in (0, 2, 30, 200, 2000):
+            self.fake.add_event(1, timedelta(hours=hours, minutes=1))
+        self.fake.add_event(2, timedelta(minutes=5), archived=True)
+        self.client = zm.ZoneMinder(self.fake.url, None, None)
+        self.index = EventIndex(self.client, page_size=4)
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.index.close()
+        self.client.close()
+        self.fake.__exit__(None, None, None)
+
+    def test_counts_match_console_events(self):
+        """Verifies that local counts match what consoleEvents reports."""
+        result = self.index.sync()
+        self.assertEqual((6, 0, 6), (result.new_events, result.updated_events, result.last_id))
+        self.fake.requests.clear()
+
+        remote = self.client.get_event_counts(monitors=self.client.get_monitors()[:1])
+        self.fake.requests.clear()
+        self.assertEqual(remote[1], self.index.counts()[1])
+        self.assertEqual(0, self.index.count(2, TimePeriod.HOUR))
+        self.assertEqual(1, self.index.count(2, TimePeriod.HOUR, include_archived=True))
+        self.assertEqual([], self.fake.requests)
+
+    def test_incremental_sync(self):
+        """Verifies that syncs only pull new and unfinished events."""
+        self.index.sync()
+        self.fake.requests.clear()
+        self.assertEqual((0, 0), self.index.sync()[:2])
+
+        self.fake.add_event(2)
+        self.fake.events[-1]["EndDateTime"] = None
+        self.fake.add_event(1)
+        self.assertEqual((2, 0), self.index.sync()[:2])
+        self.assertEqual(("GET", "/zm/api/events/index/Id >:6.json"), self.fake.requests[-1])
+
+        self.fake.events[6]["EndDateTime"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.assertEqual((0, 2), self.index.sync()[:2])
+        self.assertEqual((0, 0), self.index.sync()[:2])
+        self.assertEqual(8, len(self.index))
+
+    def test_archived_flag_synced(self):
+        """Verifies that events archived or unarchived after they ended are updated."""
+        self.index.sync()
+        self.fake.events[0]["Archived"] = "1"
+        self.fake.events[5]["Archived"] = "0"
+        self.assertEqual((0, 2), self.index.sync()[:2])
+        self.assertEqual(
+            ("GET", "/zm/api/events/index/Archived:1/Id <=:6.json"), self.fake.requests[-2]
+        )
+        remote = self.client.get_event_counts(monitors=self.client.get_monitors())
+        self.assertEqual(remote, self.index.counts())
+
+    def test_failed_sync_reported(self):
+        """Verifies that a failed request is reported and a full sync keeps the index."""
+        self.index.sync()
+        self.fake.add_event(1)
+        self.fake.failures["/zm/api/events/index/Id >:6.json"] = 500
+        result = self.index.sync()
+        self.assertEqual((0, 6, False), (result.new_events, result.last_id, result.complete))
+
+        self.fake.failures["/zm/api/events/index/Id >:0.json"] = 500
+        result = self.index.sync(full=True)
+        self.assertEqual((0, 6, False), (result.new_events, result.last_id, result.complete))
+        self.assertEqual(6, len(self.index))
+
+        self.fake.failures.clear()
+        self.client.circuit_breaker.reset()
+        result = self.index.sync(full=True)
+        self.assertEqual((7, 7, True), (result.new_events, result.last_id, result.complete))
+
+    def test_histogram(self):
+        """Verifies that events are counted per bucket of time."""
+        self.index.sync()
+        now = datetime.now()
+        histogram = self.index.histogram(
+            monitor_id=1, bucket=timedelta(days=1), start=now - timedelta(days=10)
+        )
+        self.assertEqual(4, sum(count for _, count in histogram))
+        self.assertEqual(sorted(histogram), histogram)
+        self.assertTrue(all(bucket.hour == 0 for bucket, _ in histogram))
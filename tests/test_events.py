@@ -0,0 +1,62 @@
+"""Tests to verify the events module."""
+
+from datetime import datetime, timedelta
+import unittest
+
+from zoneminder import zm
+from zoneminder.events import EventQuery
+
+from tests.fake_zm import FakeZoneMinder
+
+
+def test_event_query_url():
+    """Verifies that filters are pushed into the url path."""
+    query = EventQuery(
+        monitor_id=2,
+        start=datetime(2024, 1, 2, 3, 4, 5),
+        archived=False,
+        min_score=20,
+        page_size=50,
+    )
+    assert query.page_url(3) == (
+        "api/events/index/MonitorId:2/StartDateTime%20%3E%3D:2024-01-02%2003:04:05"
+        "/Archived:0/MaxScore%20%3E%3D:20.json?page=3&limit=50&sort=Id&direction=asc"
+    )
+
+
+class TestIterEvents(unittest.TestCase):
+    """Tests to verify the lazy, paginated event iterator."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server with some events."""
+        self.fake = FakeZoneMinder().__enter__()
+        for i in range(25):
+            self.fake.add_event(1 + i % 2, timedelta(hours=25 - i), max_score=i)
+        self.client = zm.ZoneMinder(self.fake.url, None, None)
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.client.close()
+        self.fake.__exit__(None, None, None)
+
+    def test_pages_fetched_lazily(self):
+        """Verifies that pages are only fetched as the iteration reaches them."""
+        events = self.client.iter_events(page_size=10, read_ahead=False)
+        self.assertEqual([], self.fake.requests)
+        first = [next(events) for _ in range(10)]
+        self.assertEqual(list(range(1, 11)), [event.id for event in first])
+        self.assertEqual(1, len(self.fake.requests))
+        self.assertEqual(15, len(list(events)))
+        self.assertEqual(3, len(self.fake.requests))
+
+    def test_filters_and_read_ahead(self):
+        """Verifies server-side filters with the next page read ahead."""
+        monitor = self.client.get_monitors()[1]
+        events = list(
+            monitor.iter_events(
+                start=datetime.now() - timedelta(hours=20), min_score=8, page_size=2
+            )
+        )
+        self.assertEqual([10, 12, 14, 16, 18, 20, 22, 24], [event.id for event in events])
+        self.assertTrue(all(event.monitor_id == 2 for event in events))
+        self.assertEqual(timedelta(seconds=10), events[0].end_time - events[0].start_time)
@@ -0,0 +1,119 @@
+"""Tests to verify the fleet module."""
+
+import time
+import unittest
+
+from zoneminder.fleet import Fleet
+from zoneminder.monitor import TimePeriod
+from zoneminder.resilience import Backoff
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class TestFleet(unittest.TestCase):
+    """Tests to verify Fleet against several fake servers."""
+
+    def setUp(self):
+        """Start three fake servers and a fleet connected to them."""
+        self.fakes = {name: FakeZoneMinder(monitor_count=2) for name in ("a", "b", "c")}
+        self.fleet = Fleet(timeout=1)
+        for name, fake in self.fakes.items():
+            fake.__enter__()
+            self.fleet.connect(name, fake.url, None, None)
+
+    def tearDown(self):
+        """Close the fleet and stop the fake servers."""
+        self.fleet.close()
+        for fake in self.fakes.values():
+            fake.__exit__(None, None, None)
+
+    def test_get_monitors(self):
+        """Verifies that monitors are merged keyed by server and monitor id."""
+        result = self.fleet.get_monitors()
+        self.assertTrue(result.ok)
+        self.assertEqual(
+            [(name, i) for name in ("a", "b", "c") for i in (1, 2)], sorted(result.values)
+        )
+        self.assertEqual(2, result.values[("b", 2)].id)
+        self.assertEqual({"a", "b", "c"}, set(result.latency))
+
+    def test_queries_in_parallel(self):
+        """Verifies that slow servers are queried at the same time."""
+        for fake in self.fakes.values():
+            fake.latency = 0.2
+        started = time.monotonic()
+        result = self.fleet.get_active_state()
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual({"a": "default", "b": "default", "c": "default"}, result.values)
+
+    def test_slow_server_isolated(self):
+        """Verifies that a server exceeding the timeout is reported without the others."""
+        self.fakes["b"].latency = 0.6
+        started = time.monotonic()
+        result = self.fleet.is_available(timeout=0.3)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual({"a": True, "b": False, "c": True}, result.values)
+        self.assertEqual({"b": "timeout"}, result.errors)
+
+        # Still answering the query given up on
+        result = self.fleet.is_available(timeout=0.3)
+        self.assertEqual({"b": "busy"}, result.errors)
+        self.assertEqual(1, self.fakes["b"].paths().count("/zm/api/host/daemonCheck.json"))
+
+    def test_failing_server_isolated(self):
+        """Verifies that an exception raised for a server is reported as its error."""
+
+        def query(client):
+            if client is self.fleet.servers["c"]:
+                raise ValueError("broken")
+            return client.get_active_state()
+
+        result = self.fleet.map(query)
+        self.assertEqual({"a": "default", "b": "default"}, result.values)
+        self.assertEqual({"c": "ValueError('broken')"}, result.errors)
+        self.assertFalse(result.ok)
+
+    def test_unreachable_server_reported(self):
+        """Verifies that a server whose requests fail is reported, not answered empty."""
+        self.fleet.connect("down", "http://127.0.0.1:1", None, None, backoff=Backoff(base=0))
+        result = self.fleet.get_monitors()
+        self.assertEqual({"down": "connection"}, result.errors)
+        self.assertEqual(6, len(result.values))
+        # Failing fast after the failures of the first query
+        result = self.fleet.get_active_state()
+        self.assertEqual({"down": "circuit_open"}, result.errors)
+        self.assertNotIn("down", result.values)
+        self.assertEqual(
+            {"a": True, "b": True, "c": True, "down": False}, self.fleet.is_available().values
+        )
+
+    def test_get_event_counts(self):
+        """Verifies that event counts are merged keyed by server and monitor id."""
+        self.fakes["a"].add_event(2)
+        self.fakes["c"].add_event(1)
+        result = self.fleet.get_event_counts([TimePeriod.HOUR])
+        self.assertEqual(
+            {("a", 2): {TimePeriod.HOUR: 1}, ("c", 1): {TimePeriod.HOUR: 1}}, result.values
+        )
+
+    def test_failing_event_counts_reported(self):
+        """Verifies that requests failing on the workers of a client fail its query."""
+        self.fakes["a"].add_event(2)
+        for time_period in (TimePeriod.HOUR, TimePeriod.DAY):
+            path = f"/zm/api/events/consoleEvents/1 {time_period.period}/Archived=:0.json"
+            self.fakes["b"].failures[path] = 500
+        result = self.fleet.get_event_counts([TimePeriod.HOUR, TimePeriod.DAY])
+        self.assertEqual({"b": "server"}, result.errors)
+        self.assertEqual({("a", 2): {TimePeriod.HOUR: 1, TimePeriod.DAY: 1}}, result.values)
+
+    def test_set_active_state(self):
+        """Verifies that run states are changed on every server."""
+        result = self.fleet.set_active_state("away")
+        self.assertTrue(result.ok)
+        self.assertEqual([2, 2, 2], [fake.active_state for fake in self.fakes.values()])
+
+    def test_remove(self):
+        """Verifies that removed servers are no longer queried."""
+        client = self.fleet.remove("a")
+        self.assertIsNotNone(client)
+        self.assertEqual({"b", "c"}, set(self.fleet.is_available().values))
@@ -0,0 +1,98 @@
+"""Tests to verify the metrics module."""
+
+import asyncio
+import unittest
+
+from zoneminder import zm
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.metrics import Metrics, RequestRecord, endpoint_template
+
+from tests.fake_zm import FakeZoneMinder
+
+
+def test_endpoint_template():
+    """Verifies that ids and filter values are templated out of API urls."""
+    assert "api/monitors/{id}.json" == endpoint_template("api/monitors/12.json")
+    assert "api/monitors/alarm/id:{id}/command:status.json" == endpoint_template(
+        "api/monitors/alarm/id:3/command:status.json?token=abc"
+    )
+    assert "api/events/index/MonitorId:{}/Id >:{}.json" == endpoint_template(
+        "api/events/index/MonitorId:2/Id%20%3E:6.json?page=2"
+    )
+    assert "api/states/change/away.json" == endpoint_template("api/states/change/away.json")
+
+
+def test_histogram_and_prometheus():
+    """Verifies the latency buckets and the Prometheus text export."""
+    metrics = Metrics(buckets=(0.1, 1.0))
+    for elapsed in (0.05, 0.1, 0.5, 3.0):
+        metrics.record(RequestRecord("GET", 'a"b', "a", 200, elapsed, 10, 0.001, 0, None))
+    stats = metrics.snapshot().endpoints[0]
+    assert ((0.1, 2), (1.0, 3), (float("inf"), 4)) == stats.latency_buckets
+    assert 40 == stats.bytes_received
+
+    text = metrics.to_prometheus()
+    assert "# TYPE zoneminder_request_duration_seconds histogram" in text
+    assert 'zoneminder_requests_total{method="GET",endpoint="a\\"b"} 4' in text
+    assert (
+        'zoneminder_request_duration_seconds_bucket{method="GET",endpoint="a\\"b",le="+Inf"} 4'
+        in text
+    )
+
+
+class TestClientMetrics(unittest.TestCase):
+    """Tests to verify the instrumentation of the clients."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server requiring tokens."""
+        self.fake = FakeZoneMinder(monitor_count=2).__enter__()
+        self.fake.require_token = True
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.fake.__exit__(None, None, None)
+
+    def test_requests_counted(self):
+        """Verifies per endpoint counts, hooks, retries and logins."""
+        started, finished = [], []
+        with zm.ZoneMinder(self.fake.url, "admin", "secret") as client:
+            client.metrics.add_pre_hook(lambda *request: started.append(request))
+            remove = client.metrics.add_post_hook(finished.append)
+            client.login()
+            for monitor in client.get_monitors():
+                self.assertFalse(monitor.is_recording)
+            self.fake.expire_tokens()
+            client.get_monitors()
+            remove()
+            client.get_state("api/nothing.json")
+            snapshot = client.metrics.snapshot()
+
+        self.assertEqual(("GET", "api/monitors.json", "api/monitors.json"), started[0])
+        self.assertEqual(4, len(finished))
+        endpoints = {(stats.method, stats.endpoint): stats for stats in snapshot.endpoints}
+        monitors = endpoints[("GET", "api/monitors.json")]
+        self.assertEqual((2, 0, 1), (monitors.requests, monitors.errors, monitors.retries))
+        self.assertGreater(monitors.bytes_received, 0)
+        self.assertGreater(monitors.decode_time, 0)
+        alarm = endpoints[("GET", "api/monitors/alarm/id:{id}/command:status.json")]
+        self.assertEqual(2, alarm.requests)
+        self.assertEqual(1, endpoints[("GET", "api/nothing.json")].errors)
+        self.assertEqual(5, snapshot.requests)
+        # The expired token only: a missing endpoint is not an auth failure
+        self.assertEqual((1, 1), (snapshot.logins, snapshot.token_refreshes))
+
+    def test_async_requests_counted(self):
+        """Verifies that the asyncio client shares a Metrics."""
+        metrics = Metrics()
+
+        async def run():
+            async with AsyncZoneMinder(self.fake.url, "admin", "secret", metrics=metrics) as client:
+                await client.login()
+                await client.get_monitors()
+                await client.is_available()
+
+        asyncio.run(run())
+        snapshot = metrics.snapshot()
+        self.assertEqual(2, snapshot.requests)
+        self.assertEqual(1, snapshot.logins)
+        self.assertIn("zoneminder_logins_total 1", metrics.to_prometheus())
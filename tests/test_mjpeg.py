@@ -0,0 +1,137 @@
+"""Tests to verify the mjpeg module."""
+
+import asyncio
+import time
+from unittest import mock
+
+import aiohttp
+from pytest import mark, raises
+import requests
+
+from zoneminder import zm
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.mjpeg import AsyncMjpegStream, MjpegParser, MjpegStream
+
+from tests.fake_zm import FakeZoneMinder, fake_jpeg
+
+
+def _part(frame, content_length=True):
+    """Build one part of an nph-zms multipart stream."""
+    header = b"--ZoneMinderFrame\r\nContent-Type: image/jpeg\r\n"
+    if content_length:
+        header += f"Content-Length: {len(frame)}\r\n".encode()
+    return header + b"\r\n" + frame + b"\r\n"
+
+
+@mark.parametrize("content_length", [True, False])
+@mark.parametrize("chunk_size", [1, 7, 4096])
+def test_parser_finds_frames_across_chunks(content_length, chunk_size):
+    """Verifies that frames are found whatever the chunking of the stream."""
+    frames = [fake_jpeg(i, 300 + i) for i in range(5)]
+    stream = b"".join(_part(frame, content_length) for frame in frames)
+    parser = MjpegParser(buffer_size=64)
+    found = []
+    for i in range(0, len(stream), chunk_size):
+        found.extend(bytes(frame) for frame in parser.feed(stream[i : i + chunk_size]))
+    assert found == frames
+
+
+def test_parser_releases_frames_on_next_feed():
+    """Verifies that frames are views only valid until the next feed."""
+    parser = MjpegParser()
+    (frame,) = parser.feed(_part(fake_jpeg(1)))
+    assert isinstance(frame, memoryview)
+    parser.feed(b"")
+    try:
+        bytes(frame)
+    except ValueError:
+        return
+    raise AssertionError("frame was not released")
+
+
+def test_stream_frames_decimation():
+    """Verifies that every Nth frame is yielded and the rest counted as dropped."""
+    with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+        fake.frame_count = 9
+        monitor = client.get_monitors()[0]
+        with monitor.stream_frames(every=3, copy=True) as stream:
+            frames = list(stream)
+    assert frames == [fake_jpeg(2), fake_jpeg(5), fake_jpeg(8)]
+    assert stream.stats.frames_received == 9
+    assert stream.stats.frames_dropped == 6
+    assert stream.stats.bytes_received > 9 * 1024
+
+
+def test_stream_latest_skips_to_newest_frame():
+    """Verifies that a slow consumer of the sync stream gets the newest frame."""
+    with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+        fake.frame_size = 100_000
+        monitor = client.get_monitors()[0]
+        with monitor.stream_frames(latest=True) as stream:
+            first = bytes(next(stream))
+            # Every other frame is received meanwhile
+            time.sleep(0.3)
+            frames = [first] + [bytes(frame) for frame in stream]
+    assert frames[-1] == fake_jpeg(9, 100_000)
+    assert len(frames) <= 2
+    assert stream.stats.frames_yielded + stream.stats.frames_dropped == 10
+
+
+def test_stream_closed_on_error_status():
+    """Verifies that the connection is released when the stream cannot be opened."""
+    response = mock.Mock()
+    response.raise_for_status.side_effect = requests.HTTPError("403")
+    session = mock.Mock(get=mock.Mock(return_value=response))
+    with raises(requests.HTTPError):
+        MjpegStream(session, "http://zm/stream")
+    response.close.assert_called_once()
+
+    async def collect():
+        session.get = mock.AsyncMock(return_value=response)
+        async with AsyncMjpegStream(session, "http://zm/stream", None) as stream:
+            return [frame async for frame in stream]
+
+    response.close.reset_mock()
+    with raises(requests.HTTPError):
+        asyncio.run(collect())
+    response.close.assert_called_once()
+
+
+def test_async_stream_frames_latest():
+    """Verifies that the async stream only yields the newest frames with latest."""
+
+    async def collect(url):
+        async with AsyncZoneMinder(url, None, None) as client:
+            monitor = (await client.get_monitors())[0]
+            async with monitor.stream_frames(latest=True, copy=True) as stream:
+                return [frame async for frame in stream], stream.stats
+
+    with FakeZoneMinder() as fake:
+        frames, stats = asyncio.run(collect(fake.url))
+    assert frames[-1] == fake_jpeg(9)
+    assert stats.frames_yielded + stats.frames_dropped == 10
+
+
+def test_async_stream_latest_drains_buffered_frames():
+    """Verifies that a slow consumer gets the newest frame, not the ones buffered."""
+
+    async def collect(url):
+        async with AsyncZoneMinder(url, None, None) as client:
+            monitor = (await client.get_monitors())[0]
+            async with AsyncMjpegStream(
+                client.session,
+                monitor.mjpeg_image_url,
+                aiohttp.ClientTimeout(total=5),
+                latest=True,
+                copy=True,
+                chunk_size=512,
+            ) as stream:
+                first = await stream.__anext__()
+                # Every other frame is received meanwhile
+                await asyncio.sleep(0.2)
+                return [first] + [frame async for frame in stream]
+
+    with FakeZoneMinder() as fake:
+        frames = asyncio.run(collect(fake.url))
+    assert frames[-1] == fake_jpeg(9)
+    assert len(frames) <= 2
@@ -0,0 +1,127 @@
+"""Tests to verify the poller module."""
+
+import asyncio
+import queue
+import time
+import unittest
+
+from zoneminder import zm
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.monitor import MonitorState
+from zoneminder.poller import (
+    AsyncPoller,
+    BasePoller,
+    Change,
+    Poller,
+    RateLimiter,
+    Source,
+)
+
+from tests.fake_zm import FakeZoneMinder
+
+
+def test_adaptive_intervals():
+    """Verifies that intervals shrink while alarming and grow while idle or down."""
+    client = zm.ZoneMinder("http://127.0.0.1:1", None, None)
+    poller = BasePoller(client, interval=10, alarm_interval=1, idle_interval=20, max_interval=60)
+    target = poller._targets[0]  # pylint: disable=protected-access
+    values = {"active_state": "default"}
+    changes = poller._complete(target, values, 0)  # pylint: disable=protected-access
+    assert [Change(Source.RUN_STATE, None, "active_state", None, "default")] == changes
+    assert 10 == target.interval
+
+    intervals = []
+    for _ in range(3):
+        assert [] == poller._complete(target, values, 0)  # pylint: disable=protected-access
+        intervals.append(target.interval)
+    assert [15, 20, 20] == intervals
+
+    poller._complete(target, {"recording": True}, 0)  # pylint: disable=protected-access
+    assert 1 == target.interval
+    for expected in (20, 40, 60, 60):
+        poller._complete(target, None, 0)  # pylint: disable=protected-access
+        assert expected == target.interval
+
+
+def test_rate_limiter():
+    """Verifies that requests beyond the burst are delayed to the rate."""
+    limiter = RateLimiter(10, burst=5)
+    assert 0 == limiter.reserve(5)
+    assert 0.45 < limiter.reserve(5) <= 0.5
+    assert 0 == RateLimiter(None).reserve(100)
+
+
+def test_rate_limiter_shared_per_client():
+    """Verifies that the pollers of a client share its rate limiter."""
+    client = zm.ZoneMinder("http://127.0.0.1:1", None, None)
+    first, second = BasePoller(client, max_rate=5), BasePoller(client, max_rate=50)
+    limiter = client.poll_limiter(5)
+    assert limiter is first._limiter is second._limiter  # pylint: disable=protected-access
+    assert 0 == limiter.reserve(5)
+    assert limiter.reserve(1) > 0.1
+
+
+class TestPoller(unittest.TestCase):
+    """Tests to verify the pollers against a fake server."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server."""
+        self.fake = FakeZoneMinder(monitor_count=3).__enter__()
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.fake.__exit__(None, None, None)
+
+    def test_threaded_changes(self):
+        """Verifies that only changes are reported, faster while alarming."""
+        changes = queue.Queue()
+        with zm.ZoneMinder(self.fake.url, None, None) as client:
+            poller = Poller(client, interval=0.1, alarm_interval=0.05, idle_interval=0.2)
+            poller.subscribe(changes.put, Source.MONITOR)
+            with poller:
+                initial = [changes.get(timeout=5) for _ in range(9)]
+                self.assertEqual({None}, {change.old for change in initial})
+                self.assertEqual({1, 2, 3}, {change.key for change in initial})
+
+                self.fake.alarm_status[2] = "3"
+                change = changes.get(timeout=5)
+                self.assertEqual(Change(Source.MONITOR, 2, "recording", False, True), change)
+                time.sleep(0.3)
+                intervals = poller.intervals()
+            self.assertTrue(changes.empty())
+            self.assertEqual(0.05, intervals[(Source.MONITOR, 2)])
+            self.assertLess(0.1, intervals[(Source.MONITOR, 1)])
+            self.assertEqual({"active_state": "default"}, poller.get(Source.RUN_STATE))
+
+    def test_polled_values_not_cached_as_snapshot(self):
+        """Verifies that polling leaves direct reads of a Monitor up to date."""
+        changes = queue.Queue()
+        with zm.ZoneMinder(self.fake.url, None, None) as client:
+            monitor = client.get_monitor(1)
+            poller = Poller(client, [monitor], run_states=False, server=False, interval=10)
+            poller.subscribe(changes.put)
+            with poller:
+                changes.get(timeout=5)
+                self.fake.alarm_status[1] = "3"
+                self.assertTrue(monitor.is_recording)
+
+    def test_async_changes(self):
+        """Verifies that the asyncio poller awaits coroutine callbacks."""
+        self.fake.monitors[1]["Monitor"]["Function"] = "Modect"
+
+        async def run():
+            changes = asyncio.Queue()
+            async with AsyncZoneMinder(self.fake.url, None, None) as client:
+                async with AsyncPoller(client, interval=0.1, max_rate=100) as poller:
+                    poller.subscribe(changes.put)
+                    seen = {}
+                    # Three fields of three monitors, the run state and the server
+                    while len(seen) < 11:
+                        change = await asyncio.wait_for(changes.get(), 5)
+                        seen[(change.source, change.key, change.field)] = change.new
+                    return seen
+
+        seen = asyncio.run(run())
+        self.assertTrue(seen[(Source.SERVER, None, "available")])
+        self.assertEqual("default", seen[(Source.RUN_STATE, None, "active_state")])
+        self.assertEqual(MonitorState.MODECT, seen[(Source.MONITOR, 1, "function")])
@@ -0,0 +1,146 @@
+"""Tests to verify the ptz module."""
+
+import asyncio
+import time
+import unittest
+
+from zoneminder import zm
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.exceptions import ControlTypeError, MonitorControlTypeError
+from zoneminder.monitor import ControlType
+from zoneminder.ptz import AsyncPtzDispatcher, BasePtzDispatcher, PtzDispatcher
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class TestPtzDispatcher(unittest.TestCase):
+    """Tests to verify PtzDispatcher."""
+
+    def setUp(self):
+        """Start a fake ZoneMinder server whose control requests are slow."""
+        self.fake = FakeZoneMinder(monitor_count=2)
+        self.fake.__enter__()
+        self.client = zm.ZoneMinder(self.fake.url, None, None)
+        self.monitors = self.client.get_monitors()
+        self.fake.latency = 0.2
+
+    def tearDown(self):
+        """Stop the fake ZoneMinder server."""
+        self.client.close()
+        self.fake.__exit__(None, None, None)
+
+    def test_moves_coalesced_per_monitor(self):
+        """Verifies that moves queued behind one in flight are coalesced or superseded."""
+        results = []
+        with PtzDispatcher(self.client, min_interval=0) as dispatcher:
+            dispatcher.subscribe(results.append)
+            first, second = self.monitors
+            dispatcher.move(first, "up")
+            dispatcher.move(second, "left")
+            # Once up is in flight
+            time.sleep(0.1)
+            for direction in ("down", "right", "right", "right"):
+                dispatcher.move(first, direction)
+            self.assertTrue(dispatcher.wait(5))
+            stats = dispatcher.stats()
+
+        self.assertEqual(
+            [(1, "moveConUp"), (1, "moveConRight")],
+            [control for control in self.fake.controls if control[0] == 1],
+        )
+        self.assertEqual([(2, "moveConLeft")], [c for c in self.fake.controls if c[0] == 2])
+        self.assertEqual((3, 0, 2, 1, 0), stats[:5])
+        self.assertLess(0.2, stats.mean_latency)
+        last = [result for result in results if result.monitor_id == 1][-1]
+        self.assertEqual((ControlType.RIGHT, True, 2), (last.control, last.ok, last.coalesced))
+
+    def test_min_interval_and_expiry(self):
+        """Verifies that a camera waits min_interval and stale moves are dropped."""
+        with PtzDispatcher(self.client, min_interval=10, max_age=0.2) as dispatcher:
+            dispatcher.move(self.monitors[0], "up")
+            self.assertTrue(dispatcher.wait(5))
+            dispatcher.move(self.monitors[0], "down")
+            self.assertTrue(dispatcher.wait(5))
+            stats = dispatcher.stats()
+        self.assertEqual([(1, "moveConUp")], self.fake.controls)
+        self.assertEqual((1, 1), (stats.sent, stats.expired))
+
+    def test_invalid_moves(self):
+        """Verifies that invalid moves raise right away."""
+        dispatcher = PtzDispatcher(self.client)
+        with self.assertRaises(ControlTypeError):
+            dispatcher.move(self.monitors[0], "sideways")
+        self.fake.monitors[1]["Monitor"]["Controllable"] = "0"
+        self.client.refresh_monitors()
+        with self.assertRaises(MonitorControlTypeError):
+            dispatcher.move(self.monitors[0], "up")
+        self.assertEqual(0, dispatcher.pending())
+        with self.assertRaises(TypeError):
+            BasePtzDispatcher(self.client)  # pylint: disable=abstract-class-instantiated
+
+
+class TestAsyncPtzDispatcher(unittest.TestCase):
+    """Tests to verify AsyncPtzDispatcher."""
+
+    def test_moves_coalesced(self):
+        """Verifies that moves are sent from a task and coalesced."""
+
+        async def run(fake):
+            async with AsyncZoneMinder(fake.url, None, None) as client:
+                monitor = (await client.get_monitors())[0]
+                fake.latency = 0.05
+                async with AsyncPtzDispatcher(client, min_interval=0) as dispatcher:
+                    dispatcher.move(monitor, "up")
+                    await asyncio.sleep(0.02)
+                    for direction in ("left", "up-left", "up-left"):
+                        dispatcher.move(monitor, direction)
+                    await dispatcher.wait()
+                    return dispatcher.stats()
+
+        with FakeZoneMinder(monitor_count=1) as fake:
+            stats = asyncio.run(run(fake))
+        self.assertEqual([(1, "moveConUp"), (1, "moveConUpLeft")], fake.controls)
+        self.assertEqual((2, 0, 1, 1, 0), stats[:5])
+
+    def test_wait_for_expired_moves(self):
+        """Verifies that wait returns once the moves waiting for a camera expired."""
+
+        async def run(fake):
+            async with AsyncZoneMinder(fake.url, None, None) as client:
+                monitor = (await client.get_monitors())[0]
+                async with AsyncPtzDispatcher(client, min_interval=10, max_age=0.2) as dispatcher:
+                    dispatcher.move(monitor, "up")
+                    await asyncio.wait_for(dispatcher.wait(), 5)
+                    dispatcher.move(monitor, "down")
+                    await asyncio.wait_for(dispatcher.wait(), 5)
+                    return dispatcher.stats()
+
+        with FakeZoneMinder(monitor_count=1) as fake:
+            stats = asyncio.run(run(fake))
+        self.assertEqual([(1, "moveConUp")], fake.controls)
+        self.assertEqual((1, 1), (stats.sent, stats.expired))
+
+    def test_restart_after_stop_in_flight(self):
+        """Verifies that a move cancelled by stop does not block the moves after a restart."""
+
+        async def run(fake):
+            async with AsyncZoneMinder(fake.url, None, None) as client:
+                monitor = (await client.get_monitors())[0]
+                fake.latency = 0.3
+                dispatcher = AsyncPtzDispatcher(client, min_interval=0)
+                await dispatcher.start()
+                dispatcher.move(monitor, "up")
+                await asyncio.sleep(0.05)
+                await dispatcher.stop()
+                self.assertEqual(0, dispatcher.pending())
+
+                fake.latency = 0
+                async with dispatcher:
+                    dispatcher.move(monitor, "down")
+                    await asyncio.wait_for(dispatcher.wait(), 5)
+                    return dispatcher.stats()
+
+        with FakeZoneMinder(monitor_count=1) as fake:
+            stats = asyncio.run(run(fake))
+        self.assertIn((1, "moveConDown"), fake.controls)
+        self.assertEqual((2, 1), (stats.sent, stats.failed))
@@ -0,0 +1,179 @@
+"""Tests to verify the resilience module."""
+
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from zoneminder import zm
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.resilience import (
+    Backoff,
+    CircuitBreaker,
+    CircuitState,
+    FailureKind,
+    classify_status,
+)
+
+from tests.fake_zm import FakeZoneMinder
+
+
+class TestFailures(unittest.TestCase):
+    """Tests to verify the classification and backoff of failures."""
+
+    def test_classify_status(self):
+        """Verifies that statuses map to the failure kinds."""
+        self.assertEqual(
+            [None, FailureKind.AUTH, FailureKind.AUTH, FailureKind.NOT_FOUND],
+            [classify_status(status) for status in (200, 401, 403, 404)],
+        )
+        self.assertEqual(FailureKind.CLIENT, classify_status(400))
+        self.assertEqual(FailureKind.SERVER, classify_status(503))
+        self.assertEqual(FailureKind.CONNECTION, classify_status(None))
+
+    def test_backoff(self):
+        """Verifies that delays grow exponentially, jittered and capped."""
+        backoff = Backoff(base=1, factor=2, max_delay=5)
+        for retry, cap in ((0, 1), (1, 2), (2, 4), (5, 5)):
+            delays = [backoff.delay(retry) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= cap for delay in delays))
+            self.assertGreater(max(delays), cap / 2)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests to verify CircuitBreaker."""
+
+    def test_opens_and_recovers(self):
+        """Verifies that the circuit opens, fails fast, then probes half open."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(CircuitState.OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.1)
+        self.assertEqual(CircuitState.HALF_OPEN, breaker.state)
+        self.assertTrue(breaker.allow())
+        # A single probe at a time
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        # A request telling nothing lets another probe through
+        breaker.release()
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(CircuitState.CLOSED, breaker.state)
+        self.assertTrue(breaker.allow())
+
+
+class TestClientRetries(unittest.TestCase):
+    """Tests to verify how the clients retry failed requests."""
+
+    def test_not_found_and_server_errors(self):
+        """Verifies that only auth failures log in again and server errors are retried."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(
+            fake.url, "admin", "secret", backoff=Backoff(base=0.01)
+        ) as client:
+            fake.require_token = True
+            client.login()
+            fake.failures["/zm/api/states.json"] = 500
+            self.assertEqual({"success": False}, client.get_state("api/host/nothing.json"))
+            self.assertEqual({"success": False}, client.get_state("api/states.json"))
+            fake.expire_tokens()
+            self.assertTrue(client.get_state("api/host/daemonCheck.json")["result"])
+            errors = {stats.endpoint: stats.errors for stats in client.metrics.snapshot().endpoints}
+        self.assertEqual(["password", "refresh"], fake.logins)
+        self.assertEqual(1, fake.paths().count("/zm/api/host/nothing.json"))
+        self.assertEqual(3, fake.paths().count("/zm/api/states.json"))
+        self.assertEqual(2, fake.paths().count("/zm/api/host/daemonCheck.json"))
+        self.assertEqual(
+            {"api/host/nothing.json": 1, "api/states.json": 1, "api/host/daemonCheck.json": 0},
+            errors,
+        )
+
+    def test_circuit_opens_when_server_down(self):
+        """Verifies that requests fail fast once the server is known down."""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        client = zm.ZoneMinder(
+            "http://127.0.0.1:1", None, None, circuit_breaker=breaker, backoff=Backoff(base=0)
+        )
+        with mock.patch.object(
+            client.session, "request", wraps=client.session.request
+        ) as request, client:
+            self.assertEqual({}, client.get_state("api/states.json"))
+            self.assertEqual(3, request.call_count)
+            self.assertEqual(CircuitState.OPEN, client.circuit_breaker.state)
+            self.assertFalse(client.is_available)
+            self.assertEqual([], client.get_monitors())
+            self.assertEqual(3, request.call_count)
+            errors = [stats.errors for stats in client.metrics.snapshot().endpoints]
+        self.assertEqual([1, 1, 1], errors)
+
+    def test_state_change_not_retried(self):
+        """Verifies that a run state change is sent once and its timeout keeps the circuit closed."""
+        breaker = CircuitBreaker(failure_threshold=1)
+        with FakeZoneMinder() as fake, zm.ZoneMinder(
+            fake.url, None, None, circuit_breaker=breaker, backoff=Backoff(base=0)
+        ) as client:
+            fake.failures["/zm/api/states/change/away.json"] = 503
+            self.assertEqual({"success": False}, client.set_active_state("away"))
+            self.assertEqual(1, fake.paths().count("/zm/api/states/change/away.json"))
+            breaker.reset()
+
+            with mock.patch.object(
+                client.session, "request", side_effect=requests.exceptions.ReadTimeout
+            ) as request:
+                self.assertEqual({}, client.set_active_state("home"))
+            self.assertEqual(1, request.call_count)
+            self.assertEqual(CircuitState.CLOSED, breaker.state)
+
+    def test_cancelled_requests_keep_circuit_closed(self):
+        """Verifies that cancelled or interrupted requests are not server failures."""
+
+        async def run(fake, breaker):
+            async with AsyncZoneMinder(fake.url, None, None, circuit_breaker=breaker) as client:
+                for _ in range(3):
+                    with self.assertRaises(asyncio.TimeoutError):
+                        await asyncio.wait_for(client.get_state("api/states.json"), 0.05)
+                fake.latency = 0
+                return await client.get_state("api/host/daemonCheck.json")
+
+        breaker = CircuitBreaker(failure_threshold=1)
+        with FakeZoneMinder() as fake:
+            fake.latency = 0.3
+            self.assertTrue(asyncio.run(run(fake, breaker))["result"])
+        self.assertEqual(CircuitState.CLOSED, breaker.state)
+
+        client = zm.ZoneMinder("http://127.0.0.1:1", None, None, circuit_breaker=breaker)
+        with mock.patch.object(
+            client.session, "request", side_effect=KeyboardInterrupt
+        ), self.assertRaises(KeyboardInterrupt):
+            client.get_state("api/states.json")
+        self.assertEqual(CircuitState.CLOSED, breaker.state)
+
+    def test_async_retries(self):
+        """Verifies that the asyncio client retries the same failures."""
+
+        async def run(fake):
+            async with AsyncZoneMinder(fake.url, None, None, backoff=Backoff(base=0.01)) as client:
+                fake.failures["/zm/api/states.json"] = 502
+                await client.get_state("api/host/nothing.json")
+                await client.get_state("api/states.json")
+                fake.failures["/zm/api/states/change/away.json"] = 502
+                await client.set_active_state("away")
+                return client.circuit_breaker.state
+
+        with FakeZoneMinder() as fake:
+            self.assertEqual(CircuitState.CLOSED, asyncio.run(run(fake)))
+        self.assertEqual(
+            ["/zm/api/host/nothing.json"]
+            + ["/zm/api/states.json"] * 3
+            + ["/zm/api/states/change/away.json"],
+            fake.paths(),
+        )
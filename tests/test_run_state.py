@@ -0,0 +1,133 @@
+"""Tests to verify the run state change jobs."""
+
+import asyncio
+import time
+import unittest
+
+from zoneminder import zm
+from zoneminder.aio import AsyncZoneMinder
+from zoneminder.monitor import MonitorState
+from zoneminder.run_state import StateChangeJob, parse_definition
+
+from tests.fake_zm import FakeZoneMinder
+
+
+def slow_fake(monitor_count=3) -> FakeZoneMinder:
+    """Build a fake server whose "away" state restarts every camera in turn."""
+    fake = FakeZoneMinder(monitor_count=monitor_count)
+    fake.state_definitions["away"] = ",".join(f"{i}:Record:1" for i in range(1, monitor_count + 1))
+    fake.state_definitions["home"] = "1:None:1,2:Monitor:0"
+    fake.camera_restart_time = 0.15
+    return fake
+
+
+class TestParseDefinition(unittest.TestCase):
+    """Tests to verify parse_definition."""
+
+    def test_parse_definition(self):
+        """Verifies that Definitions decode, skipping malformed entries."""
+        self.assertEqual(
+            {
+                1: (MonitorState.MODECT, True),
+                2: (MonitorState.NONE, False),
+                4: (MonitorState.RECORD, True),
+            },
+            parse_definition("1:Modect:1, 2:None:0,3:Bogus:1,x:Modect:1,,4:Record"),
+        )
+        self.assertEqual({}, parse_definition(None))
+
+
+class TestStateChangeJob(unittest.TestCase):
+    """Tests to verify StateChangeJob."""
+
+    def test_set_active_state_without_waiting(self):
+        """Verifies that the job returns at once and reports each monitor converging."""
+        with slow_fake() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            started = time.monotonic()
+            job = client.set_active_state("away", wait=False, poll_interval=0.05)
+            self.assertLess(time.monotonic() - started, 0.1)
+            self.assertIsInstance(job, StateChangeJob)
+            self.assertFalse(job.done())
+            self.assertFalse(job.wait(0.05))
+            self.assertTrue(job.wait(5))
+
+            self.assertEqual({"result": "Ok"}, job.result)
+            self.assertTrue(job.converged)
+            times = job.completion_times()
+            self.assertEqual([1, 2, 3], sorted(times))
+            self.assertLess(times[1], times[3])
+            self.assertGreater(times[3], 0.3)
+            self.assertEqual(
+                [(i, MonitorState.RECORD, True) for i in (1, 2, 3)],
+                [progress[:3] for progress in job.progress()],
+            )
+            self.assertEqual(2, fake.active_state)
+
+    def test_daemon_not_needed(self):
+        """Verifies that monitors set to None or disabled converge without capturing."""
+        with slow_fake() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            for monitor_id in (1, 2):
+                fake.monitors[monitor_id]["Monitor_Status"]["CaptureFPS"] = "0.00"
+            job = client.set_active_state("home", wait=False, poll_interval=0.05)
+            self.assertTrue(job.wait(5))
+            self.assertTrue(all(progress.converged for progress in job.progress()))
+
+    def test_cancel(self):
+        """Verifies that cancelling releases the waiters before the change completes."""
+        with slow_fake() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            fake.camera_restart_time = 0.5
+            job = client.set_active_state("away", wait=False, poll_interval=0.05)
+            time.sleep(0.1)
+            job.cancel()
+            self.assertTrue(job.wait(0.1))
+            self.assertTrue(job.cancelled)
+            self.assertIsNone(job.result)
+            self.assertFalse(job.converged)
+
+    def test_unknown_state(self):
+        """Verifies that a state without a Definition is only waited for."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            job = client.set_active_state("default", wait=False, poll_interval=0.05)
+            self.assertTrue(job.wait(5))
+            self.assertEqual([], job.progress())
+            self.assertEqual({"result": "Ok"}, job.result)
+
+
+class TestAsyncStateChangeJob(unittest.TestCase):
+    """Tests to verify AsyncStateChangeJob."""
+
+    def test_await_job(self):
+        """Verifies that the job runs in the background of the event loop."""
+
+        async def change(client):
+            job = await client.set_active_state("away", wait=False, poll_interval=0.05)
+            self.assertFalse(await job.wait(0.05))
+            await job
+            return job
+
+        async def runner(fake):
+            async with AsyncZoneMinder(fake.url, None, None) as client:
+                return await change(client)
+
+        with slow_fake() as fake:
+            job = asyncio.run(runner(fake))
+        self.assertTrue(job.done())
+        self.assertEqual({"result": "Ok"}, job.result)
+        self.assertEqual([1, 2, 3], sorted(job.completion_times()))
+
+    def test_cancel(self):
+        """Verifies that cancelling stops the job and its request."""
+
+        async def runner(fake):
+            async with AsyncZoneMinder(fake.url, None, None) as client:
+                job = await client.set_active_state("away", wait=False, poll_interval=0.05)
+                await asyncio.sleep(0.1)
+                job.cancel()
+                self.assertTrue(await job.wait(1))
+                return job
+
+        with slow_fake() as fake:
+            fake.camera_restart_time = 0.5
+            job = asyncio.run(runner(fake))
+        self.assertTrue(job.cancelled)
+        self.assertIsNone(job.result)
@@ -0,0 +1,85 @@
+"""Tests to verify the shm module."""
+
+import os
+import tempfile
+import time
+import unittest
+
+from zoneminder import zm
+from zoneminder.shm import LAYOUT_1_36, ShmBackend
+
+from tests.fake_zm import FakeZoneMinder
+
+
+def write_shared_data(directory, monitor_id, restart=False, **values):
+    """Update the synthetic mmap file of a monitor in place, as zmc would.
+
+    With restart, the file is replaced by a new one like a restarted zmc does.
+    """
+    values.setdefault("valid", 1)
+    values.setdefault("capture_fps", 10.0)
+    values.setdefault("zmc_heartbeat_time", int(time.time()))
+    path = os.path.join(directory, f"zm.mmap.{monitor_id}")
+    if restart and os.path.exists(path):
+        os.unlink(path)
+    with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+        # The SharedData struct is followed by the image buffers
+        file.write(LAYOUT_1_36.pack(**values) + bytes(4096))
+
+
+def test_layout_offsets():
+    """Verifies the size and field offsets of the 1.36 SharedData header."""
+    assert 120 == LAYOUT_1_36.format.size
+    buffer = bytearray(LAYOUT_1_36.pack(state=3, last_event=1234, zmc_heartbeat_time=99))
+    assert 760 == len(buffer)
+    assert 3 == int.from_bytes(buffer[12:16], "little")
+    assert 1234 == int.from_bytes(buffer[32:40], "little")
+    assert 99 == int.from_bytes(buffer[96:104], "little")
+
+
+class TestShmBackend(unittest.TestCase):
+    """Tests to verify reading monitor state from synthetic mmap files."""
+
+    def setUp(self):
+        """Create a directory for the mmap files."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = ShmBackend(self.directory.name)
+
+    def tearDown(self):
+        """Unmap and remove the mmap files."""
+        self.backend.close()
+        self.directory.cleanup()
+
+    def test_read_state(self):
+        """Verifies the live state, following a restarted zmc."""
+        write_shared_data(self.directory.name, 1, state=3, last_event=42, signal=1)
+        state = self.backend.read(1)
+        self.assertEqual((3, True, 42, 10.0), state[:4])
+        self.assertTrue(self.backend.is_recording(1))
+        self.assertTrue(self.backend.is_available(1))
+
+        write_shared_data(self.directory.name, 1, state=3, zmc_heartbeat_time=0)
+        self.assertFalse(self.backend.is_available(1))
+        self.assertIsNone(self.backend.is_recording(1))
+        write_shared_data(self.directory.name, 1, restart=True, state=1)
+        self.assertFalse(self.backend.is_recording(1))
+        self.assertTrue(self.backend.is_available(1))
+
+        self.assertIsNone(self.backend.read(2))
+        write_shared_data(self.directory.name, 2, capture_fps=0.0)
+        self.assertFalse(self.backend.is_available(2))
+
+    def test_monitor_fallback(self):
+        """Verifies that monitors read shared memory first, then the API."""
+        write_shared_data(self.directory.name, 1, state=3, last_event=42)
+        with FakeZoneMinder(monitor_count=2) as fake:
+            with zm.ZoneMinder(fake.url, None, None, shm_backend=self.backend) as client:
+                monitors = client.get_monitors()
+                fake.requests.clear()
+                self.assertTrue(monitors[0].is_recording)
+                self.assertTrue(monitors[0].is_available)
+                self.assertEqual(42, monitors[0].shm_state.last_event)
+                self.assertEqual([], fake.requests)
+                self.assertFalse(monitors[1].is_recording)
+                self.assertIsNone(monitors[1].shm_state)
+                self.assertEqual(1, len(fake.requests))
@@ -0,0 +1,99 @@
+"""Tests to verify still image snapshots and their cache."""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from zoneminder import zm
+from zoneminder.singleflight import SingleFlight
+from zoneminder.snapshot import FrameCache
+
+from tests.fake_zm import FakeZoneMinder, fake_jpeg
+
+
+class TestFrameCache(unittest.TestCase):
+    """Tests to verify the FrameCache class."""
+
+    def test_evicts_least_recently_used(self):
+        """Verifies that the byte limit evicts the least recently used images."""
+        cache = FrameCache(max_bytes=25, ttl=60)
+        cache.put(1, b"a" * 10)
+        cache.put(2, b"b" * 10)
+        cache.get(1)
+        cache.put(3, b"c" * 10)
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(b"a" * 10, cache.get(1))
+        self.assertEqual(20, cache.size)
+
+    def test_skips_images_over_the_limit(self):
+        """Verifies that an image larger than the cache is not stored."""
+        cache = FrameCache(max_bytes=5, ttl=60)
+        cache.put(1, b"a" * 10)
+        self.assertEqual(0, len(cache))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Tests to verify the SingleFlight class."""
+
+    def test_waiters_share_error(self):
+        """Verifies that an error is raised to every caller sharing the call."""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError("boom")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, "key", fail)
+            started.wait()
+            follower = executor.submit(flight.do, "key", fail)
+            while flight.shared == 0:
+                pass
+            release.set()
+            for future in (leader, follower):
+                self.assertRaises(ValueError, future.result)
+
+
+class TestSnapshots(unittest.TestCase):
+    """Tests to verify that snapshots are cached and coalesced."""
+
+    def test_concurrent_snapshots_share_one_fetch(self):
+        """Verifies that concurrent requests for a Monitor share one fetch."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            monitor = client.get_monitors()[0]
+            fake.latency = 0.2
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                frames = list(executor.map(lambda _: monitor.get_snapshot(), range(8)))
+            self.assertEqual([fake_jpeg(1)] * 8, frames)
+        self.assertEqual(1, fake.paths().count("/zm/cgi-bin/nph-zms"))
+
+    def test_get_snapshots(self):
+        """Verifies the bulk fetch and that fresh images are served from cache."""
+        with FakeZoneMinder(monitor_count=4) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            monitors = client.get_monitors()
+            frames = client.get_snapshots(monitors, max_workers=2)
+            self.assertEqual({i: fake_jpeg(i) for i in range(1, 5)}, frames)
+            self.assertEqual(frames, client.get_snapshots(monitors))
+            self.assertEqual(fake_jpeg(1), monitors[0].get_snapshot(max_age=0))
+        self.assertEqual(5, fake.paths().count("/zm/cgi-bin/nph-zms"))
+
+    def test_get_snapshots_with_a_timeout(self):
+        """Verifies that a Monitor timing out gets None without failing the others."""
+        with FakeZoneMinder(monitor_count=2) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            monitors = client.get_monitors()
+            get = client.session.get
+
+            def time_out_monitor_2(url, **kwargs):
+                if "monitor=2" in url:
+                    raise requests.exceptions.ReadTimeout
+                return get(url, **kwargs)
+
+            with mock.patch.object(client.session, "get", side_effect=time_out_monitor_2):
+                frames = client.get_snapshots(monitors)
+        self.assertEqual({1: fake_jpeg(1), 2: None}, frames)
@@ -0,0 +1,145 @@
+"""Tests to verify the thumbnails module."""
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import io
+import threading
+import time
+import unittest
+
+from zoneminder import thumbnails
+from zoneminder.thumbnails import ThumbnailPipeline
+
+from tests.fake_zm import fake_jpeg
+
+
+def shrink(frame, size, quality):
+    """Stand in for a resize, keeping one byte in four of the frame."""
+    return bytes(frame)[::4], size[0], size[1]
+
+
+def slow_shrink(frame, size, quality):
+    """Shrink a frame, slowly."""
+    time.sleep(0.2)
+    return shrink(frame, size, quality)
+
+
+def fail(frame, size, quality):
+    """Fail to resize a frame."""
+    raise ValueError("not a JPEG")
+
+
+class DoneExecutor:
+    """Stand in for a process pool whose work is done before submit returns."""
+
+    def __init__(self, error=None):
+        """Create an executor, raising error from submit if given."""
+        self.error = error
+
+    def submit(self, function, name, length, frame, resize, size, quality) -> Future:
+        """Resize a frame in this thread, returning a done future."""
+        if self.error is not None:
+            raise self.error
+        future = Future()
+        future.set_result((length, size[0], size[1], b"thumbnail", 0.0))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Do nothing, no work is left."""
+
+
+class TestThumbnailPipeline(unittest.TestCase):
+    """Tests to verify ThumbnailPipeline with worker processes."""
+
+    def test_thumbnails(self):
+        """Verifies that frames of many monitors go through shared memory and back."""
+        frames = {i: fake_jpeg(i, 4000) for i in range(1, 5)}
+        with ThumbnailPipeline((64, 36), max_workers=2, block_size=8192, resize=shrink) as pipe:
+            seen = []
+            pipe.subscribe(seen.append)
+            self.assertEqual(0, pipe.submit_all(frames))
+            # Too large for a block, sent to the worker as is
+            pipe.submit(5, memoryview(fake_jpeg(5, 20000)))
+            while pipe.pending():
+                time.sleep(0.01)
+            stats = pipe.stats()
+
+        self.assertEqual([1, 2, 3, 4, 5], sorted(thumbnail.monitor_id for thumbnail in seen))
+        for monitor_id, frame in frames.items():
+            thumbnail = pipe.get(monitor_id)
+            self.assertEqual(frame[::4], thumbnail.data)
+            self.assertEqual((64, 36), (thumbnail.width, thumbnail.height))
+            self.assertGreaterEqual(thumbnail.total, thumbnail.queued + thumbnail.process)
+        self.assertEqual(fake_jpeg(5, 20000)[::4], pipe.get(5).data)
+        self.assertEqual((5, 5, 0, 0, 1), stats[:5])
+        self.assertGreater(stats.mean_process_time, 0)
+
+    def test_slow_consumer_drops_frames(self):
+        """Verifies that a monitor keeps one frame waiting, the newest."""
+        with ThumbnailPipeline(max_workers=1, block_size=8192, resize=slow_shrink) as pipe:
+            results = [pipe.submit(1, fake_jpeg(i, 100)) for i in range(5)]
+            self.assertEqual([True, True, False, False, False], results)
+            self.assertEqual(1, pipe.pending())
+            while pipe.pending():
+                time.sleep(0.01)
+            stats = pipe.stats()
+        self.assertEqual((5, 2, 3), stats[:3])
+        self.assertEqual(fake_jpeg(4, 100)[::4], pipe.get(1).data)
+
+    def test_failures(self):
+        """Verifies that a frame failing to resize is counted and the block reused."""
+        with ThumbnailPipeline(max_workers=1, max_in_flight=1, resize=fail) as pipe:
+            for monitor_id in (1, 2):
+                pipe.submit(monitor_id, b"garbage")
+            while pipe.pending():
+                time.sleep(0.01)
+            self.assertEqual(2, pipe.stats().failed)
+            self.assertIsNone(pipe.get(1))
+        with self.assertRaises(RuntimeError):
+            pipe.submit(1, b"closed")
+
+    @unittest.skipIf(thumbnails.Image is None, "Pillow is not installed")
+    def test_pillow_resize(self):
+        """Verifies that JPEG frames are resized with Pillow."""
+        image = thumbnails.Image.new("RGB", (1280, 720), (200, 10, 10))
+        frame = io.BytesIO()
+        image.save(frame, "JPEG")
+        with ThumbnailPipeline((320, 320), max_workers=1) as pipe:
+            pipe.submit(1, frame.getvalue())
+            while pipe.pending():
+                time.sleep(0.01)
+        thumbnail = pipe.get(1)
+        self.assertEqual((320, 180), (thumbnail.width, thumbnail.height))
+        self.assertEqual(b"\xff\xd8", thumbnail.data[:2])
+
+    def with_executor(self, executor) -> ThumbnailPipeline:
+        """Build a pipeline handing its frames to executor."""
+        pipe = ThumbnailPipeline(max_workers=1, max_in_flight=1, block_size=1024, resize=shrink)
+        pipe._executor.shutdown()
+        pipe._executor = executor
+        self.addCleanup(pipe.close)
+        return pipe
+
+    def test_work_done_on_submit(self):
+        """Verifies that a frame processed before its callback is attached does not deadlock."""
+        pipe = self.with_executor(DoneExecutor())
+        thread = threading.Thread(target=pipe.submit_all, args=({1: b"a", 2: b"b"},), daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(0, pipe.pending())
+        self.assertEqual(2, pipe.stats().processed)
+        self.assertEqual(b"thumbnail", pipe.get(2).data)
+
+    def test_broken_pool(self):
+        """Verifies that a frame the pool refuses frees its block and its monitor."""
+        executor = DoneExecutor(BrokenProcessPool("a worker died"))
+        pipe = self.with_executor(executor)
+        pipe.submit(1, b"a")
+        self.assertEqual(0, pipe.pending())
+        self.assertEqual(1, pipe.stats().failed)
+
+        executor.error = None
+        pipe.submit(1, b"b")
+        self.assertEqual(0, pipe.pending())
+        self.assertEqual(1, pipe.stats().processed)
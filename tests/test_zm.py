@@ -1,8 +1,19 @@
 """Tests to verify the zm module."""
 
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import time
 import unittest
+from unittest import mock
+
+import requests
 
 from zoneminder import zm
+from zoneminder.cache import StateKind
+from zoneminder.monitor import MonitorState, TimePeriod
+from zoneminder.resilience import Backoff
+
+from tests.fake_zm import FakeZoneMinder
 
 
 class TestZoneMinder(unittest.TestCase):
@@ -82,3 +93,369 @@ class TestZoneMinder(unittest.TestCase):
             "/cgi-bin/npm-zms&user=%40dmin&pass=p%40ssword",
             client.get_url_with_auth(client.get_zms_url()),
         )
+
+
+class TestZoneMinderSession(unittest.TestCase):
+    """Tests to verify the pooled session of the ZoneMinder class."""
+
+    def test_requests_reuse_one_connection(self):
+        """Verifies that consecutive API calls share a kept-alive connection."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, "admin", "secret") as client:
+            self.assertTrue(client.login())
+            monitors = client.get_monitors()
+            self.assertTrue(client.is_available)
+            client.move_monitor(monitors[0], "right")
+        self.assertEqual(1, len(fake.client_ports))
+        self.assertEqual(["/zm/api/host/login.json", "/zm/index.php"], fake.paths("POST"))
+
+    def test_keep_alive_disabled(self):
+        """Verifies that every call opens a new connection without keep-alive."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(
+            fake.url, None, None, keep_alive=False
+        ) as client:
+            client.get_monitors()
+            client.get_monitors()
+        self.assertEqual(2, len(fake.client_ports))
+
+    def test_verify_ssl_set_on_session(self):
+        """Verifies that verify_ssl is carried on the session."""
+        client = zm.ZoneMinder("https://zoneminder.com", None, None, verify_ssl=False)
+        self.assertFalse(client.session.verify)
+
+        # A shared session keeps its own setting, such as a CA bundle
+        session = requests.Session()
+        session.verify = "/etc/ssl/zoneminder.pem"
+        zm.ZoneMinder("https://zoneminder.com", None, None, verify_ssl=False, session=session)
+        zm.ZoneMinder("https://zoneminder.com", None, None, session=session)
+        self.assertEqual("/etc/ssl/zoneminder.pem", session.verify)
+
+    def test_close_leaves_shared_session_open(self):
+        """Verifies that a session passed in is not closed by the client."""
+        session = requests.Session()
+        with FakeZoneMinder() as fake:
+            with zm.ZoneMinder(fake.url, None, None, session=session) as client:
+                self.assertIs(session, client.session)
+            self.assertTrue(session.get(f"{fake.url}/zm/api/host/daemonCheck.json").ok)
+        session.close()
+
+
+class TestZoneMinderRefreshAll(unittest.TestCase):
+    """Tests to verify ZoneMinder.refresh_all."""
+
+    def test_refresh_all_serves_properties_from_snapshot(self):
+        """Verifies that a refresh costs 1 + 2N requests and property reads none."""
+        with FakeZoneMinder(monitor_count=5) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            fake.alarm_status[2] = "3"
+            result = client.refresh_all(max_workers=3)
+            self.assertEqual(11, result.requests)
+            self.assertEqual(11, len(fake.requests))
+            self.assertEqual(
+                [False, True, False, False, False], [m.is_recording for m in result.monitors]
+            )
+            self.assertTrue(all(m.is_available for m in result.monitors))
+            self.assertEqual(MonitorState.MODECT, result.monitors[0].function)
+            self.assertEqual(11, len(fake.requests))
+
+    def test_refresh_all_updates_monitors_in_place(self):
+        """Verifies that given Monitors are updated rather than replaced."""
+        with FakeZoneMinder(monitor_count=2) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            monitors = client.get_monitors()
+            del fake.monitors[2]
+            fake.monitors[1]["Monitor"]["Function"] = "Record"
+            result = client.refresh_all(monitors)
+            self.assertEqual([monitors[0]], result.monitors)
+            self.assertEqual(MonitorState.RECORD, monitors[0].function)
+
+    def test_refresh_all_keeps_monitors_on_failure(self):
+        """Verifies that Monitors are kept when monitors.json fails, and requests counted."""
+        with FakeZoneMinder(monitor_count=2) as fake, zm.ZoneMinder(
+            fake.url, None, None, backoff=Backoff(base=0)
+        ) as client:
+            monitors = client.get_monitors()
+            fake.requests.clear()
+            fake.failures["/zm/api/monitors.json"] = 503
+            for given in (monitors, None):
+                result = client.refresh_all(given)
+                self.assertEqual(monitors, result.monitors)
+                # The request and its retries
+                self.assertEqual(3, result.requests)
+                client.circuit_breaker.reset()
+            self.assertEqual(6, len(fake.requests))
+
+    def test_failed_reads_not_snapshotted(self):
+        """Verifies that statuses that failed to be read are read again, not cached."""
+        with FakeZoneMinder(monitor_count=2) as fake, zm.ZoneMinder(
+            fake.url, None, None, backoff=Backoff(base=0)
+        ) as client:
+            fake.failures["/zm/api/monitors/alarm/id:1/command:status.json"] = 503
+            fake.failures["/zm/api/monitors/daemonStatus/id:1/daemon:zmc.json"] = 503
+            monitor = client.refresh_all().monitors[0]
+            self.assertIsNone(monitor.cached(StateKind.ALARM))
+            self.assertIsNone(monitor.cached(StateKind.DAEMON))
+
+            fake.failures.clear()
+            client.circuit_breaker.reset()
+            fake.alarm_status[1] = "3"
+            fake.requests.clear()
+            self.assertTrue(monitor.is_recording)
+            self.assertTrue(monitor.is_available)
+            self.assertEqual(2, len(fake.requests))
+
+    def test_snapshot_expires(self):
+        """Verifies that properties go back to the server once the snapshot expired."""
+        with FakeZoneMinder(monitor_count=1) as fake:
+            with zm.ZoneMinder(fake.url, None, None, snapshot_ttl=0) as client:
+                monitor = client.refresh_all().monitors[0]
+                self.assertFalse(monitor.cached(StateKind.ALARM).value)
+                self.assertFalse(monitor.is_recording)
+            self.assertEqual(4, len(fake.requests))
+
+
+class TestMonitorStateCache(unittest.TestCase):
+    """Tests to verify that Monitor properties use the state cache."""
+
+    def test_cache_disabled_by_default(self):
+        """Verifies that every property read hits the server without cache_ttl."""
+        with FakeZoneMinder(monitor_count=1) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            monitor = client.get_monitors()[0]
+            for _ in range(2):
+                self.assertEqual(MonitorState.MODECT, monitor.function)
+                self.assertFalse(monitor.is_recording)
+            self.assertEqual(5, len(fake.requests))
+
+    def test_cached_reads_and_invalidation(self):
+        """Verifies that cached reads are reused until the setter invalidates them."""
+        ttl = {StateKind.CONFIG: 60, StateKind.FUNCTION: 60, StateKind.ALARM: 60}
+        with FakeZoneMinder(monitor_count=1) as fake:
+            with zm.ZoneMinder(fake.url, None, None, cache_ttl=ttl) as client:
+                monitor = client.get_monitors()[0]
+                self.assertIsNone(monitor.cached(StateKind.FUNCTION))
+                for _ in range(3):
+                    self.assertEqual(MonitorState.MODECT, monitor.function)
+                    self.assertFalse(monitor.is_recording)
+                self.assertEqual(3, len(fake.requests))
+
+                monitor.function = MonitorState.RECORD
+                self.assertEqual(MonitorState.MODECT, monitor.cached(StateKind.FUNCTION).value)
+                self.assertEqual(MonitorState.RECORD, monitor.function)
+                self.assertFalse(monitor.is_recording)
+            self.assertEqual(5, len(fake.requests))
+
+
+class TestZoneMinderSetFunctions(unittest.TestCase):
+    """Tests to verify the batched function changes of ZoneMinder.set_functions."""
+
+    def test_set_functions(self):
+        """Verifies that changes are skipped, sent or failed per monitor."""
+        ttl = {StateKind.CONFIG: 60, StateKind.FUNCTION: 60}
+        with FakeZoneMinder(monitor_count=4) as fake:
+            with zm.ZoneMinder(fake.url, None, None, cache_ttl=ttl) as client:
+                monitors = client.get_monitors()
+                fake.monitors[2]["Monitor"]["Function"] = "Record"
+                fake.failures["/zm/api/monitors/3.json"] = 500
+                del fake.monitors[4]
+                fake.requests.clear()
+
+                results = client.set_functions(
+                    {monitor: MonitorState.RECORD for monitor in monitors}
+                )
+
+                self.assertEqual(
+                    {
+                        1: zm.ChangeStatus.OK,
+                        2: zm.ChangeStatus.SKIPPED,
+                        3: zm.ChangeStatus.FAILED,
+                        4: zm.ChangeStatus.FAILED,
+                    },
+                    {monitor_id: result.status for monitor_id, result in results.items()},
+                )
+                self.assertGreater(results[1].latency, 0)
+                self.assertEqual(0, results[2].latency)
+                self.assertEqual(["/zm/api/monitors.json"], fake.paths("GET"))
+                self.assertEqual(
+                    ["/zm/api/monitors/1.json", "/zm/api/monitors/3.json"],
+                    sorted(fake.paths("POST")),
+                )
+                self.assertEqual("Record", fake.monitors[1]["Monitor"]["Function"])
+
+                # Updated in place, no request needed to read the new functions
+                self.assertEqual(MonitorState.RECORD, monitors[0].function)
+                self.assertEqual(MonitorState.RECORD, monitors[1].function)
+                self.assertEqual(3, len(fake.requests))
+
+    def test_changes_sent_without_snapshot(self):
+        """Verifies that every change is sent when monitors.json cannot be fetched."""
+        with FakeZoneMinder(monitor_count=3) as fake, zm.ZoneMinder(
+            fake.url, None, None, backoff=Backoff(base=0)
+        ) as client:
+            monitors = client.get_monitors()
+            fake.monitors[2]["Monitor"]["Function"] = "Record"
+            fake.failures["/zm/api/monitors.json"] = 503
+            results = client.set_functions({monitor: MonitorState.RECORD for monitor in monitors})
+            self.assertEqual(
+                [zm.ChangeStatus.OK] * 3, [results[monitor.id].status for monitor in monitors]
+            )
+            self.assertEqual(
+                ["/zm/api/monitors/1.json", "/zm/api/monitors/2.json", "/zm/api/monitors/3.json"],
+                sorted(fake.paths("POST")),
+            )
+
+    def test_unsaved_change_fails(self):
+        """Verifies that a change answered with an error message is not taken as saved."""
+        ttl = {StateKind.CONFIG: 60, StateKind.FUNCTION: 60}
+        with FakeZoneMinder(monitor_count=2) as fake:
+            with zm.ZoneMinder(fake.url, None, None, cache_ttl=ttl) as client:
+                monitors = client.get_monitors()
+                fake.unsaved_monitors.add(2)
+                results = client.set_functions(
+                    {monitor: MonitorState.NODECT for monitor in monitors}
+                )
+                self.assertEqual(zm.ChangeStatus.OK, results[1].status)
+                self.assertEqual(zm.ChangeStatus.FAILED, results[2].status)
+                self.assertEqual(MonitorState.MODECT, monitors[1].function)
+
+    def test_bounded_concurrency(self):
+        """Verifies that at most max_workers changes are in flight."""
+        with FakeZoneMinder(monitor_count=6) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            monitors = client.get_monitors()
+            fake.latency = 0.1
+            started = time.monotonic()
+            results = client.set_functions(
+                {monitor: MonitorState.MONITOR for monitor in monitors}, max_workers=3
+            )
+            elapsed = time.monotonic() - started
+        self.assertTrue(all(r.status == zm.ChangeStatus.OK for r in results.values()))
+        # monitors.json, then two rounds of three changes
+        self.assertGreater(elapsed, 0.3)
+        self.assertLess(elapsed, 0.6)
+
+
+class TestZoneMinderEventCounts(unittest.TestCase):
+    """Tests to verify that consoleEvents responses are shared by Monitors."""
+
+    def test_get_events_shares_one_request_per_period(self):
+        """Verifies that all Monitors are served from one consoleEvents request."""
+        with FakeZoneMinder(monitor_count=3) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            fake.add_event(1)
+            fake.add_event(1, timedelta(days=2))
+            fake.add_event(3, archived=True)
+            monitors = client.get_monitors()
+            self.assertEqual([1, 0, 0], [m.get_events(TimePeriod.HOUR) for m in monitors])
+            self.assertEqual([2, 0, 1], [m.get_events(TimePeriod.ALL, True) for m in monitors])
+            self.assertEqual([1, 0, 0], [m.get_events(TimePeriod.DAY) for m in monitors])
+        self.assertEqual(4, len(fake.requests))
+
+    def test_get_event_counts_matrix(self):
+        """Verifies the Monitor by TimePeriod matrix of event counts."""
+        with FakeZoneMinder(monitor_count=2) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            fake.add_event(1, timedelta(days=3))
+            counts = client.get_event_counts(monitors=client.get_monitors())
+        self.assertEqual(
+            {
+                TimePeriod.ALL: 1,
+                TimePeriod.HOUR: 0,
+                TimePeriod.DAY: 0,
+                TimePeriod.WEEK: 1,
+                TimePeriod.MONTH: 1,
+            },
+            counts[1],
+        )
+        self.assertEqual({0}, set(counts[2].values()))
+
+
+class TestZoneMinderRunStates(unittest.TestCase):
+    """Tests to verify that RunStates are served from one snapshot."""
+
+    def test_get_active_state_is_one_request(self):
+        """Verifies that finding the active RunState costs a single request."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            fake.active_state = 3
+            self.assertEqual("home", client.get_active_state())
+        self.assertEqual(["/zm/api/states.json"], fake.paths())
+
+    def test_run_states_updated_in_place(self):
+        """Verifies that RunStates keep their identity and refresh explicitly."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            away = client.get_run_state("away")
+            self.assertIs(away, client.get_run_state(2))
+            self.assertFalse(away.active)
+            fake.active_state = 2
+            self.assertFalse(away.active)
+            away.refresh()
+            self.assertTrue(away.active)
+            client.get_run_state(1).activate()
+            self.assertFalse(away.active)
+            self.assertIn(away, client.get_run_states())
+        self.assertEqual(4, fake.paths().count("/zm/api/states.json"))
+
+    def test_truncated_monitors_keep_known(self):
+        """Verifies that monitors.json breaking off mid-stream leaves the known Monitors."""
+        with FakeZoneMinder(monitor_count=300, monitor_padding=500) as fake, zm.ZoneMinder(
+            fake.url, None, None
+        ) as client:
+            self.assertEqual(300, len(client.get_monitors()))
+            last = client.get_monitor(300)
+            fake.cut_json_after["/zm/api/monitors.json"] = 100_000
+            self.assertEqual([], client.refresh_monitors())
+            self.assertIs(last, client.get_monitor(300))
+            self.assertEqual(300, len(client._monitors))  # pylint: disable=protected-access
+
+    def test_monitors_updated_in_place(self):
+        """Verifies that Monitors keep their identity and are found by id or name."""
+        with FakeZoneMinder(monitor_count=2) as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            camera = client.get_monitor("Camera 2")
+            self.assertIs(camera, client.get_monitor(2))
+            fake.monitors[2]["Monitor"]["Name"] = "Garden"
+            self.assertIn(camera, client.get_monitors())
+            self.assertEqual("Garden", camera.name)
+            self.assertIs(camera, client.get_monitor("Garden"))
+            self.assertIsNone(client.get_monitor("Camera 2"))
+            self.assertEqual(camera.config, client.refresh_all().monitors[1].config)
+        self.assertEqual(3, fake.paths().count("/zm/api/monitors.json"))
+
+    def test_monitor_urls_built_on_access(self):
+        """Verifies that image urls follow the last fetched configuration."""
+        with FakeZoneMinder(monitor_count=1) as fake, zm.ZoneMinder(
+            fake.url, "a b", None
+        ) as client:
+            monitor = client.get_monitors()[0]
+            self.assertFalse(hasattr(monitor, "__dict__"))
+            self.assertIn("mode=jpeg", monitor.mjpeg_image_url)
+            self.assertTrue(monitor.still_image_url.endswith("monitor=1&user=a%20b"))
+            fake.monitors[1]["Monitor"]["StreamReplayBuffer"] = "7"
+            client.refresh_monitors()
+            self.assertIn("mode=single&buffer=7&", monitor.still_image_url)
+
+
+class TestZoneMinderSingleFlight(unittest.TestCase):
+    """Tests to verify that identical concurrent GETs share one request."""
+
+    def test_concurrent_gets_share_one_request(self):
+        """Verifies that concurrent reads of the same url make one request."""
+        with FakeZoneMinder() as fake, zm.ZoneMinder(fake.url, None, None) as client:
+            fake.latency = 0.2
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                states = list(executor.map(lambda _: client.get_active_state(), range(8)))
+            self.assertEqual(["default"] * 8, states)
+            snapshot = client.metrics.snapshot()
+        self.assertEqual(["/zm/api/states.json"], fake.paths())
+        self.assertEqual((1, 7), (snapshot.requests, snapshot.shared_requests))
+        self.assertIn(
+            'zoneminder_requests_shared_total{method="GET"', client.metrics.to_prometheus()
+        )
+
+    def test_errors_shared(self):
+        """Verifies that the callers sharing a request all get its error."""
+        client = zm.ZoneMinder("http://zoneminder.invalid", None, None)
+
+        def slow_failure(*args, **kwargs):
+            time.sleep(0.2)
+            raise RuntimeError("boom")
+
+        with mock.patch.object(client.session, "request", side_effect=slow_failure) as request:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(client.get_state, "api/states.json") for _ in range(4)]
+            for future in futures:
+                self.assertRaises(RuntimeError, future.result)
+        self.assertEqual(1, request.call_count)
+        self.assertEqual(3, client.metrics.snapshot().shared_requests)
@@ -0,0 +1,497 @@
+"""An asyncio API Client to interact with ZoneMinder.
+
+Mirrors ZoneMinder, Monitor and RunState with coroutines so that many API
+calls can be in flight at once on a single event loop. Requires aiohttp,
+installed with the ``async`` extra of zm-py.
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional
+from urllib.parse import urljoin
+
+import aiohttp
+
+from zoneminder.auth import AuthTokens
+from zoneminder.decoding import ArrayItemParser, loads
+from zoneminder.exceptions import (
+    CircuitOpenError,
+    CommError,
+    ControlTypeError,
+    MonitorControlTypeError,
+)
+from zoneminder.mjpeg import AsyncMjpegStream
+from zoneminder.monitor import BaseMonitor, MonitorState
+from zoneminder.resilience import FailureKind
+from zoneminder.run_state import AsyncStateChangeJob, BaseRunState
+from zoneminder.zm import BaseZoneMinder
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AsyncMonitor(BaseMonitor):
+    """Represents a Monitor from ZoneMinder, queried with coroutines."""
+
+    __slots__ = ()
+
+    async def update_monitor(self):
+        """Update the monitor and monitor status from the ZM server."""
+        result = await self._client.get_state(self._monitor_url)
+        self.update_from_raw(result["monitor"])
+
+    async def get_function(self) -> MonitorState:
+        """Get the MonitorState of this Monitor."""
+        await self.update_monitor()
+
+        return self._function_from_raw()
+
+    async def set_function(self, new_function):
+        """Set the MonitorState of this Monitor."""
+        await self._client.change_state(
+            self._monitor_url, {"Monitor[Function]": new_function.value}
+        )
+
+    async def is_recording(self) -> Optional[bool]:
+        """Indicate if this Monitor is currently recording."""
+        recording = self._recording_from_shm()
+        if recording is not None:
+            return recording
+        status_response = await self._client.get_state(self._alarm_status_url)
+        return self._recording_from_status(status_response)
+
+    async def is_available(self) -> bool:
+        """Indicate if this Monitor is currently available."""
+        available = self._available_from_shm()
+        if available is not None:
+            return available
+        status_response = await self._client.get_state(self._daemon_status_url)
+        return self._available_from_status(status_response)
+
+    async def get_events(self, time_period, include_archived=False) -> Optional[int]:
+        """Get the number of events that have occurred on this Monitor.
+
+        Specifically only gets events that have occurred within the TimePeriod
+        provided.
+        """
+        event = await self._client.get_console_events(time_period, include_archived)
+        return self._events_from_response(event)
+
+    def stream_frames(self, every=1, latest=False, copy=False) -> AsyncMjpegStream:
+        """Stream the JPEG frames of this Monitor's mjpeg_image_url.
+
+        Returns an async iterator of frames, see MjpegStream.
+        """
+        return AsyncMjpegStream(
+            self._client.session,
+            self.mjpeg_image_url,
+            aiohttp.ClientTimeout(
+                sock_connect=self._client.DEFAULT_TIMEOUT, sock_read=self._client.DEFAULT_TIMEOUT
+            ),
+            every=every,
+            latest=latest,
+            copy=copy,
+        )
+
+    async def ptz_control_command(
+        self, direction, token, base_url, timeout=BaseMonitor.DEFAULT_PTZ_TIMEOUT
+    ) -> bool:
+        """Move camera."""
+        params = self._ptz_params(direction, token)
+        async with self._client.session.post(
+            f"{base_url}index.php",
+            params=params,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as req:
+            return bool(req.ok)
+
+
+class AsyncRunState(BaseRunState):
+    """Represents a Run State from ZoneMinder, queried with coroutines."""
+
+    async def is_active(self) -> bool:
+        """Fetch whether this RunState is currently active, updating active."""
+        return self._active_from_states(await self._client.get_state(self._state_url))
+
+    async def activate(self):
+        """Activate this RunState."""
+        await self._client.set_active_state(self._name)
+
+
+class AsyncZoneMinder(BaseZoneMinder):
+    """The asyncio flavour of the ZoneMinder API client.
+
+    The aiohttp session is created on first use, inside the running event
+    loop, unless one is passed in. Close the client (or use it as an async
+    context manager) to release its connections.
+    """
+
+    DEFAULT_LIMIT = 100
+
+    def __init__(
+        self,
+        server_host,
+        username,
+        password,
+        server_path=BaseZoneMinder.DEFAULT_SERVER_PATH,
+        zms_path=BaseZoneMinder.DEFAULT_ZMS_PATH,
+        verify_ssl=True,
+        session=None,
+        limit=DEFAULT_LIMIT,
+        limit_per_host=0,
+        keep_alive=True,
+        shm_backend=None,
+        metrics=None,
+        circuit_breaker=None,
+        backoff=None,
+    ) -> None:
+        """Create an asyncio ZoneMinder API Client.
+
+        limit caps the number of simultaneous connections and limit_per_host
+        the number to the ZoneMinder server (0 means no limit). shm_backend,
+        metrics, circuit_breaker and backoff are as for ZoneMinder.
+        """
+        super().__init__(server_host, username, password, server_path, zms_path, verify_ssl)
+        self._owns_session = session is None
+        self._session = session
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keep_alive = keep_alive
+        self._login_lock = asyncio.Lock()
+        self._shm_backend = shm_backend
+        if metrics is not None:
+            self._metrics = metrics
+        if circuit_breaker is not None:
+            self._breaker = circuit_breaker
+        if backoff is not None:
+            self._backoff = backoff
+
+    async def __aenter__(self):
+        """Enter the runtime context, returning this client."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Exit the runtime context and release pooled connections."""
+        await self.close()
+
+    async def close(self):
+        """Close the pooled connections if this client created the session."""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Get the aiohttp session shared by all requests of this client."""
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                force_close=not self._keep_alive,
+                ssl=None if self._verify_ssl else False,
+            )
+            # ZoneMinder servers are commonly reached by IP address, which the
+            # default cookie jar refuses to store legacy auth cookies for.
+            self._session = aiohttp.ClientSession(
+                connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True)
+            )
+        return self._session
+
+    async def login(self):
+        """Login to the ZoneMinder API."""
+        async with self._login_lock:
+            return await self._login()
+
+    async def _login(self):
+        """Login with the username and password; the login lock must be held."""
+        _LOGGER.debug("Attempting to login to ZoneMinder")
+        self._metrics.record_login()
+
+        async with self.session.post(
+            urljoin(self._server_url, "api/host/login.json"),
+            data=self._login_data(),
+            timeout=aiohttp.ClientTimeout(total=BaseZoneMinder.DEFAULT_TIMEOUT),
+        ) as req:
+            if req.ok:
+                try:
+                    tokens = AuthTokens.from_login_response(await req.json(content_type=None))
+                    self._set_tokens(tokens)
+                    return True
+                except (KeyError, TypeError, ValueError):
+                    # Try legacy auth below
+                    pass
+
+        return await self._legacy_auth()
+
+    async def _refresh_login(self):
+        """Renew the access token with the refresh token; the login lock must be held."""
+        _LOGGER.debug("Refreshing the ZoneMinder access token")
+        self._metrics.record_token_refresh()
+
+        async with self.session.post(
+            urljoin(self._server_url, "api/host/login.json"),
+            data={"token": self._tokens.refresh_token},
+            timeout=aiohttp.ClientTimeout(total=BaseZoneMinder.DEFAULT_TIMEOUT),
+        ) as req:
+            if req.ok:
+                try:
+                    self._tokens.renew(await req.json(content_type=None))
+                    self._set_tokens(self._tokens)
+                    return True
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+        _LOGGER.debug("Could not refresh the access token, logging in again")
+        return False
+
+    async def _reauthenticate(self, generation) -> bool:
+        """Renew the credentials seen at generation, unless another task already did.
+
+        See ZoneMinder._reauthenticate.
+        """
+        async with self._login_lock:
+            if generation != self._auth_generation:
+                return True
+            if self._tokens is not None and self._tokens.can_refresh:
+                if await self._refresh_login():
+                    return True
+            return await self._login()
+
+    async def _legacy_auth(self):
+        timeout = aiohttp.ClientTimeout(total=BaseZoneMinder.DEFAULT_TIMEOUT)
+        async with self.session.post(
+            urljoin(self._server_url, "index.php"),
+            data=self._legacy_login_data(),
+            timeout=timeout,
+        ):
+            pass
+
+        # Login calls returns a 200 response on both failure and success.
+        # The only way to tell if you logged in correctly is to issue an api
+        # call.
+        async with self.session.get(
+            urljoin(self._server_url, "api/host/getVersion.json"), timeout=timeout
+        ) as req:
+            if not req.ok:
+                _LOGGER.error("Connection error logging into ZoneMinder")
+                return False
+
+        self._set_tokens(None)
+        return True
+
+    async def get_state(self, api_url) -> dict:
+        """Perform a GET request on the specified ZoneMinder API URL."""
+        return await self._zm_request("get", api_url, retries=BaseZoneMinder.SERVER_RETRIES)
+
+    async def change_state(self, api_url, post_data) -> dict:
+        """Perform a POST request on the specific ZoneMinder API Url."""
+        return await self._zm_request("post", api_url, post_data)
+
+    async def _zm_request(
+        self, method, api_url, data=None, timeout=BaseZoneMinder.DEFAULT_TIMEOUT, retries=0
+    ) -> dict:
+        """Perform a request to the ZoneMinder API, see ZoneMinder._zm_request."""
+        probe = self._metrics.start(method, api_url)
+        try:
+            async with await self._send(probe, method, api_url, data, timeout, retries) as req:
+                body = await req.read()
+
+            probe.bytes_received = len(body)
+            decode_started = time.perf_counter()
+            try:
+                return loads(body)
+            except ValueError:
+                probe.error = "decode"
+                _LOGGER.exception(
+                    'JSON decode exception caught while attempting to decode "%s"',
+                    body.decode(errors="replace"),
+                )
+                return {}
+            finally:
+                probe.decode_time = time.perf_counter() - decode_started
+        except CircuitOpenError:
+            probe.error = "circuit_open"
+            _LOGGER.debug("Not requesting %s, ZoneMinder is down", api_url)
+            return {}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            probe.error = "connection"
+            _LOGGER.exception("Unable to connect to ZoneMinder")
+            return {}
+        finally:
+            probe.finish()
+
+    async def _iter_items(self, api_url, key) -> AsyncIterator[dict]:
+        """Iterate over the items of an array of a ZoneMinder API response as it arrives.
+
+        See ZoneMinder._iter_items.
+        """
+        probe = self._metrics.start("get", api_url)
+        complete = False
+        try:
+            async with await self._send(
+                probe, "get", api_url, retries=BaseZoneMinder.SERVER_RETRIES
+            ) as req:
+                if req.ok:
+                    parser = ArrayItemParser(key)
+                    async for chunk in req.content.iter_chunked(BaseZoneMinder.DEFAULT_CHUNK_SIZE):
+                        probe.bytes_received += len(chunk)
+                        decode_started = time.perf_counter()
+                        items = parser.feed(chunk)
+                        probe.decode_time += time.perf_counter() - decode_started
+                        for item in items:
+                            yield item
+                    for item in parser.close():
+                        yield item
+                    complete = parser.found
+                    if not complete:
+                        _LOGGER.warning('No "%s" in the response to %s', key, api_url)
+        except ValueError:
+            probe.error = "decode"
+            _LOGGER.exception('JSON decode exception caught while decoding "%s"', api_url)
+        except CircuitOpenError:
+            probe.error = "circuit_open"
+            _LOGGER.debug("Not requesting %s, ZoneMinder is down", api_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            probe.error = "connection"
+            _LOGGER.exception("Unable to connect to ZoneMinder")
+        finally:
+            probe.finish()
+        if not complete:
+            raise CommError(api_url)
+
+    async def _send(
+        self,
+        probe,
+        method,
+        api_url,
+        data=None,
+        timeout=BaseZoneMinder.DEFAULT_TIMEOUT,
+        retries=0,
+    ) -> aiohttp.ClientResponse:
+        """Send a request to the ZoneMinder API, retrying the failures worth it.
+
+        The response is returned unread. See ZoneMinder._send.
+        """
+        tokens = self._tokens
+        if tokens is not None and tokens.access_expiring:
+            await self._reauthenticate(self._auth_generation)
+        retried = 0
+        logins = 0
+        while True:
+            if not self._breaker.allow():
+                raise CircuitOpenError(self._server_url)
+            probe.attempts += 1
+            generation = self._auth_generation
+            try:
+                req = await self.session.request(
+                    method,
+                    self._api_url(api_url),
+                    data=data,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                self._record_no_response(isinstance(err, asyncio.TimeoutError), timeout)
+                if retried >= retries:
+                    raise
+                failure = FailureKind.CONNECTION
+            except BaseException:
+                # Cancelled or interrupted, which says nothing about the server
+                self._breaker.release()
+                raise
+            else:
+                probe.status = req.status
+                failure = self._record_status(req.status)
+                if failure == FailureKind.AUTH and logins < BaseZoneMinder.LOGIN_RETRIES - 1:
+                    req.release()
+                    logins += 1
+                    await self._reauthenticate(generation)
+                    continue
+                if failure is None or not failure.server_down:
+                    break
+                if retried >= retries:
+                    break
+                req.release()
+            delay = self._backoff.delay(retried)
+            retried += 1
+            _LOGGER.debug("Retrying %s in %.2fs after a %s failure", api_url, delay, failure.value)
+            await asyncio.sleep(delay)
+
+        if failure is not None:
+            _LOGGER.error("Unable to get API response from ZoneMinder: %s failure", failure.value)
+        return req
+
+    async def get_monitors(self) -> List[AsyncMonitor]:
+        """Get a list of Monitors from the ZoneMinder API.
+
+        The Monitors are built as monitors.json is received; none are
+        returned if it broke off.
+        """
+        try:
+            return [
+                AsyncMonitor(self, raw_result)
+                async for raw_result in self._iter_items(BaseZoneMinder.MONITOR_URL, "monitors")
+            ]
+        except CommError:
+            _LOGGER.warning("Could not fetch all the monitors")
+            return []
+
+    async def get_console_events(self, time_period, include_archived=False) -> dict:
+        """Get the consoleEvents response counting the events of every Monitor."""
+        return await self.get_state(self._console_events_url(time_period, include_archived))
+
+    async def get_run_states(self) -> List[AsyncRunState]:
+        """Get a list of RunStates from the ZoneMinder API."""
+        raw_states = await self.get_state("api/states.json")
+        return [AsyncRunState(self, raw_state) for raw_state in self._raw_state_list(raw_states)]
+
+    async def get_active_state(self) -> Optional[str]:
+        """Get the name of the active run state from the ZoneMinder API."""
+        for state in await self.get_run_states():
+            if state.active:
+                return state.name
+        return None
+
+    async def set_active_state(
+        self, state_name, wait=True, poll_interval=AsyncStateChangeJob.DEFAULT_POLL_INTERVAL
+    ):
+        """
+        Set the ZoneMinder run state to the given state name, via ZM API.
+
+        Like ZoneMinder.set_active_state this can take ten (10) or more
+        seconds **per camera**, so it uses a timeout of 120. With wait False
+        a started AsyncStateChangeJob is returned right away instead.
+        """
+        if not wait:
+            return AsyncStateChangeJob(self, state_name, poll_interval=poll_interval).start()
+        _LOGGER.info("Setting ZoneMinder run state to state %s", state_name)
+        return await self._zm_request(
+            "GET", f"api/states/change/{state_name}.json", timeout=BaseZoneMinder.LONG_TIMEOUT
+        )
+
+    async def is_available(self) -> bool:
+        """Indicate if this ZoneMinder service is currently available."""
+        status_response = await self.get_state("api/host/daemonCheck.json")
+
+        if not status_response:
+            return False
+
+        return status_response.get("result") == 1
+
+    async def move_monitor(
+        self, monitor: AsyncMonitor, direction: str, timeout=BaseMonitor.DEFAULT_PTZ_TIMEOUT
+    ) -> bool:
+        """Call Zoneminder to move, returning whether it succeeded."""
+        try:
+            result = await monitor.ptz_control_command(
+                direction, self._auth_token, self._server_url, timeout
+            )
+            if result:
+                _LOGGER.info("Success to move camera to %s", direction)
+            else:
+                _LOGGER.error("Impossible to move camera to %s", direction)
+            return result
+        except ControlTypeError:
+            _LOGGER.exception("Impossible move monitor")
+        except MonitorControlTypeError:
+            _LOGGER.exception("Impossible to use direction")
+        return False
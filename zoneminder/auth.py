@@ -0,0 +1,86 @@
+"""Tracks the lifetime of the tokens issued by ZoneMinder's login API."""
+
+import time
+from typing import Optional
+
+
+class AuthTokens:
+    """The access and refresh tokens of a ZoneMinder API login.
+
+    ZoneMinder reports how many seconds each token is valid for; this keeps
+    the matching deadlines so the access token can be renewed with the
+    refresh token shortly before it expires, instead of after a request
+    failed.
+    """
+
+    # Renew the access token this many seconds (or half its lifetime, if that
+    # is shorter) before ZoneMinder expires it
+    REFRESH_MARGIN = 60
+
+    def __init__(
+        self, access_token, access_expires_in=None, refresh_token=None, refresh_expires_in=None
+    ):
+        """Create the tokens of a login, with their lifetimes in seconds."""
+        self._access_token = access_token
+        self._access_renew_at = AuthTokens._renew_at(access_expires_in)
+        self._refresh_token = refresh_token
+        self._refresh_renew_at = AuthTokens._renew_at(refresh_expires_in)
+
+    @classmethod
+    def from_login_response(cls, response) -> "AuthTokens":
+        """Build the tokens from a login.json response.
+
+        Raises KeyError when the response has no access token, which is the
+        case for servers that only support legacy (cookie) authentication.
+        """
+        return cls(
+            response["access_token"],
+            response.get("access_token_expires"),
+            response.get("refresh_token"),
+            response.get("refresh_token_expires"),
+        )
+
+    def renew(self, response):
+        """Take the new access token from the response to a token refresh.
+
+        ZoneMinder does not issue a new refresh token on refresh, so the
+        current one is kept unless the response carries another.
+        """
+        self._access_token = response["access_token"]
+        self._access_renew_at = AuthTokens._renew_at(response.get("access_token_expires"))
+        if response.get("refresh_token"):
+            self._refresh_token = response["refresh_token"]
+            self._refresh_renew_at = AuthTokens._renew_at(response.get("refresh_token_expires"))
+
+    @property
+    def access_token(self) -> str:
+        """Get the access token to append to API requests."""
+        return self._access_token
+
+    @property
+    def refresh_token(self) -> Optional[str]:
+        """Get the refresh token, if ZoneMinder issued one."""
+        return self._refresh_token
+
+    @property
+    def access_expiring(self) -> bool:
+        """Indicate whether the access token is about to expire."""
+        return AuthTokens._expiring(self._access_renew_at)
+
+    @property
+    def can_refresh(self) -> bool:
+        """Indicate whether the refresh token can still be used."""
+        return self._refresh_token is not None and not AuthTokens._expiring(self._refresh_renew_at)
+
+    @staticmethod
+    def _renew_at(expires_in) -> Optional[float]:
+        """Get when (on the monotonic clock) a token of the lifetime is renewed."""
+        if expires_in is None:
+            return None
+        expires_in = int(expires_in)
+        return time.monotonic() + expires_in - min(AuthTokens.REFRESH_MARGIN, expires_in / 2)
+
+    @staticmethod
+    def _expiring(renew_at) -> bool:
+        """Indicate whether a token is due for renewal."""
+        return renew_at is not None and time.monotonic() >= renew_at
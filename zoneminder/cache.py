@@ -0,0 +1,75 @@
+"""A TTL cache for the state ZoneMinder reports about its Monitors."""
+
+from enum import Enum
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+
+class StateKind(Enum):
+    """Represents the kinds of state that are cached, each with its own TTL."""
+
+    CONFIG = "config"
+    FUNCTION = "function"
+    ALARM = "alarm"
+    DAEMON = "daemon"
+    EVENTS = "events"
+
+
+class CachedValue(NamedTuple):
+    """A value read from the cache together with its age in seconds."""
+
+    value: Any
+    age: float
+
+
+class StateCache:
+    """Keeps the last value of each (key, StateKind) with an expiry time.
+
+    The last value is always kept so it can be peeked at without blocking,
+    but get only returns it while it is younger than its TTL. All TTLs
+    default to 0, which disables caching for that kind.
+    """
+
+    def __init__(self, ttl=None):
+        """Create a StateCache with a mapping of StateKind to TTL seconds."""
+        self._ttl = {kind: 0.0 for kind in StateKind}
+        self._ttl.update(ttl or {})
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, kind) -> float:
+        """Get the TTL in seconds of a StateKind."""
+        return self._ttl.get(kind, 0.0)
+
+    def put(self, key, kind, value, ttl=None):
+        """Store a value, fresh for the TTL of its kind or ttl if longer."""
+        ttl = self.ttl(kind) if ttl is None else max(ttl, self.ttl(kind))
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(key, kind)] = (value, now, now + ttl)
+
+    def get(self, key, kind) -> Optional[CachedValue]:
+        """Get a value if it has not expired yet."""
+        with self._lock:
+            entry = self._entries.get((key, kind))
+        now = time.monotonic()
+        if entry is None or now >= entry[2]:
+            return None
+        return CachedValue(entry[0], now - entry[1])
+
+    def peek(self, key, kind) -> Optional[CachedValue]:
+        """Get the last value stored, even when it has expired."""
+        with self._lock:
+            entry = self._entries.get((key, kind))
+        if entry is None:
+            return None
+        return CachedValue(entry[0], time.monotonic() - entry[1])
+
+    def invalidate(self, key=None, kind=None):
+        """Expire the entries matching key and kind (None matches all)."""
+        with self._lock:
+            for entry_key, entry_kind in list(self._entries):
+                if key in (None, entry_key) and kind in (None, entry_kind):
+                    value, stored_at, _ = self._entries[(entry_key, entry_kind)]
+                    self._entries[(entry_key, entry_kind)] = (value, stored_at, stored_at)
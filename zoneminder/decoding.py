@@ -0,0 +1,178 @@
+"""Decoding of the JSON responses of the ZoneMinder API.
+
+orjson is used when it is installed, the json module of the standard
+library otherwise. ArrayItemParser decodes the items of a large array one at
+a time while the response is being received.
+"""
+
+import codecs
+import json
+import re
+from typing import List
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# The name of the JSON library decoding the responses
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data):
+    """Decode a JSON document from bytes or str.
+
+    Raises ValueError (or a subclass) if data is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)  # pylint: disable=no-member
+    return json.loads(data)
+
+
+# A complete string, or else one of the characters that give the structure
+# of a document (a lone quote being the start of a string not received yet)
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}:,"]', re.DOTALL)
+_WHITESPACE = re.compile(r"[ \t\n\r,]*")
+# What may be left of a value cut at the end of the data received so far
+_CUT_VALUE = re.compile(r"(?:t(?:r(?:ue?)?)?|f(?:a(?:l(?:se?)?)?)?|n(?:u(?:ll?)?)?|-?[0-9.eE+-]*)")
+_NUMBER_CHARACTERS = "0123456789.eE+-"
+
+# What the parser is looking for
+_KEY, _ARRAY, _ITEM, _DONE = range(4)
+
+
+class ArrayItemParser:
+    """Decodes the items of an array held by a key of a JSON object, as bytes arrive.
+
+    Made for responses like monitors.json, {"monitors": [...]}: feed is
+    called with the chunks of the body and returns the items completed by
+    each one, so that only one item is decoded at a time instead of the
+    whole document. The rest of the document is skipped without being
+    decoded or checked. close checks that the array was complete.
+    """
+
+    def __init__(self, key):
+        """Create a parser of the array under key in the top level object."""
+        self._key = key
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        # Where the scan of the buffer resumes
+        self._position = 0
+        self._depth = 0
+        self._last_string = None
+        self._phase = _KEY
+        self._found = False
+
+    @property
+    def found(self) -> bool:
+        """Indicate whether the key was found holding an array."""
+        return self._found
+
+    def feed(self, chunk, final=False) -> List:
+        """Add the next bytes of the document, getting the items they completed."""
+        text = self._text.decode(chunk, final)
+        if self._phase == _DONE:
+            return []
+        self._buffer = self._buffer[self._position :] + text
+        self._position = 0
+        items = []
+        while self._phase != _DONE:
+            if self._phase == _KEY:
+                progressed = self._find_key()
+            elif self._phase == _ARRAY:
+                progressed = self._find_array()
+            else:
+                progressed = self._find_item(items, final)
+            if not progressed:
+                break
+        if self._phase == _DONE:
+            self._buffer = ""
+        return items
+
+    def close(self) -> List:
+        """Get the items left, raising ValueError if the document was incomplete.
+
+        A document whose top level object does not hold the key is complete;
+        found is then False.
+        """
+        items = self.feed(b"", final=True)
+        if self._phase != _DONE:
+            raise ValueError(f'Incomplete JSON document, looking for the "{self._key}" array')
+        return items
+
+    def _find_key(self) -> bool:
+        """Scan the top level object for the key, until it or the end of the data."""
+        for match in _TOKEN.finditer(self._buffer, self._position):
+            token = match.group()
+            if token == '"':
+                # The end of the string was not received yet
+                self._position = match.start()
+                return False
+            if token[0] == '"':
+                # A key, if followed by a colon
+                self._last_string = token if self._depth == 1 else None
+                continue
+            if token == ":" and self._depth == 1 and json.loads(self._last_string) == self._key:
+                self._position = match.end()
+                self._phase = _ARRAY
+                return True
+            self._last_string = None
+            if token in "{[":
+                self._depth += 1
+            elif token in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._phase = _DONE
+                    return True
+        self._position = len(self._buffer)
+        return False
+
+    def _find_array(self) -> bool:
+        """Check that the value of the key is an array."""
+        position = self._skip_whitespace()
+        if position == len(self._buffer):
+            return False
+        self._found = self._buffer[position] == "["
+        self._phase = _ITEM if self._found else _DONE
+        self._position = position + 1
+        return True
+
+    def _find_item(self, items, final) -> bool:
+        """Decode the next item of the array, if all of it was received."""
+        position = self._skip_whitespace()
+        if position == len(self._buffer):
+            return False
+        if self._buffer[position] == "]":
+            self._phase = _DONE
+            return True
+        try:
+            item, end = self._decoder.raw_decode(self._buffer, position)
+        except json.JSONDecodeError as err:
+            if final or not self._cut(err):
+                raise
+            return False
+        if self._cut_number(item, end) and not final:
+            return False
+        items.append(item)
+        self._position = end
+        return True
+
+    def _skip_whitespace(self) -> int:
+        """Skip the whitespace (and item separators) at the scan position."""
+        self._position = _WHITESPACE.match(self._buffer, self._position).end()
+        return self._position
+
+    def _cut_number(self, item, end) -> bool:
+        """Indicate whether a number decoded may go on in the data not received yet."""
+        if not isinstance(item, (int, float)) or isinstance(item, bool):
+            return False
+        return end == len(self._buffer) or self._buffer[end] in _NUMBER_CHARACTERS
+
+    def _cut(self, err) -> bool:
+        """Indicate whether a decoding error is due to the data received so far ending."""
+        if err.msg.startswith("Unterminated string"):
+            return True
+        if err.msg.startswith("Invalid \\uXXXX escape"):
+            return err.pos + 6 > len(self._buffer)
+        return _CUT_VALUE.fullmatch(self._buffer, err.pos) is not None
@@ -0,0 +1,263 @@
+"""Download the video and frames of events to disk, resuming partial files."""
+
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import logging
+import os
+import re
+import time
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from zoneminder.events import Event
+
+_LOGGER = logging.getLogger(__name__)
+
+_CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-\d+|\*)/(\d+)")
+
+
+def _parse_content_range(value) -> Tuple[Optional[int], Optional[int]]:
+    """Get the (first byte, total size) of a Content-Range header, None if unknown."""
+    match = _CONTENT_RANGE.fullmatch((value or "").strip())
+    if match is None:
+        return None, None
+    start, total = match.groups()
+    return (None if start is None else int(start)), int(total)
+
+
+def _is_media(content_type) -> bool:
+    """Indicate whether a Content-Type header is that of a video or an image."""
+    return (content_type or "").strip().lower().startswith(("video/", "image/"))
+
+
+class MediaItem(NamedTuple):
+    """A file of an event to download.
+
+    url is relative to the server url, without auth; path is where to save
+    it, relative to the download directory.
+    """
+
+    event_id: int
+    url: str
+    path: str
+
+    @classmethod
+    def video(cls, event: Event) -> "MediaItem":
+        """Get the video of an event, saved as {monitor id}/{event id}.mp4."""
+        return cls(
+            event.id,
+            f"index.php?view=view_video&eid={event.id}",
+            os.path.join(str(event.monitor_id), f"{event.id}.mp4"),
+        )
+
+    @classmethod
+    def frames(cls, event: Event, frame_ids=None) -> List["MediaItem"]:
+        """Get JPEG frames of an event (all of them by default).
+
+        They are saved as {monitor id}/{event id}/{frame id}.jpg.
+        """
+        if frame_ids is None:
+            frame_ids = range(1, event.frames + 1)
+        return [
+            cls(
+                event.id,
+                f"index.php?view=image&eid={event.id}&fid={frame_id}",
+                os.path.join(str(event.monitor_id), str(event.id), f"{frame_id:05d}.jpg"),
+            )
+            for frame_id in frame_ids
+        ]
+
+
+class DownloadStatus(Enum):
+    """The outcome of the download of one MediaItem."""
+
+    COMPLETE = "complete"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+class DownloadResult(NamedTuple):
+    """The download of one MediaItem.
+
+    size is the bytes of the file on disk, bytes_received the bytes
+    transferred for it this time, resumed_from the bytes of a partial file
+    it continued from (0 if it started afresh).
+    """
+
+    item: MediaItem
+    status: DownloadStatus
+    size: int
+    bytes_received: int
+    resumed_from: int
+    elapsed: float
+
+
+class DownloadReport(NamedTuple):
+    """The outcome of EventDownloader.download."""
+
+    results: List[DownloadResult]
+    bytes_received: int
+    elapsed: float
+
+    @property
+    def throughput(self) -> float:
+        """Get the bytes received per second."""
+        return self.bytes_received / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def failed(self) -> List[DownloadResult]:
+        """Get the results of the downloads that failed."""
+        return [result for result in self.results if result.status == DownloadStatus.FAILED]
+
+
+class EventDownloader:
+    """Downloads event media to a directory with a pool of workers.
+
+    Files are streamed to disk chunk by chunk through the client's session
+    and auth, as {path}.part until their size is verified against the one
+    announced by the server, then renamed. Files already downloaded are
+    skipped, and partial files left by a failed or interrupted download are
+    resumed with an HTTP Range request. A response that is not a video or
+    an image, such as a login page, fails the download.
+    """
+
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_CHUNK_SIZE = 256 * 1024
+    DEFAULT_TIMEOUT = 30
+    PART_SUFFIX = ".part"
+
+    def __init__(
+        self,
+        client,
+        directory,
+        max_workers=DEFAULT_MAX_WORKERS,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        """Create a downloader saving the media of a ZoneMinder client's events to directory."""
+        self._client = client
+        self._directory = directory
+        self._max_workers = max_workers
+        self._chunk_size = chunk_size
+        self._timeout = timeout
+
+    def download(self, items: Iterable[MediaItem]) -> DownloadReport:
+        """Download the given MediaItems, with at most max_workers at a time."""
+        started = time.monotonic()
+        with ThreadPoolExecutor(self._max_workers, thread_name_prefix="zm-download") as executor:
+            results = list(executor.map(self._fetch, items))
+        report = DownloadReport(
+            results,
+            sum(result.bytes_received for result in results),
+            time.monotonic() - started,
+        )
+        _LOGGER.info(
+            "Downloaded %d files (%d failed), %d bytes at %.0f bytes/s",
+            len(results),
+            len(report.failed),
+            report.bytes_received,
+            report.throughput,
+        )
+        return report
+
+    def download_events(self, events: Iterable[Event], video=True, frames=False) -> DownloadReport:
+        """Download the video and/or every frame of the given events."""
+        items = []
+        for event in events:
+            if video:
+                items.append(MediaItem.video(event))
+            if frames:
+                items.extend(MediaItem.frames(event))
+        return self.download(items)
+
+    def _get(self, item, offset) -> requests.Response:
+        """Request a file from offset on, logging in again if the auth expired."""
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        def get() -> requests.Response:
+            return self._client.session.get(
+                self._client.get_media_url(item.url),
+                headers=headers,
+                stream=True,
+                timeout=self._timeout,
+            )
+
+        generation = self._client.auth_generation
+        req = get()
+        if req.status_code in (401, 403) and self._client.reauthenticate(generation):
+            req.close()
+            req = get()
+        return req
+
+    def _fetch(self, item) -> DownloadResult:
+        """Download one file, resuming its partial file if there is one."""
+        started = time.monotonic()
+        path = os.path.join(self._directory, item.path)
+        if os.path.exists(path):
+            return DownloadResult(
+                item,
+                DownloadStatus.SKIPPED,
+                os.path.getsize(path),
+                0,
+                0,
+                time.monotonic() - started,
+            )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = path + EventDownloader.PART_SUFFIX
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        received = 0
+
+        def result(status) -> DownloadResult:
+            done = status == DownloadStatus.COMPLETE
+            size = os.path.getsize(path) if done else offset + received
+            return DownloadResult(item, status, size, received, offset, time.monotonic() - started)
+
+        try:
+            with self._get(item, offset) as req:
+                size = None
+                if req.status_code == 416 and offset:
+                    # Nothing left to send, unless the partial file is not of this file
+                    _, size = _parse_content_range(req.headers.get("Content-Range"))
+                    if size != offset:
+                        _LOGGER.warning("Discarding the partial download of %s", item.path)
+                        os.remove(part)
+                        return self._fetch(item)
+                elif not req.ok:
+                    _LOGGER.warning("Could not download %s: HTTP %s", item.url, req.status_code)
+                    return result(DownloadStatus.FAILED)
+                elif not _is_media(req.headers.get("Content-Type")):
+                    # Such as the login page, answered with 200
+                    _LOGGER.warning(
+                        "Could not download %s: got %s",
+                        item.url,
+                        req.headers.get("Content-Type"),
+                    )
+                    return result(DownloadStatus.FAILED)
+                else:
+                    if req.status_code == 206:
+                        start, size = _parse_content_range(req.headers.get("Content-Range"))
+                        if start != offset:
+                            _LOGGER.warning("Discarding the partial download of %s", item.path)
+                            os.remove(part)
+                            return self._fetch(item)
+                    else:
+                        # The whole file is sent, the server does not do ranges
+                        offset = 0
+                        if "Content-Length" in req.headers:
+                            size = int(req.headers["Content-Length"])
+                    with open(part, "ab" if offset else "wb") as file:
+                        for chunk in req.iter_content(self._chunk_size):
+                            file.write(chunk)
+                            received += len(chunk)
+        except (requests.exceptions.RequestException, OSError):
+            _LOGGER.exception("Download of %s interrupted", item.url)
+            return result(DownloadStatus.FAILED)
+
+        if size is not None and offset + received != size:
+            _LOGGER.warning(
+                "Download of %s is %d bytes instead of %d", item.url, offset + received, size
+            )
+            return result(DownloadStatus.FAILED)
+        os.replace(part, path)
+        return result(DownloadStatus.COMPLETE)
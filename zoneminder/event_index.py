@@ -0,0 +1,287 @@
+"""A local SQLite index of ZoneMinder events, answering event counts offline."""
+
+import calendar
+from datetime import datetime, timedelta
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from zoneminder.events import EventQuery, paginate_events
+from zoneminder.exceptions import CommError
+from zoneminder.monitor import TimePeriod
+
+_LOGGER = logging.getLogger(__name__)
+
+_COLUMNS = """(
+    id INTEGER PRIMARY KEY,
+    monitor_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER,
+    archived INTEGER NOT NULL,
+    max_score INTEGER NOT NULL
+)"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS events {_COLUMNS};
+CREATE INDEX IF NOT EXISTS events_monitor_start ON events (monitor_id, start);
+CREATE INDEX IF NOT EXISTS events_start ON events (start);
+"""
+
+
+def _to_seconds(value) -> Optional[int]:
+    """Convert a naive datetime of the ZM server to seconds, ignoring time zones."""
+    if value is None:
+        return None
+    return calendar.timegm(value.timetuple())
+
+
+def _period_start(time_period, now) -> datetime:
+    """Get the start of a TimePeriod the way consoleEvents' DATE_SUB computes it."""
+    if time_period == TimePeriod.HOUR:
+        return now - timedelta(hours=1)
+    if time_period == TimePeriod.DAY:
+        return now - timedelta(days=1)
+    if time_period == TimePeriod.WEEK:
+        return now - timedelta(weeks=1)
+    if time_period == TimePeriod.MONTH:
+        # Like MySQL, go back a calendar month and clamp to its last day
+        year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+        day = min(now.day, calendar.monthrange(year, month)[1])
+        return now.replace(year=year, month=month, day=day)
+    # consoleEvents is asked for "100 year" for TimePeriod.ALL
+    return datetime.min
+
+
+class SyncResult(NamedTuple):
+    """The outcome of EventIndex.sync.
+
+    complete is False when a request failed, leaving the index behind the
+    server until the next sync.
+    """
+
+    new_events: int
+    updated_events: int
+    elapsed: float
+    last_id: int
+    complete: bool = True
+
+
+class EventIndex:
+    """Keeps a compact copy of the events of a ZoneMinder server in SQLite.
+
+    sync pulls the events added since the last one it saw (and those still
+    in progress then) and the archived ones, so the index stays current
+    with a few requests; counts per Monitor and TimePeriod and histograms are then answered
+    locally. Events deleted on the server are only dropped by a full sync.
+    Times are the ZM server's local time, compared with datetime.now()
+    unless another now is given, so the client should share its time zone.
+    """
+
+    def __init__(self, client, path=":memory:", page_size=500):
+        """Create an index for a ZoneMinder client, stored in the SQLite file at path."""
+        self._client = client
+        self._page_size = page_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """Close the SQLite database."""
+        self._db.close()
+
+    def __len__(self) -> int:
+        """Get the number of events in the index."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    @property
+    def last_id(self) -> int:
+        """Get the id of the newest event in the index (0 when empty)."""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def sync(self, full=False) -> SyncResult:
+        """Pull the new events from ZoneMinder into the index.
+
+        Resumes after the last event seen, or from the oldest event that was
+        still in progress, whose end time and scores may have changed since.
+        The archived flag of the older events is refreshed from the list of
+        archived events. A full sync pulls every event again and replaces
+        the index only once all of them were fetched. When a request fails,
+        the events pulled before it are kept, except by a full sync.
+        """
+        started = time.monotonic()
+        resume_after = known = 0
+        if not full:
+            with self._lock:
+                resume_after = self._db.execute(
+                    "SELECT COALESCE(MIN(id) - 1, (SELECT COALESCE(MAX(id), 0) FROM events)) "
+                    "FROM events WHERE end IS NULL"
+                ).fetchone()[0]
+                known = self._db.execute(
+                    "SELECT COUNT(*) FROM events WHERE id > ?", (resume_after,)
+                ).fetchone()[0]
+
+        archived = self._sync_archived(resume_after) if resume_after else 0
+        if not full:
+            pulled, complete = self._pull("events", resume_after)
+        else:
+            # Stage the events, so the index is kept as it is when a request fails
+            with self._lock:
+                self._db.execute(f"CREATE TEMP TABLE events_sync {_COLUMNS}")
+            try:
+                pulled, complete = self._pull("events_sync", resume_after)
+                with self._lock:
+                    if complete:
+                        with self._db:
+                            self._db.execute("DELETE FROM events")
+                            self._db.execute("INSERT INTO events SELECT * FROM events_sync")
+                    else:
+                        pulled = 0
+            finally:
+                with self._lock:
+                    self._db.execute("DROP TABLE temp.events_sync")
+
+        result = SyncResult(
+            max(pulled - known, 0),
+            min(pulled, known) + (archived or 0),
+            time.monotonic() - started,
+            self.last_id,
+            complete and archived is not None,
+        )
+        _LOGGER.debug(
+            "Synced %d new and %d updated events in %.3fs",
+            result.new_events,
+            result.updated_events,
+            result.elapsed,
+        )
+        return result
+
+    def count(self, monitor_id, time_period, include_archived=False, now=None) -> int:
+        """Count the events of a Monitor within a TimePeriod, like Monitor.get_events."""
+        since = _to_seconds(_period_start(time_period, now or datetime.now()))
+        sql = "SELECT COUNT(*) FROM events WHERE monitor_id = ? AND start >= ?"
+        if not include_archived:
+            sql += " AND archived = 0"
+        with self._lock:
+            return self._db.execute(sql, (monitor_id, since)).fetchone()[0]
+
+    def counts(
+        self, time_periods=None, include_archived=False, now=None
+    ) -> Dict[int, Dict[TimePeriod, int]]:
+        """Count the events of every Monitor in each TimePeriod.
+
+        Same shape as ZoneMinder.get_event_counts, for the Monitors with
+        events in the index.
+        """
+        time_periods = list(time_periods or TimePeriod)
+        now = now or datetime.now()
+        sql = "SELECT monitor_id, COUNT(*) FROM events WHERE start >= ?"
+        if not include_archived:
+            sql += " AND archived = 0"
+        sql += " GROUP BY monitor_id"
+
+        counts = {}
+        with self._lock:
+            for time_period in time_periods:
+                since = _to_seconds(_period_start(time_period, now))
+                for monitor_id, count in self._db.execute(sql, (since,)):
+                    counts.setdefault(monitor_id, dict.fromkeys(time_periods, 0))[
+                        time_period
+                    ] = count
+        return counts
+
+    def histogram(
+        self, monitor_id=None, bucket=timedelta(hours=1), start=None, end=None
+    ) -> List[Tuple[datetime, int]]:
+        """Count events per bucket of time, optionally for one Monitor only.
+
+        Returns the start of each bucket having events with its count, in
+        chronological order.
+        """
+        size = int(bucket.total_seconds())
+        sql = "SELECT start - start % ?, COUNT(*) FROM events WHERE 1"
+        params = [size]
+        if monitor_id is not None:
+            sql += " AND monitor_id = ?"
+            params.append(monitor_id)
+        if start is not None:
+            sql += " AND start >= ?"
+            params.append(_to_seconds(start))
+        if end is not None:
+            sql += " AND start < ?"
+            params.append(_to_seconds(end))
+        sql += " GROUP BY 1 ORDER BY 1"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [(datetime(1970, 1, 1) + timedelta(seconds=key), count) for key, count in rows]
+
+    def _pull(self, table, resume_after) -> Tuple[int, bool]:
+        """Store the events after an id into a table.
+
+        Returns how many there were and whether every page was fetched; the
+        events of the pages before a failed one are stored either way.
+        """
+        query = EventQuery(min_id=resume_after, page_size=self._page_size)
+        pulled = 0
+        batch = []
+        try:
+            for event in paginate_events(self._client.get_state, query, raise_errors=True):
+                batch.append(
+                    (
+                        event.id,
+                        event.monitor_id,
+                        _to_seconds(event.start_time),
+                        _to_seconds(event.end_time),
+                        int(event.archived),
+                        event.max_score,
+                    )
+                )
+                if len(batch) >= self._page_size:
+                    pulled += self._store(table, batch)
+        except CommError as err:
+            _LOGGER.warning("Could not fetch all the new events from ZoneMinder: %s", err)
+            return pulled + self._store(table, batch), False
+        return pulled + self._store(table, batch), True
+
+    def _sync_archived(self, max_id) -> Optional[int]:
+        """Refresh the archived flag of the events up to an id.
+
+        Returns how many changed, None (changing nothing) when the archived
+        events cannot be fetched.
+        """
+        query = EventQuery(archived=True, max_id=max_id, page_size=self._page_size)
+        try:
+            archived = {
+                event.id
+                for event in paginate_events(self._client.get_state, query, raise_errors=True)
+            }
+        except CommError as err:
+            _LOGGER.warning("Could not fetch the archived events from ZoneMinder: %s", err)
+            return None
+        with self._lock, self._db:
+            known = {
+                row[0]
+                for row in self._db.execute(
+                    "SELECT id FROM events WHERE archived = 1 AND id <= ?", (max_id,)
+                )
+            }
+            self._db.executemany(
+                "UPDATE events SET archived = 0 WHERE id = ?",
+                [(event_id,) for event_id in known - archived],
+            )
+            changed = self._db.executemany(
+                "UPDATE events SET archived = 1 WHERE id = ?",
+                [(event_id,) for event_id in archived - known],
+            ).rowcount
+        return len(known - archived) + changed
+
+    def _store(self, table, batch) -> int:
+        """Upsert a batch of rows into a table, emptying it, and get how many there were."""
+        with self._lock, self._db:
+            self._db.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?, ?)", batch)
+        stored = len(batch)
+        batch.clear()
+        return stored
@@ -0,0 +1,150 @@
+"""Classes that allow reading the events recorded by ZoneMinder."""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime
+import logging
+from typing import Iterator, NamedTuple, Optional
+from urllib.parse import quote, urlencode
+
+from zoneminder.exceptions import CommError
+
+_LOGGER = logging.getLogger(__name__)
+
+# The format of dates in the ZoneMinder API
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _parse_date(value) -> Optional[datetime]:
+    """Parse a date of the ZoneMinder API, which may be missing."""
+    if not value:
+        return None
+    return datetime.strptime(value, DATE_FORMAT)
+
+
+class Event(NamedTuple):
+    """Represents an Event recorded by ZoneMinder, keeping only its main fields."""
+
+    id: int
+    monitor_id: int
+    name: str
+    cause: str
+    start_time: datetime
+    end_time: Optional[datetime]
+    length: float
+    frames: int
+    alarm_frames: int
+    total_score: int
+    avg_score: int
+    max_score: int
+    archived: bool
+
+    @classmethod
+    def from_raw(cls, raw_event) -> "Event":
+        """Build an Event from its entry of an events API response.
+
+        Handles the StartDateTime/EndDateTime columns of ZoneMinder 1.36 as
+        well as the StartTime/EndTime of older versions.
+        """
+        return cls(
+            int(raw_event["Id"]),
+            int(raw_event["MonitorId"]),
+            raw_event.get("Name", ""),
+            raw_event.get("Cause", ""),
+            _parse_date(raw_event.get("StartDateTime") or raw_event.get("StartTime")),
+            _parse_date(raw_event.get("EndDateTime") or raw_event.get("EndTime")),
+            float(raw_event.get("Length") or 0),
+            int(raw_event.get("Frames") or 0),
+            int(raw_event.get("AlarmFrames") or 0),
+            int(raw_event.get("TotScore") or 0),
+            int(raw_event.get("AvgScore") or 0),
+            int(raw_event.get("MaxScore") or 0),
+            bool(int(raw_event.get("Archived") or 0)),
+        )
+
+
+class EventQuery:
+    """Builds the events API urls for a set of server-side filters.
+
+    time_field is the column the start and end filters apply to:
+    StartDateTime since ZoneMinder 1.36, StartTime before.
+    """
+
+    EVENTS_URL = "api/events/index"
+    DEFAULT_PAGE_SIZE = 100
+    DEFAULT_TIME_FIELD = "StartDateTime"
+
+    def __init__(
+        self,
+        monitor_id=None,
+        start=None,
+        end=None,
+        archived=None,
+        min_score=None,
+        min_id=None,
+        max_id=None,
+        page_size=DEFAULT_PAGE_SIZE,
+        descending=False,
+        time_field=DEFAULT_TIME_FIELD,
+    ):
+        """Create a query; filters left as None are not applied."""
+        filters = []
+        if monitor_id is not None:
+            filters.append(f"MonitorId:{int(monitor_id)}")
+        if start is not None:
+            filters.append(f"{time_field} >=:{start.strftime(DATE_FORMAT)}")
+        if end is not None:
+            filters.append(f"{time_field} <=:{end.strftime(DATE_FORMAT)}")
+        if archived is not None:
+            filters.append(f"Archived:{int(archived)}")
+        if min_score is not None:
+            filters.append(f"MaxScore >=:{int(min_score)}")
+        if min_id is not None:
+            filters.append(f"Id >:{int(min_id)}")
+        if max_id is not None:
+            filters.append(f"Id <=:{int(max_id)}")
+        self._path = "/".join([EventQuery.EVENTS_URL] + [quote(f, safe=":") for f in filters])
+        self._page_size = page_size
+        self._direction = "desc" if descending else "asc"
+
+    def page_url(self, page) -> str:
+        """Get the API url of a page of results (starting at 1)."""
+        query = urlencode(
+            {"page": page, "limit": self._page_size, "sort": "Id", "direction": self._direction}
+        )
+        return f"{self._path}.json?{query}"
+
+
+def paginate_events(get_state, query, read_ahead=True, raise_errors=False) -> Iterator[Event]:
+    """Iterate over the Events matching an EventQuery, one page at a time.
+
+    get_state performs a GET on an API url. Pages are only fetched as the
+    iteration reaches them; with read_ahead the next page is fetched in the
+    background while the current one is consumed. A page that cannot be
+    fetched ends the iteration, or raises CommError with raise_errors.
+    """
+    executor = ThreadPoolExecutor(max_workers=1) if read_ahead else None
+    try:
+        response = get_state(query.page_url(1))
+        page = 1
+        while True:
+            raw_events = response.get("events") if isinstance(response, dict) else None
+            if raw_events is None:
+                if raise_errors:
+                    raise CommError(query.page_url(page))
+                _LOGGER.warning("Could not fetch page %d of events from ZoneMinder", page)
+                return
+            pagination = response.get("pagination") or {}
+            has_next = bool(pagination.get("nextPage")) and bool(raw_events)
+            next_page = None
+            if has_next and executor is not None:
+                next_page = executor.submit(copy_context().run, get_state, query.page_url(page + 1))
+            for raw_event in raw_events:
+                yield Event.from_raw(raw_event["Event"])
+            if not has_next:
+                return
+            page += 1
+            response = next_page.result() if next_page else get_state(query.page_url(page))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -36,3 +36,7 @@ class MonitorControlTypeError(ZoneminderError):
 
 class PtzError(ZoneminderError):
     """A control error occurred."""
+
+
+class CircuitOpenError(ZoneminderError):
+    """The ZoneMinder server is down, requests fail fast."""
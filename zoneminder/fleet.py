@@ -0,0 +1,252 @@
+"""Query many ZoneMinder servers in parallel, isolating the failures of each."""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import ContextVar
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from zoneminder.monitor import TimePeriod
+from zoneminder.zm import ZoneMinder
+
+_LOGGER = logging.getLogger(__name__)
+
+# The Fleet and failed requests of the query running in this context. Being
+# a context variable, it follows the query into the worker threads of its
+# client (see ZoneMinder.get_event_counts)
+_FAILED_REQUESTS = ContextVar("zm_fleet_failed_requests", default=None)
+
+
+class FleetResult(NamedTuple):
+    """The merged outcome of a query of every server of a Fleet.
+
+    values holds the results of the servers that answered, keyed as
+    documented by each query; errors maps the servers that did not to why
+    ("timeout", "busy", the error of a failed request such as "connection"
+    or the exception raised), and latency every server queried to the
+    seconds its answer took (or was waited for).
+    """
+
+    values: Dict[Any, Any]
+    errors: Dict[str, str]
+    latency: Dict[str, float]
+
+    @property
+    def ok(self) -> bool:
+        """Indicate if every server answered."""
+        return not self.errors
+
+
+class Fleet:
+    """A pool of ZoneMinder clients, one per server, queried in parallel.
+
+    Queries fan out to every server with at most max_workers servers being
+    queried at once, and wait at most timeout seconds for each of them. A
+    server that is slow, down or raising only has its own entry in the
+    errors of the result; while an abandoned query of a server is still
+    running, the server is reported busy rather than queried again, so that
+    it cannot tie up the workers of the others. The clients log failed
+    requests and answer them as empty, so a query during which a request of
+    its server failed (see FAILED_REQUEST_ERRORS) is reported in the errors
+    too. Clients built by connect keep at most connections_per_server
+    connections open each, blocking for a free one beyond that; there is no
+    budget shared by the servers beyond max_workers queries at once.
+    """
+
+    # The errors of a request (see RequestRecord) failing the query that sent it
+    FAILED_REQUEST_ERRORS = frozenset(("auth", "server", "connection", "circuit_open", "decode"))
+    DEFAULT_MAX_WORKERS = 16
+    DEFAULT_CONNECTIONS_PER_SERVER = 4
+    DEFAULT_TIMEOUT = 15.0
+
+    def __init__(
+        self,
+        clients=None,
+        max_workers=DEFAULT_MAX_WORKERS,
+        connections_per_server=DEFAULT_CONNECTIONS_PER_SERVER,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        """Create a pool of the given clients, a mapping of server name to ZoneMinder."""
+        self._clients = {}
+        self._hook_removers = {}
+        self._owned = set()
+        self._connections_per_server = connections_per_server
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._running = {}
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="zm-fleet")
+        for name, client in (clients or {}).items():
+            self.add(name, client)
+
+    def __enter__(self):
+        """Enter the runtime context, returning this pool."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the pool."""
+        self.close()
+
+    def close(self):
+        """Stop the workers and close the clients built by connect."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for remove_hook in self._hook_removers.values():
+            remove_hook()
+        self._hook_removers.clear()
+        for name in self._owned:
+            self._clients[name].close()
+        self._owned.clear()
+
+    @property
+    def servers(self) -> Dict[str, ZoneMinder]:
+        """Get the clients of the pool, keyed by server name."""
+        return dict(self._clients)
+
+    def add(self, name, client: ZoneMinder):
+        """Add the client of a server to the pool."""
+        self.remove(name)
+        self._clients[name] = client
+        self._hook_removers[name] = client.metrics.add_post_hook(self._record_request)
+
+    def connect(self, name, server_host, username, password, **kwargs) -> ZoneMinder:
+        """Build the client of a server within its connection budget and add it.
+
+        The keyword arguments are those of ZoneMinder; the client is closed
+        with the pool.
+        """
+        kwargs.setdefault("pool_maxsize", self._connections_per_server)
+        kwargs.setdefault("pool_block", True)
+        client = ZoneMinder(server_host, username, password, **kwargs)
+        self.add(name, client)
+        self._owned.add(name)
+        return client
+
+    def remove(self, name) -> Optional[ZoneMinder]:
+        """Remove the client of a server from the pool, closing it if built by connect."""
+        client = self._clients.pop(name, None)
+        remove_hook = self._hook_removers.pop(name, None)
+        if remove_hook is not None:
+            remove_hook()
+        if name in self._owned:
+            self._owned.discard(name)
+            client.close()
+        return client
+
+    def map(self, query: Callable[[ZoneMinder], Any], timeout=None) -> FleetResult:
+        """Call query with the client of every server in parallel.
+
+        values maps each server name to what query returned for it.
+        timeout overrides the pool's timeout for this call.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        started = time.monotonic()
+        futures = {}
+        errors = {}
+        latency = {}
+        with self._lock:
+            for name, client in self._clients.items():
+                running = self._running.get(name)
+                if running is not None and not running.done():
+                    _LOGGER.warning("Not querying %s, it is still answering a query", name)
+                    errors[name] = "busy"
+                    latency[name] = 0.0
+                    continue
+                future = self._executor.submit(self._timed, query, client)
+                futures[name] = self._running[name] = future
+        wait(futures.values(), timeout)
+
+        values = {}
+        for name, future in futures.items():
+            if not future.done():
+                _LOGGER.warning("%s did not answer within %gs", name, timeout)
+                errors[name] = "timeout"
+                latency[name] = time.monotonic() - started
+                continue
+            try:
+                value, latency[name], failed = future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.exception("Could not query %s", name)
+                errors[name] = repr(err)
+                latency[name] = time.monotonic() - started
+                continue
+            if failed:
+                _LOGGER.warning("Could not query %s: %s %s", name, failed.error, failed.url)
+                errors[name] = failed.error
+            else:
+                values[name] = value
+        return FleetResult(values, errors, latency)
+
+    def get_monitors(self, timeout=None) -> FleetResult:
+        """Get the Monitors of every server, keyed by (server name, monitor id)."""
+        result = self.map(lambda client: client.get_monitors(), timeout)
+        return self._merged(
+            result,
+            lambda monitors: {monitor.id: monitor for monitor in monitors},
+        )
+
+    def is_available(self, timeout=None) -> FleetResult:
+        """Get whether each server is available, keyed by server name.
+
+        Servers that could not be queried are reported unavailable as well
+        as in the errors.
+        """
+        result = self.map(lambda client: client.is_available, timeout)
+        values = dict(result.values)
+        values.update((name, False) for name in result.errors)
+        return result._replace(values=values)
+
+    def get_active_state(self, timeout=None) -> FleetResult:
+        """Get the name of the active run state of each server, keyed by server name."""
+        return self.map(lambda client: client.get_active_state(), timeout)
+
+    def set_active_state(self, state_name, timeout=None) -> FleetResult:
+        """Set the run state of every server, keyed by server name.
+
+        Changing a run state takes a while, see ZoneMinder.set_active_state;
+        the timeout should account for it.
+        """
+        return self.map(lambda client: client.set_active_state(state_name), timeout)
+
+    def get_event_counts(
+        self, time_periods=None, include_archived=False, timeout=None
+    ) -> FleetResult:
+        """Get the event counts of every Monitor, keyed by (server name, monitor id).
+
+        Each value maps TimePeriod to a count, see ZoneMinder.get_event_counts.
+        """
+        time_periods = list(time_periods or TimePeriod)
+        result = self.map(
+            lambda client: client.get_event_counts(time_periods, include_archived), timeout
+        )
+        return self._merged(result, lambda counts: counts)
+
+    def _timed(self, query, client) -> tuple:
+        """Call query with a client on a worker thread.
+
+        Returns (its result, seconds taken, the RequestRecord of the first
+        request failing the query or None).
+        """
+        started = time.monotonic()
+        failed = []
+        token = _FAILED_REQUESTS.set((self, failed))
+        try:
+            value = query(client)
+        finally:
+            _FAILED_REQUESTS.reset(token)
+        return value, time.monotonic() - started, failed[0] if failed else None
+
+    def _record_request(self, record):
+        """Keep a failed request of the query of this Fleet it was sent for, if any."""
+        running = _FAILED_REQUESTS.get()
+        if running is not None and running[0] is self:
+            if record.error in Fleet.FAILED_REQUEST_ERRORS:
+                running[1].append(record)
+
+    @staticmethod
+    def _merged(result, by_id) -> FleetResult:
+        """Key the per-server values of a result by (server name, id)."""
+        values = {}
+        for name, value in result.values.items():
+            for key, item in by_id(value).items():
+                values[(name, key)] = item
+        return result._replace(values=values)
@@ -0,0 +1,340 @@
+"""Instrumentation of the requests made to the ZoneMinder API."""
+
+from bisect import bisect_left
+import re
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from zoneminder.resilience import classify_status
+
+# Upper bounds, in seconds, of the buckets of the latency histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_HAS_DIGIT = re.compile(r"\d")
+
+
+def endpoint_template(api_url) -> str:
+    """Get the endpoint of an API url, with the ids and other values templated.
+
+    The query string is dropped and path segments (or the values of CakePHP
+    named parameters) holding numbers are replaced, so for example
+    api/monitors/alarm/id:3/command:status.json becomes
+    api/monitors/alarm/id:{id}/command:status.json.
+    """
+    path = unquote(urlsplit(api_url).path)
+    extension = ""
+    if path.endswith(".json"):
+        path, extension = path[:-5], ".json"
+    segments = []
+    for segment in path.split("/"):
+        name, colon, value = segment.partition(":")
+        if not colon:
+            name, value = "", segment
+        if _HAS_DIGIT.search(value):
+            value = "{id}" if value.isdigit() and name in ("", "id") else "{}"
+        segments.append(f"{name}{colon}{value}")
+    return "/".join(segments) + extension
+
+
+class RequestRecord(NamedTuple):
+    """What happened during one API request, as given to post-request hooks.
+
+    retries counts the attempts made after the first one; error is None, a
+    FailureKind value ("auth", "not_found", "client", "server" or
+    "connection"), "decode", or "circuit_open" for a request refused while
+    the server is down.
+    """
+
+    method: str
+    endpoint: str
+    url: str
+    status: Optional[int]
+    elapsed: float
+    bytes_received: int
+    decode_time: float
+    retries: int
+    error: Optional[str]
+
+
+class EndpointStats(NamedTuple):
+    """The totals of the requests made to one endpoint with one method.
+
+    latency_buckets holds the cumulative number of requests that took at
+    most each bucket's upper bound, in seconds. shared counts the requests
+    saved by joining an identical request in flight.
+    """
+
+    method: str
+    endpoint: str
+    requests: int
+    errors: int
+    retries: int
+    bytes_received: int
+    decode_time: float
+    latency_sum: float
+    latency_buckets: Tuple[Tuple[float, int], ...]
+    shared: int = 0
+
+    @property
+    def mean_latency(self) -> float:
+        """Get the mean duration of a request, in seconds."""
+        return self.latency_sum / self.requests if self.requests else 0.0
+
+
+class MetricsSnapshot(NamedTuple):
+    """The metrics at one point in time; endpoints taking the most time come first."""
+
+    endpoints: List[EndpointStats]
+    logins: int
+    token_refreshes: int
+
+    @property
+    def requests(self) -> int:
+        """Get the total number of API requests."""
+        return sum(stats.requests for stats in self.endpoints)
+
+    @property
+    def shared_requests(self) -> int:
+        """Get the total number of API requests saved by sharing one in flight."""
+        return sum(stats.shared for stats in self.endpoints)
+
+
+class RequestProbe:
+    """Measures one request in progress; filled in by the client."""
+
+    __slots__ = (
+        "method",
+        "endpoint",
+        "url",
+        "started",
+        "attempts",
+        "status",
+        "bytes_received",
+        "decode_time",
+        "error",
+        "_metrics",
+    )
+
+    def __init__(self, metrics, method, endpoint, url):
+        """Start measuring a request."""
+        self.method = method
+        self.endpoint = endpoint
+        self.url = url
+        self.started = time.perf_counter()
+        self.attempts = 0
+        self.status = None
+        self.bytes_received = 0
+        self.decode_time = 0.0
+        self.error = None
+        self._metrics = metrics
+
+    def finish(self):
+        """Record the request, once it completed or failed."""
+        error = self.error
+        if error is None:
+            failure = classify_status(self.status)
+            error = failure.value if failure is not None else None
+        self._metrics.record(
+            RequestRecord(
+                self.method,
+                self.endpoint,
+                self.url,
+                self.status,
+                time.perf_counter() - self.started,
+                self.bytes_received,
+                self.decode_time,
+                max(self.attempts - 1, 0),
+                error,
+            )
+        )
+
+
+class _Totals:
+    """The mutable counters behind an EndpointStats."""
+
+    __slots__ = (
+        "requests",
+        "errors",
+        "retries",
+        "bytes_received",
+        "decode_time",
+        "buckets",
+        "sum",
+        "shared",
+    )
+
+    def __init__(self, bucket_count):
+        self.requests = 0
+        self.shared = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_received = 0
+        self.decode_time = 0.0
+        self.buckets = [0] * (bucket_count + 1)
+        self.sum = 0.0
+
+
+class Metrics:
+    """Counts the requests of a client per endpoint and runs the request hooks.
+
+    Pre-request hooks are called with the method, endpoint template and url
+    of each request before it is sent, post-request hooks with its
+    RequestRecord once it completed. Hooks run on the requesting thread (or
+    event loop) and should be quick. A Metrics can be shared by clients.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Create zeroed metrics with latency histograms of the given buckets."""
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._logins = 0
+        self._token_refreshes = 0
+        self._pre_hooks = []
+        self._post_hooks = []
+
+    def add_pre_hook(self, hook) -> Callable[[], None]:
+        """Call hook(method, endpoint, url) before each request; returns its remover."""
+        self._pre_hooks.append(hook)
+        return lambda: self._pre_hooks.remove(hook)
+
+    def add_post_hook(self, hook) -> Callable[[], None]:
+        """Call hook(record) after each request; returns its remover."""
+        self._post_hooks.append(hook)
+        return lambda: self._post_hooks.remove(hook)
+
+    def start(self, method, url) -> RequestProbe:
+        """Start measuring a request to an API url, running the pre-request hooks."""
+        method = method.upper()
+        endpoint = endpoint_template(url)
+        for hook in list(self._pre_hooks):
+            hook(method, endpoint, url)
+        return RequestProbe(self, method, endpoint, url)
+
+    def record(self, record):
+        """Add a completed request to the totals, running the post-request hooks."""
+        with self._lock:
+            totals = self._totals(record.method, record.endpoint)
+            totals.requests += 1
+            totals.errors += record.error is not None
+            totals.retries += record.retries
+            totals.bytes_received += record.bytes_received
+            totals.decode_time += record.decode_time
+            totals.buckets[bisect_left(self._buckets, record.elapsed)] += 1
+            totals.sum += record.elapsed
+        for hook in list(self._post_hooks):
+            hook(record)
+
+    def record_shared(self, method, url):
+        """Count a request saved by waiting for an identical one in flight."""
+        with self._lock:
+            self._totals(method.upper(), endpoint_template(url)).shared += 1
+
+    def record_login(self):
+        """Count a login with the username and password."""
+        with self._lock:
+            self._logins += 1
+
+    def record_token_refresh(self):
+        """Count a renewal of the access token with the refresh token."""
+        with self._lock:
+            self._token_refreshes += 1
+
+    def reset(self):
+        """Zero all counters, keeping the hooks."""
+        with self._lock:
+            self._endpoints.clear()
+            self._logins = 0
+            self._token_refreshes = 0
+
+    def snapshot(self) -> MetricsSnapshot:
+        """Get a copy of the current metrics."""
+        with self._lock:
+            endpoints = [
+                EndpointStats(
+                    method,
+                    endpoint,
+                    totals.requests,
+                    totals.errors,
+                    totals.retries,
+                    totals.bytes_received,
+                    totals.decode_time,
+                    totals.sum,
+                    self._cumulative(totals.buckets),
+                    totals.shared,
+                )
+                for (method, endpoint), totals in self._endpoints.items()
+            ]
+            logins, token_refreshes = self._logins, self._token_refreshes
+        endpoints.sort(key=lambda stats: stats.latency_sum, reverse=True)
+        return MetricsSnapshot(endpoints, logins, token_refreshes)
+
+    def to_prometheus(self, prefix="zoneminder") -> str:
+        """Export the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.extend(f"{prefix}_{sample}" for sample in samples)
+
+        def labels(stats, **extra) -> str:
+            pairs = {"method": stats.method, "endpoint": stats.endpoint, **extra}
+            return ",".join(f'{key}="{_escape(value)}"' for key, value in pairs.items())
+
+        stats = snapshot.endpoints
+        for name, field, help_text in (
+            ("requests_total", "requests", "API requests."),
+            ("request_errors_total", "errors", "API requests that failed."),
+            ("request_retries_total", "retries", "Retries of API requests."),
+            ("received_bytes_total", "bytes_received", "Bytes of API responses."),
+            ("json_decode_seconds_total", "decode_time", "Time spent decoding responses."),
+            ("requests_shared_total", "shared", "API requests saved by sharing one in flight."),
+        ):
+            family(
+                name,
+                "counter",
+                help_text,
+                (f"{name}{{{labels(item)}}} {getattr(item, field)}" for item in stats),
+            )
+
+        samples = []
+        for item in stats:
+            for bound, count in item.latency_buckets:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append(f"request_duration_seconds_bucket{{{labels(item, le=le)}}} {count}")
+            samples.append(f"request_duration_seconds_sum{{{labels(item)}}} {item.latency_sum}")
+            samples.append(f"request_duration_seconds_count{{{labels(item)}}} {item.requests}")
+        family("request_duration_seconds", "histogram", "Duration of API requests.", samples)
+        family("logins_total", "counter", "Logins.", [f"logins_total {snapshot.logins}"])
+        family(
+            "token_refreshes_total",
+            "counter",
+            "Access token refreshes.",
+            [f"token_refreshes_total {snapshot.token_refreshes}"],
+        )
+        return "\n".join(lines) + "\n"
+
+    def _totals(self, method, endpoint) -> _Totals:
+        """Get the totals of an endpoint, creating them if needed; the lock must be held."""
+        totals = self._endpoints.get((method, endpoint))
+        if totals is None:
+            totals = self._endpoints[(method, endpoint)] = _Totals(len(self._buckets))
+        return totals
+
+    def _cumulative(self, buckets) -> Tuple[Tuple[float, int], ...]:
+        """Turn per bucket counts into cumulative (upper bound, count) pairs."""
+        total = 0
+        cumulative = []
+        for bound, count in zip(self._buckets + (float("inf"),), buckets):
+            total += count
+            cumulative.append((bound, total))
+        return tuple(cumulative)
+
+
+def _escape(value) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,356 @@
+"""Read the multipart MJPEG streams served by ZoneMinder's nph-zms."""
+
+import logging
+import re
+import threading
+import time
+from typing import List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+_CONTENT_LENGTH = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+
+
+class StreamStats:
+    """Counters of an MJPEG stream, updated as frames are read."""
+
+    def __init__(self):
+        """Create zeroed counters, starting the clock now."""
+        self.started = time.monotonic()
+        self.bytes_received = 0
+        self.frames_received = 0
+        self.frames_yielded = 0
+        self.frames_dropped = 0
+
+    @property
+    def elapsed(self) -> float:
+        """Get the seconds since the stream was opened."""
+        return time.monotonic() - self.started
+
+    @property
+    def fps(self) -> float:
+        """Get the rate of frames handed to the consumer."""
+        elapsed = self.elapsed
+        return self.frames_yielded / elapsed if elapsed else 0.0
+
+    @property
+    def receive_fps(self) -> float:
+        """Get the rate of frames received from ZoneMinder."""
+        elapsed = self.elapsed
+        return self.frames_received / elapsed if elapsed else 0.0
+
+    def __repr__(self) -> str:
+        """Representation of the counters."""
+        return (
+            f"{self.__class__.__name__}(frames={self.frames_yielded}, "
+            f"dropped={self.frames_dropped}, bytes={self.bytes_received}, fps={self.fps:.1f})"
+        )
+
+
+class MjpegParser:
+    """Incrementally locates the JPEG frames of a multipart MJPEG stream.
+
+    Received data is copied once into a reusable buffer; frames are returned
+    as memoryviews of that buffer, which are released (and become unusable)
+    on the next call to feed. Frames are delimited by the Content-Length of
+    their part header, or by the JPEG start and end markers when the part has
+    no Content-Length.
+    """
+
+    DEFAULT_BUFFER_SIZE = 256 * 1024
+    MAX_HEADER_SIZE = 64 * 1024
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Create a parser with an initial buffer of buffer_size bytes."""
+        self._buffer = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+        self._views = []
+
+    def feed(self, data) -> List[memoryview]:
+        """Add received data and get the frames it completed."""
+        self._release()
+        self._reserve(len(data))
+        self._buffer[self._end : self._end + len(data)] = data
+        self._end += len(data)
+
+        frames = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def _next_frame(self) -> Optional[memoryview]:
+        """Cut the next complete frame from the buffer, if there is one."""
+        buffer = self._buffer
+        soi = buffer.find(JPEG_SOI, self._start, self._end)
+        if soi < 0:
+            if self._end - self._start > MjpegParser.MAX_HEADER_SIZE:
+                # Not a part header, skip it but keep a trailing 0xFF which may
+                # be the first half of a marker
+                self._start = self._end - 1
+            return None
+
+        match = _CONTENT_LENGTH.search(buffer, self._start, soi)
+        if match:
+            frame_end = soi + int(match.group(1))
+            if frame_end > self._end:
+                return None
+        else:
+            eoi = buffer.find(JPEG_EOI, soi + 2, self._end)
+            if eoi < 0:
+                return None
+            frame_end = eoi + 2
+
+        self._start = frame_end
+        view = memoryview(buffer)[soi:frame_end]
+        self._views.append(view)
+        return view
+
+    def _reserve(self, size):
+        """Make room for size more bytes after the data still to be parsed.
+
+        The unparsed data is moved to the front of the buffer, which is only
+        reallocated when that is not enough.
+        """
+        if self._end + size <= len(self._buffer):
+            return
+        self._release()
+        pending = self._end - self._start
+        if pending + size > len(self._buffer):
+            grown = bytearray(max(2 * len(self._buffer), pending + size))
+            grown[:pending] = memoryview(self._buffer)[self._start : self._end]
+            self._buffer = grown
+        else:
+            self._buffer[:pending] = memoryview(self._buffer)[self._start : self._end]
+        self._start = 0
+        self._end = pending
+
+    def _release(self):
+        """Release the frames handed out so the buffer can be reused."""
+        for view in self._views:
+            view.release()
+        self._views.clear()
+
+
+class _FrameSelector:
+    """Applies the decimation options shared by the sync and async streams."""
+
+    def __init__(self, every, latest, copy, stats):
+        self._every = max(1, every)
+        self._latest = latest
+        self._copy = copy
+        self._stats = stats
+
+    def select(self, frames) -> list:
+        """Get the frames to hand to the consumer out of those just parsed."""
+        stats = self._stats
+        selected = []
+        for frame in frames:
+            stats.frames_received += 1
+            if stats.frames_received % self._every:
+                stats.frames_dropped += 1
+                continue
+            selected.append(frame)
+        if self._latest and len(selected) > 1:
+            stats.frames_dropped += len(selected) - 1
+            selected = selected[-1:]
+        stats.frames_yielded += len(selected)
+        if self._copy:
+            return [bytes(frame) for frame in selected]
+        return selected
+
+
+class MjpegStream:
+    """Iterates over the frames of a Monitor's MJPEG stream.
+
+    Frames are memoryviews that are only valid until the next frame is
+    requested, unless copy is set in which case they are bytes. With every
+    set to N only every Nth frame is returned, and with latest set only the
+    newest frame received is (the others are dropped rather than queued):
+    the stream is then read on a thread keeping a copy of the newest frame,
+    so that a slow consumer does not fall behind the frames buffered by the
+    connection. Use as a context manager, or call close, to stop streaming.
+    """
+
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        session,
+        url,
+        every=1,
+        latest=False,
+        copy=False,
+        timeout=10,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+    ):
+        """Open the stream at url with a requests session."""
+        self.stats = StreamStats()
+        self._response = session.get(url, stream=True, timeout=timeout)
+        try:
+            self._response.raise_for_status()
+        except Exception:
+            self._response.close()
+            raise
+        self._chunks = self._response.iter_content(chunk_size)
+        self._parser = MjpegParser()
+        # The frames kept by the reader outlive the parser's buffer
+        self._selector = _FrameSelector(every, latest, copy or latest, self.stats)
+        self._pending = []
+        self._copy = copy
+        self._closed = False
+        self._reader = None
+        if latest:
+            self._newest = None
+            self._done = False
+            self._error = None
+            self._changed = threading.Condition()
+            self._reader = threading.Thread(target=self._read, name="zm-mjpeg", daemon=True)
+            self._reader.start()
+
+    def __enter__(self):
+        """Enter the runtime context, returning this stream."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Exit the runtime context and close the stream."""
+        self.close()
+
+    def __iter__(self):
+        """Iterate over the frames of the stream."""
+        return self
+
+    def __next__(self):
+        """Get the next frame, reading from the stream as needed."""
+        if self._reader is not None:
+            return self._next_newest()
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.close()
+                raise StopIteration
+            self.stats.bytes_received += len(chunk)
+            self._pending = self._selector.select(self._parser.feed(chunk))
+        return self._pending.pop(0)
+
+    def close(self):
+        """Stop streaming and release the connection."""
+        self._closed = True
+        self._response.close()
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join(1)
+        _LOGGER.debug("Closed MJPEG stream: %s", self.stats)
+
+    def _next_newest(self):
+        """Wait for a frame newer than the last one returned."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._newest is not None or self._done)
+            frame, self._newest = self._newest, None
+        if frame is None:
+            self.close()
+            if self._error is not None:
+                raise self._error
+            raise StopIteration
+        return frame if self._copy else memoryview(frame)
+
+    def _read(self):
+        """Read the stream until it ends, keeping the newest frame only."""
+        try:
+            for chunk in self._chunks:
+                self.stats.bytes_received += len(chunk)
+                frames = self._selector.select(self._parser.feed(chunk))
+                if not frames:
+                    continue
+                with self._changed:
+                    if self._newest is not None:
+                        # Never handed to the consumer
+                        self.stats.frames_yielded -= 1
+                        self.stats.frames_dropped += 1
+                    self._newest = frames[-1]
+                    self._changed.notify()
+        except Exception as err:  # pylint: disable=broad-except
+            if not self._closed:
+                self._error = err
+        finally:
+            with self._changed:
+                self._done = True
+                self._changed.notify()
+
+
+class AsyncMjpegStream:
+    """Asynchronously iterates over the frames of a Monitor's MJPEG stream.
+
+    The asyncio flavour of MjpegStream, reading with an aiohttp session.
+    With latest set each read also takes all the data received meanwhile,
+    so that a slow consumer is handed the newest frame.
+    """
+
+    def __init__(
+        self,
+        session,
+        url,
+        timeout,
+        every=1,
+        latest=False,
+        copy=False,
+        chunk_size=MjpegStream.DEFAULT_CHUNK_SIZE,
+    ):
+        """Prepare to stream url with an aiohttp session and ClientTimeout.
+
+        The stream is opened on first use.
+        """
+        self.stats = StreamStats()
+        self._session = session
+        self._url = url
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+        self._response = None
+        self._parser = MjpegParser()
+        self._latest = latest
+        self._selector = _FrameSelector(every, latest, copy, self.stats)
+        self._pending = []
+
+    async def __aenter__(self):
+        """Enter the runtime context, returning this stream."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Exit the runtime context and close the stream."""
+        self.close()
+
+    def __aiter__(self):
+        """Iterate over the frames of the stream."""
+        return self
+
+    async def __anext__(self):
+        """Get the next frame, reading from the stream as needed."""
+        if self._response is None:
+            response = await self._session.get(self._url, timeout=self._timeout)
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.close()
+                raise
+            self._response = response
+            self.stats.started = time.monotonic()
+        while not self._pending:
+            chunk = await self._response.content.read(self._chunk_size)
+            if not chunk:
+                self.close()
+                raise StopAsyncIteration
+            if self._latest:
+                chunk += self._response.content.read_nowait()
+            self.stats.bytes_received += len(chunk)
+            self._pending = self._selector.select(self._parser.feed(chunk))
+        return self._pending.pop(0)
+
+    def close(self):
+        """Stop streaming and release the connection."""
+        if self._response is not None:
+            self._response.close()
+        _LOGGER.debug("Closed MJPEG stream: %s", self.stats)
@@ -2,12 +2,15 @@
 
 from enum import Enum
 import logging
-from typing import Optional
+import sys
+from typing import Iterator, NamedTuple, Optional
 from urllib.parse import urlencode
 
-from requests import post
-
+from .cache import CachedValue, StateKind
+from .events import Event
 from .exceptions import ControlTypeError, MonitorControlTypeError
+from .mjpeg import MjpegStream
+from .shm import MonitorShmState
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -83,30 +86,65 @@ class TimePeriod(Enum):
     MONTH = ("month", "Events Last Month")
 
 
-class Monitor:
-    """Represents a Monitor from ZoneMinder."""
+class MonitorConfig(NamedTuple):
+    """The fields of a monitors.json entry that a Monitor uses."""
+
+    name: str
+    function: str
+    controllable: bool
+    stream_replay_buffer: str
+    capture_fps: Optional[str]
+
+    @classmethod
+    def from_raw(cls, raw_result) -> "MonitorConfig":
+        """Keep the used fields of a monitors.json entry, dropping the others."""
+        raw_monitor = raw_result["Monitor"]
+        # Monitor_Status was only added in ZM 1.32.3
+        monitor_status = raw_result.get("Monitor_Status")
+        return cls(
+            raw_monitor["Name"],
+            # Shared by the Monitors having the same values
+            sys.intern(raw_monitor["Function"]),
+            bool(int(raw_monitor["Controllable"])),
+            sys.intern(str(raw_monitor["StreamReplayBuffer"])),
+            monitor_status["CaptureFPS"] if monitor_status else None,
+        )
+
+
+class BaseMonitor:
+    """Represents the parts of a ZoneMinder Monitor that need no network I/O.
+
+    Shared by the blocking Monitor and the asyncio AsyncMonitor. Only the
+    MonitorConfig is kept of the monitors.json entry, and image urls are
+    built when asked for, with the current auth token.
+    """
+
+    __slots__ = ("_client", "_monitor_id", "_config")
+
+    # Seconds to wait for the response to a PTZ control request
+    DEFAULT_PTZ_TIMEOUT = 10
 
     def __init__(self, client, raw_result):
         """Create a new Monitor."""
         self._client = client
-        self._raw_result = raw_result
-        raw_monitor = raw_result["Monitor"]
-        self._monitor_id = int(raw_monitor["Id"])
-        self._monitor_url = f"api/monitors/{self._monitor_id}.json"
-        self._name = raw_monitor["Name"]
-        self._controllable = bool(int(raw_monitor["Controllable"]))
-        self._mjpeg_image_url = self._build_image_url(raw_monitor, "jpeg")
-        self._still_image_url = self._build_image_url(raw_monitor, "single")
-        self._fmt = "{}(id={}, name={}, controllable={})"
+        self._monitor_id = int(raw_result["Monitor"]["Id"])
+        self._config = MonitorConfig.from_raw(raw_result)
 
     def __repr__(self) -> str:
         """Representation of a Monitor."""
-        return self._fmt.format(self.__class__.__name__, self.id, self.name)
+        return (
+            f"{self.__class__.__name__}(id={self.id}, name={self.name}, "
+            f"controllable={self.controllable})"
+        )
 
     def __str__(self) -> str:
         """Representation of a Monitor."""
         return self.__repr__()
 
+    def update_from_raw(self, raw_result):
+        """Update this Monitor from its entry of a monitors.json response."""
+        self._config = MonitorConfig.from_raw(raw_result)
+
     @property
     def id(self) -> int:
         """Get the ZoneMinder id number of this Monitor."""
@@ -116,48 +154,70 @@ class Monitor:
     @property
     def name(self) -> str:
         """Get the name of this Monitor."""
-        return self._name
+        return self._config.name
 
-    def update_monitor(self):
-        """Update the monitor and monitor status from the ZM server."""
-        result = self._client.get_state(self._monitor_url)
-        self._raw_result = result["monitor"]
+    @property
+    def config(self) -> MonitorConfig:
+        """Get the configuration of this Monitor, as last fetched."""
+        return self._config
 
     @property
-    def function(self) -> MonitorState:
-        """Get the MonitorState of this Monitor."""
-        self.update_monitor()
+    def _monitor_url(self) -> str:
+        """Get the API url of this Monitor."""
+        return f"api/monitors/{self._monitor_id}.json"
 
-        return MonitorState(self._raw_result["Monitor"]["Function"])
+    @property
+    def _alarm_status_url(self) -> str:
+        """Get the API url reporting the alarm state of this Monitor."""
+        return f"api/monitors/alarm/id:{self._monitor_id}/command:status.json"
 
-    @function.setter
-    def function(self, new_function):
-        """Set the MonitorState of this Monitor."""
-        self._client.change_state(self._monitor_url, {"Monitor[Function]": new_function.value})
+    @property
+    def _daemon_status_url(self) -> str:
+        """Get the API url reporting the capture daemon state of this Monitor."""
+        return f"api/monitors/daemonStatus/id:{self._monitor_id}/daemon:zmc.json"
 
     @property
     def controllable(self) -> bool:
         """Indicate whether this Monitor is movable."""
-        return self._controllable
+        return self._config.controllable
 
     @property
     def mjpeg_image_url(self) -> str:
         """Get the motion jpeg (mjpeg) image url of this Monitor."""
-        return self._mjpeg_image_url
+        return self._build_image_url("jpeg")
 
     @property
     def still_image_url(self) -> str:
         """Get the still jpeg image url of this Monitor."""
-        return self._still_image_url
+        return self._build_image_url("single")
 
     @property
-    def is_recording(self) -> Optional[bool]:
-        """Indicate if this Monitor is currently recording."""
-        status_response = self._client.get_state(
-            f"api/monitors/alarm/id:{self._monitor_id}/command:status.json"
-        )
+    def shm_state(self) -> Optional[MonitorShmState]:
+        """Get the live state of this Monitor from the client's ShmBackend.
 
-        if not status_response:
+        None when the client has no ShmBackend or the state cannot be read.
+        """
+        backend = self._client.shm_backend
+        return None if backend is None else backend.read(self._monitor_id)
+
+    def _recording_from_shm(self) -> Optional[bool]:
+        """Read whether this Monitor is alarming from shared memory, if possible."""
+        backend = self._client.shm_backend
+        return None if backend is None else backend.is_recording(self._monitor_id)
+
+    def _available_from_shm(self) -> Optional[bool]:
+        """Read whether this Monitor is capturing from shared memory, if possible."""
+        backend = self._client.shm_backend
+        return None if backend is None else backend.is_available(self._monitor_id)
+
+    def _function_from_raw(self) -> MonitorState:
+        """Get the MonitorState from the last fetched monitor."""
+        return MonitorState(self._config.function)
+
+    def _recording_from_status(self, status_response) -> Optional[bool]:
+        """Decode the response of the alarm status API."""
+        # Failed requests answer with an error body, if any
+        if "status" not in status_response:
             _LOGGER.warning("Could not get status for monitor %s.", self._monitor_id)
             return None
 
@@ -169,43 +229,16 @@ class Monitor:
         except ValueError:
             return False
 
-    @property
-    def is_available(self) -> bool:
-        """Indicate if this Monitor is currently available."""
-        status_response = self._client.get_state(
-            f"api/monitors/daemonStatus/id:{self._monitor_id}/daemon:zmc.json"
-        )
-
-        if not status_response:
+    def _available_from_status(self, status_response) -> bool:
+        """Decode the response of the zmc daemon status API."""
+        if "status" not in status_response:
             _LOGGER.warning("Could not get availability for monitor %s.", self._monitor_id)
             return False
 
-        # Monitor_Status was only added in ZM 1.32.3
-        monitor_status = self._raw_result.get("Monitor_Status", None)
-        capture_fps = monitor_status and monitor_status["CaptureFPS"]
-
-        return status_response.get("status", False) and capture_fps != "0.00"
-
-    def get_events(self, time_period, include_archived=False) -> Optional[int]:
-        """Get the number of events that have occurred on this Monitor.
-
-        Specifically only gets events that have occurred within the TimePeriod
-        provided.
-        """
-        date_filter = f"1%20{time_period.period}"
-        if time_period == TimePeriod.ALL:
-            # The consoleEvents API uses DATE_SUB, so give it
-            # something large
-            date_filter = "100%20year"
-
-        archived_filter = "/Archived=:0"
-        if include_archived:
-            archived_filter = ""
-
-        event = self._client.get_state(
-            f"api/events/consoleEvents/{date_filter}{archived_filter}.json"
-        )
+        return status_response.get("status", False) and self._config.capture_fps != "0.00"
 
+    def _events_from_response(self, event) -> Optional[int]:
+        """Get the number of events of this Monitor from a consoleEvents response."""
         try:
             events_by_monitor = event["results"]
             if isinstance(events_by_monitor, list):
@@ -214,34 +247,219 @@ class Monitor:
         except (TypeError, KeyError, AttributeError):
             return None
 
-    def _build_image_url(self, monitor, mode) -> str:
+    def _build_image_url(self, mode) -> str:
         """Build and return a ZoneMinder camera image url."""
         query = urlencode(
             {
                 "mode": mode,
-                "buffer": monitor["StreamReplayBuffer"],
-                "monitor": monitor["Id"],
+                "buffer": self._config.stream_replay_buffer,
+                "monitor": self._monitor_id,
             }
         )
         url = f"{self._client.get_zms_url()}?{query}"
-        _LOGGER.debug("Monitor %s %s URL (without auth): %s", monitor["Id"], mode, url)
+        _LOGGER.debug("Monitor %s %s URL (without auth): %s", self._monitor_id, mode, url)
         return self._client.get_url_with_auth(url)
 
-    def ptz_control_command(self, direction, token, base_url) -> bool:
-        """Move camera."""
+    def _ptz_params(self, direction, token) -> dict:
+        """Build the query of a PTZ control request."""
         if not self.controllable:
             raise MonitorControlTypeError()
 
-        ptz_url = f"{base_url}index.php"
-
         params = {
             "view": "request",
             "request": "control",
             "id": self.id,
             "control": ControlType.from_move(direction).value,
             "xge": 43,
-            "token": token,
         }
+        if token:
+            params["token"] = token
+        return params
 
-        req = post(url=ptz_url, params=params, timeout=10)
+
+class Monitor(BaseMonitor):
+    """Represents a Monitor from ZoneMinder.
+
+    Reads go through the client's StateCache: a value younger than the TTL
+    configured for its StateKind is served without a request to the server.
+    """
+
+    __slots__ = ()
+
+    def update_monitor(self):
+        """Update the monitor and monitor status from the ZM server."""
+        result = self._client.get_state(self._monitor_url)
+        self.update_from_raw(result["monitor"])
+
+    def update_from_raw(self, raw_result, ttl=None):
+        """Update this Monitor from its monitors.json entry, caching it as its CONFIG."""
+        super().update_from_raw(raw_result)
+        self._client.state_cache.put(self._monitor_id, StateKind.CONFIG, self._config, ttl)
+
+    def refresh(self, raw_result=None, snapshot=True):
+        """Refresh the cached function, alarm and daemon status of this Monitor.
+
+        raw_result is this Monitor's entry of an already fetched monitors.json
+        response; the monitor itself is only fetched when it is not given.
+        The refreshed values stay fresh for at least the client's
+        snapshot_ttl, or only for the TTL of their kind with snapshot False.
+        Alarm and daemon statuses that could not be read are not cached, so
+        that they are read again rather than reported missing for a TTL.
+        """
+        ttl = self._client.snapshot_ttl if snapshot else None
+        if raw_result is None:
+            raw_result = self._client.get_state(self._monitor_url)["monitor"]
+        self.update_from_raw(raw_result, ttl)
+        cache = self._client.state_cache
+        cache.put(self._monitor_id, StateKind.FUNCTION, self._function_from_raw(), ttl)
+        is_recording = self._fetch_recording()
+        if is_recording is not None:
+            cache.put(self._monitor_id, StateKind.ALARM, is_recording, ttl)
+        is_available = self._fetch_available()
+        if is_available is not None:
+            cache.put(self._monitor_id, StateKind.DAEMON, is_available, ttl)
+
+    def cached(self, kind) -> Optional[CachedValue]:
+        """Get the last known value of a StateKind and its age, without blocking.
+
+        The value may have expired; None is returned if it was never fetched.
+        """
+        return self._client.state_cache.peek(self._monitor_id, kind)
+
+    def invalidate(self, kind=None):
+        """Expire the cached state of this Monitor (of one StateKind or all)."""
+        self._client.state_cache.invalidate(self._monitor_id, kind)
+
+    @property
+    def function(self) -> MonitorState:
+        """Get the MonitorState of this Monitor."""
+        cache = self._client.state_cache
+        cached = cache.get(self._monitor_id, StateKind.FUNCTION)
+        if cached is not None:
+            return cached.value
+
+        if cache.get(self._monitor_id, StateKind.CONFIG) is None:
+            self.update_monitor()
+
+        function = self._function_from_raw()
+        cache.put(self._monitor_id, StateKind.FUNCTION, function)
+        return function
+
+    @function.setter
+    def function(self, new_function):
+        """Set the MonitorState of this Monitor."""
+        self._client.change_state(self._monitor_url, {"Monitor[Function]": new_function.value})
+        self.invalidate(StateKind.FUNCTION)
+        self.invalidate(StateKind.CONFIG)
+
+    def change_function(self, new_function) -> bool:
+        """Set the MonitorState of this Monitor, returning whether ZoneMinder saved it.
+
+        Unlike the function setter, the cached function and configuration
+        are updated in place when the change was saved, so that the next read
+        needs no request; they are expired when it was not. ZoneMinder
+        answers a failed save with {"message": "Error"} and a status of 200,
+        so only a "Saved" message counts as saved.
+        """
+        response = self._client.change_state(
+            self._monitor_url, {"Monitor[Function]": new_function.value}
+        )
+        if response.get("message") != "Saved":
+            _LOGGER.warning("Could not set the function of monitor %s", self._monitor_id)
+            self.invalidate(StateKind.FUNCTION)
+            self.invalidate(StateKind.CONFIG)
+            return False
+
+        self._config = self._config._replace(function=sys.intern(new_function.value))
+        cache = self._client.state_cache
+        cache.put(self._monitor_id, StateKind.CONFIG, self._config)
+        cache.put(self._monitor_id, StateKind.FUNCTION, new_function)
+        return True
+
+    @property
+    def is_recording(self) -> Optional[bool]:
+        """Indicate if this Monitor is currently recording."""
+        cached = self._client.state_cache.get(self._monitor_id, StateKind.ALARM)
+        if cached is not None:
+            return cached.value
+
+        is_recording = self._fetch_recording()
+        if is_recording is not None:
+            self._client.state_cache.put(self._monitor_id, StateKind.ALARM, is_recording)
+        return is_recording
+
+    @property
+    def is_available(self) -> bool:
+        """Indicate if this Monitor is currently available."""
+        cached = self._client.state_cache.get(self._monitor_id, StateKind.DAEMON)
+        if cached is not None:
+            return cached.value
+
+        is_available = self._fetch_available()
+        if is_available is None:
+            return False
+        self._client.state_cache.put(self._monitor_id, StateKind.DAEMON, is_available)
+        return is_available
+
+    def _fetch_recording(self) -> Optional[bool]:
+        """Fetch whether this Monitor is recording, None if that could not be read.
+
+        Reads shared memory, or else the ZM server.
+        """
+        recording = self._recording_from_shm()
+        if recording is not None:
+            return recording
+        return self._recording_from_status(self._client.get_state(self._alarm_status_url))
+
+    def _fetch_available(self) -> Optional[bool]:
+        """Fetch whether this Monitor is available, None if that could not be read.
+
+        Reads shared memory, or else the ZM server.
+        """
+        available = self._available_from_shm()
+        if available is not None:
+            return available
+        status_response = self._client.get_state(self._daemon_status_url)
+        available = self._available_from_status(status_response)
+        return available if "status" in status_response else None
+
+    def get_events(self, time_period, include_archived=False) -> Optional[int]:
+        """Get the number of events that have occurred on this Monitor.
+
+        Specifically only gets events that have occurred within the TimePeriod
+        provided.
+        """
+        event = self._client.get_console_events(time_period, include_archived)
+        return self._events_from_response(event)
+
+    def iter_events(self, **kwargs) -> Iterator[Event]:
+        """Iterate lazily over the Events of this Monitor, see ZoneMinder.iter_events."""
+        return self._client.iter_events(monitor_id=self._monitor_id, **kwargs)
+
+    def get_snapshot(self, max_age=None) -> Optional[bytes]:
+        """Get a still JPEG image of this Monitor, see ZoneMinder.get_snapshot."""
+        return self._client.get_snapshot(self, max_age)
+
+    def stream_frames(self, every=1, latest=False, copy=False) -> MjpegStream:
+        """Stream the JPEG frames of this Monitor's mjpeg_image_url.
+
+        Returns an iterator of frames, see MjpegStream for the decimation
+        options and the lifetime of the frames; its stats attribute reports
+        the frame rate and bytes received.
+        """
+        return MjpegStream(
+            self._client.session,
+            self.mjpeg_image_url,
+            every=every,
+            latest=latest,
+            copy=copy,
+            timeout=self._client.DEFAULT_TIMEOUT,
+        )
+
+    def ptz_control_command(
+        self, direction, token, base_url, timeout=BaseMonitor.DEFAULT_PTZ_TIMEOUT
+    ) -> bool:
+        """Move camera."""
+        params = self._ptz_params(direction, token)
+        req = self._client.session.post(url=f"{base_url}index.php", params=params, timeout=timeout)
         return bool(req.ok)
@@ -0,0 +1,397 @@
+"""Poll ZoneMinder in the background and report the changes of its state."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import inspect
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from zoneminder.cache import StateKind
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Source(Enum):
+    """Represents what a Change was observed on."""
+
+    MONITOR = "monitor"
+    RUN_STATE = "run_state"
+    SERVER = "server"
+
+
+class Change(NamedTuple):
+    """A change of one field of the state of ZoneMinder.
+
+    key is the Monitor id for Source.MONITOR and None otherwise; old is
+    None the first time a field is read.
+    """
+
+    source: Source
+    key: Optional[int]
+    field: str
+    old: Any
+    new: Any
+
+
+class RateLimiter:
+    """A token bucket capping the rate of requests, shared by threads.
+
+    reserve takes tokens right away and returns how long to wait before
+    spending them, so callers queue up behind each other fairly.
+    """
+
+    def __init__(self, rate, burst=None):
+        """Allow rate requests per second on average, and burst at once.
+
+        A rate of None (or 0) disables the limit.
+        """
+        self._rate = rate
+        self._burst = burst or rate
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost=1) -> float:
+        """Take cost tokens and get the seconds to wait before using them."""
+        if not self._rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= cost
+            return max(0.0, -self._tokens / self._rate)
+
+
+class _Target:
+    """Something polled on its own schedule, with the values last read."""
+
+    __slots__ = ("source", "key", "item", "cost", "interval", "due", "values", "busy")
+
+    def __init__(self, source, key, item, cost, interval):
+        self.source = source
+        self.key = key
+        self.item = item
+        self.cost = cost
+        self.interval = interval
+        self.due = 0.0
+        self.values = None
+        self.busy = False
+
+
+class BasePoller:
+    """The scheduling of Poller and AsyncPoller, without any I/O.
+
+    Each Monitor, the run states and the server are polled on their own
+    interval: every interval seconds while their state changes, faster
+    (alarm_interval) while a Monitor is alarming, slowing down by
+    IDLE_BACKOFF up to idle_interval while nothing changes, and doubling up
+    to max_interval while unreachable. Requests are capped at max_rate per
+    second for the whole server: the pollers of a client share its
+    poll_limiter. Values read are cached only for the client's usual TTLs.
+    """
+
+    DEFAULT_INTERVAL = 10.0
+    DEFAULT_ALARM_INTERVAL = 2.0
+    DEFAULT_IDLE_INTERVAL = 30.0
+    DEFAULT_MAX_INTERVAL = 300.0
+    DEFAULT_MAX_RATE = 20.0
+    IDLE_BACKOFF = 1.5
+
+    # Requests made by one poll of each Source
+    MONITOR_COST = 3
+    RUN_STATE_COST = 1
+    SERVER_COST = 1
+
+    def __init__(
+        self,
+        client,
+        monitors=None,
+        run_states=True,
+        server=True,
+        interval=DEFAULT_INTERVAL,
+        alarm_interval=DEFAULT_ALARM_INTERVAL,
+        idle_interval=DEFAULT_IDLE_INTERVAL,
+        max_interval=DEFAULT_MAX_INTERVAL,
+        max_rate=DEFAULT_MAX_RATE,
+    ):
+        """Create a poller for a client's Monitors (all of them when None)."""
+        self._client = client
+        self._monitors = monitors
+        self._interval = interval
+        self._alarm_interval = alarm_interval
+        self._idle_interval = max(idle_interval, interval)
+        self._max_interval = max(max_interval, interval)
+        self._limiter = client.poll_limiter(max_rate)
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._targets = []
+        if run_states:
+            self._targets.append(
+                _Target(Source.RUN_STATE, None, None, BasePoller.RUN_STATE_COST, interval)
+            )
+        if server:
+            self._targets.append(
+                _Target(Source.SERVER, None, None, BasePoller.SERVER_COST, interval)
+            )
+
+    def subscribe(self, callback, source=None) -> Callable[[], None]:
+        """Call callback with each Change (of one Source only, if given).
+
+        Returns a function that unsubscribes the callback.
+        """
+        subscriber = (callback, source)
+        self._subscribers.append(subscriber)
+        return lambda: self._subscribers.remove(subscriber)
+
+    def get(self, source, key=None) -> Optional[Dict[str, Any]]:
+        """Get the values last read from a Source, or None before its first poll."""
+        with self._lock:
+            for target in self._targets:
+                if target.source == source and target.key == key:
+                    return dict(target.values) if target.values is not None else None
+        return None
+
+    def intervals(self) -> Dict[tuple, float]:
+        """Get the current polling interval of each (Source, key)."""
+        with self._lock:
+            return {(target.source, target.key): target.interval for target in self._targets}
+
+    def _add_monitors(self, monitors):
+        """Start polling the given Monitors, unless they already are."""
+        with self._lock:
+            polled = {target.key for target in self._targets if target.source == Source.MONITOR}
+            self._targets.extend(
+                _Target(Source.MONITOR, monitor.id, monitor, BasePoller.MONITOR_COST, 0.0)
+                for monitor in monitors
+                if monitor.id not in polled
+            )
+
+    def _take_due(self, now) -> list:
+        """Get the targets due for a poll, marking them busy."""
+        with self._lock:
+            due = [target for target in self._targets if not target.busy and target.due <= now]
+            for target in due:
+                target.busy = True
+            return due
+
+    def _wait_time(self, now) -> Optional[float]:
+        """Get the seconds until the next target is due, None if all are busy."""
+        with self._lock:
+            pending = [target.due for target in self._targets if not target.busy]
+        return max(0.0, min(pending) - now) if pending else None
+
+    def _complete(self, target, values, now) -> List[Change]:
+        """Store the values a poll read (None if it failed) and schedule the next."""
+        with self._lock:
+            target.busy = False
+            previous = target.values
+            if values is None:
+                changes = []
+            else:
+                target.values = values
+                changes = [
+                    Change(target.source, target.key, field, (previous or {}).get(field), value)
+                    for field, value in values.items()
+                    if previous is None or previous.get(field) != value
+                ]
+            target.interval = self._next_interval(target, values, bool(changes))
+            target.due = now + target.interval
+        return changes
+
+    def _next_interval(self, target, values, changed) -> float:
+        """Adapt the interval of a target to what its last poll read."""
+        if values is None or values.get("available") is False:
+            return min(max(target.interval, self._interval) * 2, self._max_interval)
+        if values.get("recording"):
+            return self._alarm_interval
+        if changed or not target.interval:
+            return self._interval
+        return min(target.interval * BasePoller.IDLE_BACKOFF, self._idle_interval)
+
+    def _subscribers_of(self, change) -> list:
+        """Get the callbacks subscribed to a Change."""
+        return [
+            callback
+            for callback, source in list(self._subscribers)
+            if source in (None, change.source)
+        ]
+
+
+class Poller(BasePoller):
+    """Polls ZoneMinder from a background thread, calling back on changes.
+
+    Polls run on up to max_workers threads; callbacks are called from them.
+    Use as a context manager, or call start and stop.
+    """
+
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(self, client, monitors=None, max_workers=DEFAULT_MAX_WORKERS, **kwargs):
+        """Create a poller for a ZoneMinder client, see BasePoller for the options."""
+        super().__init__(client, monitors, **kwargs)
+        self._max_workers = max_workers
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        """Start polling, returning this poller."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop polling."""
+        self.stop()
+
+    def start(self):
+        """Start polling in a background thread."""
+        monitors = self._monitors
+        if monitors is None:
+            monitors = self._client.get_monitors()
+        self._add_monitors(monitors)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="zm-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling, waiting for the polls in progress."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Submit the targets as they become due, within the rate cap."""
+        with ThreadPoolExecutor(self._max_workers, thread_name_prefix="zm-poll") as executor:
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                for target in self._take_due(time.monotonic()):
+                    delay = self._limiter.reserve(target.cost)
+                    if delay and self._stop.wait(delay):
+                        return
+                    executor.submit(self._poll, target)
+                self._wakeup.wait(self._wait_time(time.monotonic()))
+
+    def _poll(self, target):
+        """Read a target, then report its changes."""
+        try:
+            values = self._read(target)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Could not poll %s %s", target.source.value, target.key, exc_info=True)
+            values = None
+        changes = self._complete(target, values, time.monotonic())
+        self._wakeup.set()
+        for change in changes:
+            for callback in self._subscribers_of(change):
+                try:
+                    callback(change)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error in poller callback %s", callback)
+
+    def _read(self, target) -> Dict[str, Any]:
+        """Read the current values of a target from ZoneMinder."""
+        if target.source == Source.MONITOR:
+            monitor = target.item
+            # Not as a snapshot, which would make other reads stale
+            monitor.refresh(snapshot=False)
+            return {
+                "function": monitor.cached(StateKind.FUNCTION).value,
+                "recording": monitor.cached(StateKind.ALARM).value,
+                "available": monitor.cached(StateKind.DAEMON).value,
+            }
+        if target.source == Source.RUN_STATE:
+            return {"active_state": self._client.get_active_state()}
+        return {"available": self._client.is_available}
+
+
+class AsyncPoller(BasePoller):
+    """Polls an AsyncZoneMinder from a task, calling back on changes.
+
+    Callbacks may be coroutine functions, which are awaited. Use as an async
+    context manager, or call start and stop.
+    """
+
+    def __init__(self, client, monitors=None, **kwargs):
+        """Create a poller for an AsyncZoneMinder, see BasePoller for the options."""
+        super().__init__(client, monitors, **kwargs)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._polls = set()
+
+    async def __aenter__(self):
+        """Start polling, returning this poller."""
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Stop polling."""
+        await self.stop()
+
+    async def start(self):
+        """Start polling in a task of the running event loop."""
+        monitors = self._monitors
+        if monitors is None:
+            monitors = await self._client.get_monitors()
+        self._add_monitors(monitors)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop polling, cancelling the polls in progress."""
+        tasks = list(self._polls)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        """Start polling the targets as they become due, within the rate cap."""
+        while True:
+            self._wakeup.clear()
+            for target in self._take_due(time.monotonic()):
+                delay = self._limiter.reserve(target.cost)
+                if delay:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(self._poll(target))
+                self._polls.add(task)
+                task.add_done_callback(self._polls.discard)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._wait_time(time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, target):
+        """Read a target, then report its changes."""
+        try:
+            values = await self._read(target)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Could not poll %s %s", target.source.value, target.key, exc_info=True)
+            values = None
+        changes = self._complete(target, values, time.monotonic())
+        self._wakeup.set()
+        for change in changes:
+            for callback in self._subscribers_of(change):
+                try:
+                    result = callback(change)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error in poller callback %s", callback)
+
+    async def _read(self, target) -> Dict[str, Any]:
+        """Read the current values of a target from ZoneMinder."""
+        if target.source == Source.MONITOR:
+            monitor = target.item
+            function, recording, available = await asyncio.gather(
+                monitor.get_function(), monitor.is_recording(), monitor.is_available()
+            )
+            return {"function": function, "recording": recording, "available": available}
+        if target.source == Source.RUN_STATE:
+            return {"active_state": await self._client.get_active_state()}
+        return {"available": await self._client.is_available()}
@@ -0,0 +1,392 @@
+"""Send PTZ moves without waiting, coalescing the ones a camera cannot keep up with."""
+
+import abc
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import logging
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+from zoneminder.exceptions import MonitorControlTypeError
+from zoneminder.monitor import BaseMonitor, ControlType
+from zoneminder.poller import RateLimiter
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PtzResult(NamedTuple):
+    """The outcome of one PTZ control request.
+
+    queued is the seconds the move waited to be sent, latency the seconds
+    the request took; coalesced counts the repeats of the move it stands for.
+    """
+
+    monitor_id: int
+    control: ControlType
+    ok: bool
+    queued: float
+    latency: float
+    coalesced: int
+
+
+class PtzStats(NamedTuple):
+    """The totals of a dispatcher.
+
+    superseded counts the moves replaced by another direction before being
+    sent, expired the ones dropped for waiting longer than max_age.
+    """
+
+    sent: int
+    failed: int
+    coalesced: int
+    superseded: int
+    expired: int
+    latency_sum: float
+
+    @property
+    def mean_latency(self) -> float:
+        """Get the mean duration of a control request, in seconds."""
+        return self.latency_sum / self.sent if self.sent else 0.0
+
+
+class _Lane:
+    """The move waiting to be sent to one Monitor, and when it may be."""
+
+    __slots__ = ("monitor", "control", "queued_at", "coalesced", "busy", "next_send")
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.control = None
+        self.queued_at = 0.0
+        self.coalesced = 0
+        self.busy = False
+        self.next_send = 0.0
+
+
+class BasePtzDispatcher(abc.ABC):
+    """The queueing of PtzDispatcher and AsyncPtzDispatcher, without any I/O.
+
+    Each Monitor has at most one move in flight and one waiting. A move
+    asked for while another waits replaces it: repeats of the same direction
+    are coalesced into one request, other directions supersede it. Moves
+    are sent at least min_interval seconds apart to a camera, at most
+    max_rate per second overall (ZoneMinder runs its control script for each
+    one), and dropped once nothing asked for them for max_age seconds.
+    """
+
+    DEFAULT_MIN_INTERVAL = 0.2
+    DEFAULT_MAX_RATE = 10.0
+    DEFAULT_MAX_AGE = 2.0
+    DEFAULT_TIMEOUT = 5.0
+
+    def __init__(
+        self,
+        client,
+        min_interval=DEFAULT_MIN_INTERVAL,
+        max_rate=DEFAULT_MAX_RATE,
+        max_age=DEFAULT_MAX_AGE,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        """Create a dispatcher of the PTZ moves of a client's Monitors."""
+        self._client = client
+        self._min_interval = min_interval
+        self._max_age = max_age
+        self._timeout = timeout
+        self._limiter = RateLimiter(max_rate)
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._subscribers = []
+        self._sent = 0
+        self._failed = 0
+        self._coalesced = 0
+        self._superseded = 0
+        self._expired = 0
+        self._latency_sum = 0.0
+
+    def move(self, monitor: BaseMonitor, direction):
+        """Queue a move of a Monitor, returning right away.
+
+        Raises ControlTypeError for an unknown direction and
+        MonitorControlTypeError if the Monitor is not controllable.
+        """
+        control = ControlType.from_move(direction)
+        if not monitor.controllable:
+            raise MonitorControlTypeError(monitor.id)
+        with self._lock:
+            lane = self._lanes.get(monitor.id)
+            if lane is None:
+                lane = self._lanes[monitor.id] = _Lane(monitor)
+            if lane.control is None:
+                lane.coalesced = 0
+            elif lane.control == control:
+                lane.coalesced += 1
+                self._coalesced += 1
+            else:
+                self._superseded += 1
+                lane.coalesced = 0
+            lane.control = control
+            lane.queued_at = time.monotonic()
+        self._wake()
+
+    def subscribe(self, callback) -> Callable[[], None]:
+        """Call callback with the PtzResult of each request; returns its unsubscriber."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def stats(self) -> PtzStats:
+        """Get the totals of this dispatcher."""
+        with self._lock:
+            return PtzStats(
+                self._sent,
+                self._failed,
+                self._coalesced,
+                self._superseded,
+                self._expired,
+                self._latency_sum,
+            )
+
+    def pending(self) -> int:
+        """Get the number of moves waiting or in flight."""
+        with self._lock:
+            return sum(lane.control is not None or lane.busy for lane in self._lanes.values())
+
+    @abc.abstractmethod
+    def _wake(self):
+        """Have the dispatch loop look at the lanes again."""
+
+    def _take_ready(self, now) -> list:
+        """Get the (lane, control, queued seconds, coalesced) ready to be sent."""
+        ready = []
+        with self._lock:
+            for lane in self._lanes.values():
+                if lane.control is None or lane.busy:
+                    continue
+                if now - lane.queued_at > self._max_age:
+                    _LOGGER.debug("Dropping stale move of monitor %s", lane.monitor.id)
+                    self._expired += 1 + lane.coalesced
+                    lane.control = None
+                    continue
+                if lane.next_send <= now:
+                    ready.append((lane, lane.control, now - lane.queued_at, lane.coalesced))
+                    lane.control = None
+                    lane.busy = True
+        return ready
+
+    def _requeue(self, ready):
+        """Let the moves taken by _take_ready but never sent wait again."""
+        with self._lock:
+            for lane, control, _, coalesced in ready:
+                lane.busy = False
+                if lane.control is None:
+                    # Not replaced by a newer move meanwhile
+                    lane.control = control
+                    lane.coalesced = coalesced
+
+    def _wait_time(self, now) -> Optional[float]:
+        """Get the seconds until a waiting move may be sent or expires, None if none waits."""
+        with self._lock:
+            waiting = [
+                min(lane.next_send, lane.queued_at + self._max_age)
+                for lane in self._lanes.values()
+                if lane.control is not None and not lane.busy
+            ]
+        return max(0.0, min(waiting) - now) if waiting else None
+
+    def _complete(self, lane, control, queued, coalesced, ok, started) -> PtzResult:
+        """Account for a request that completed, letting its lane send again."""
+        now = time.monotonic()
+        result = PtzResult(lane.monitor.id, control, ok, queued, now - started, coalesced)
+        with self._lock:
+            lane.busy = False
+            lane.next_send = started + self._min_interval
+            self._sent += 1
+            self._failed += not ok
+            self._latency_sum += result.latency
+        return result
+
+
+class PtzDispatcher(BasePtzDispatcher):
+    """Sends PTZ moves from a background thread, over the client's pooled session.
+
+    Requests run on up to max_workers threads; subscribers are called from
+    them. Use as a context manager, or call start and stop.
+    """
+
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(self, client, max_workers=DEFAULT_MAX_WORKERS, **kwargs):
+        """Create a dispatcher for a ZoneMinder client, see BasePtzDispatcher for the options."""
+        super().__init__(client, **kwargs)
+        self._max_workers = max_workers
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self._thread = None
+
+    def __enter__(self):
+        """Start dispatching, returning this dispatcher."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop dispatching."""
+        self.stop()
+
+    def start(self):
+        """Start dispatching in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="zm-ptz", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop dispatching, waiting for the requests in flight; waiting moves are dropped."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout=None) -> bool:
+        """Wait until no move waits or is in flight, returning False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: not any(
+                    lane.control is not None or lane.busy for lane in self._lanes.values()
+                ),
+                timeout,
+            )
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        """Submit the moves as their cameras become ready, within the rate cap."""
+        with ThreadPoolExecutor(self._max_workers, thread_name_prefix="zm-ptz") as executor:
+            while not self._stop.is_set():
+                self._wakeup.clear()
+                ready = self._take_ready(time.monotonic())
+                for index, move in enumerate(ready):
+                    delay = self._limiter.reserve()
+                    if delay and self._stop.wait(delay):
+                        self._requeue(ready[index:])
+                        return
+                    executor.submit(self._send, *move)
+                with self._idle:
+                    # Moves may have expired
+                    self._idle.notify_all()
+                self._wakeup.wait(self._wait_time(time.monotonic()))
+
+    def _send(self, lane, control, queued, coalesced):
+        """Send a move, then report its result."""
+        started = time.monotonic()
+        try:
+            ok = self._client.move_monitor(lane.monitor, control.name, self._timeout)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Could not move monitor %s", lane.monitor.id)
+            ok = False
+        result = self._complete(lane, control, queued, coalesced, ok, started)
+        with self._idle:
+            self._idle.notify_all()
+        self._wakeup.set()
+        for callback in list(self._subscribers):
+            try:
+                callback(result)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in PTZ callback %s", callback)
+
+
+class AsyncPtzDispatcher(BasePtzDispatcher):
+    """Sends the PTZ moves of an AsyncZoneMinder from a task.
+
+    Subscribers may be coroutine functions, which are awaited. Use as an
+    async context manager, or call start and stop.
+    """
+
+    def __init__(self, client, **kwargs):
+        """Create a dispatcher for an AsyncZoneMinder, see BasePtzDispatcher for the options."""
+        super().__init__(client, **kwargs)
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Condition()
+        self._task = None
+        self._sends = set()
+
+    async def __aenter__(self):
+        """Start dispatching, returning this dispatcher."""
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """Stop dispatching."""
+        await self.stop()
+
+    async def start(self):
+        """Start dispatching in a task of the running event loop."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop dispatching, cancelling the requests in flight."""
+        tasks = list(self._sends)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def wait(self):
+        """Wait until no move waits or is in flight."""
+        async with self._idle:
+            await self._idle.wait_for(lambda: not self.pending())
+
+    def _wake(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        """Start sending the moves as their cameras become ready, within the rate cap."""
+        while True:
+            self._wakeup.clear()
+            ready = self._take_ready(time.monotonic())
+            for index, move in enumerate(ready):
+                delay = self._limiter.reserve()
+                if delay:
+                    try:
+                        await asyncio.sleep(delay)
+                    except asyncio.CancelledError:
+                        self._requeue(ready[index:])
+                        raise
+                task = asyncio.create_task(self._send(*move))
+                self._sends.add(task)
+                task.add_done_callback(self._sends.discard)
+            async with self._idle:
+                # Moves may have expired
+                self._idle.notify_all()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._wait_time(time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, lane, control, queued, coalesced):
+        """Send a move, then report its result."""
+        started = time.monotonic()
+        try:
+            ok = await self._client.move_monitor(lane.monitor, control.name, self._timeout)
+        except asyncio.CancelledError:
+            # Stopped: the move may or may not have happened, free its lane
+            self._complete(lane, control, queued, coalesced, False, started)
+            raise
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Could not move monitor %s", lane.monitor.id)
+            ok = False
+        result = self._complete(lane, control, queued, coalesced, ok, started)
+        async with self._idle:
+            self._idle.notify_all()
+        self._wakeup.set()
+        for callback in list(self._subscribers):
+            try:
+                outcome = callback(result)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in PTZ callback %s", callback)
@@ -0,0 +1,160 @@
+"""Classification of failed API requests, retry backoff and a circuit breaker."""
+
+from enum import Enum
+import logging
+import random
+import threading
+import time
+from typing import NamedTuple, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FailureKind(Enum):
+    """Why an API request failed, which decides how it is retried.
+
+    Only AUTH failures are worth logging in again for; SERVER and
+    CONNECTION failures may go away on their own and count against the
+    circuit breaker; NOT_FOUND and CLIENT failures will not.
+    """
+
+    AUTH = "auth"
+    NOT_FOUND = "not_found"
+    CLIENT = "client"
+    SERVER = "server"
+    CONNECTION = "connection"
+
+    @property
+    def server_down(self) -> bool:
+        """Indicate whether this failure suggests the server is unreachable."""
+        return self in (FailureKind.SERVER, FailureKind.CONNECTION)
+
+
+def classify_status(status) -> Optional[FailureKind]:
+    """Get the FailureKind of an HTTP status, None if it is a success."""
+    if status is None:
+        return FailureKind.CONNECTION
+    if status < 400:
+        return None
+    if status in (401, 403):
+        return FailureKind.AUTH
+    if status == 404:
+        return FailureKind.NOT_FOUND
+    if status < 500:
+        return FailureKind.CLIENT
+    return FailureKind.SERVER
+
+
+class Backoff(NamedTuple):
+    """Exponential backoff with full jitter between the retries of a request."""
+
+    base: float = 0.25
+    factor: float = 2.0
+    max_delay: float = 8.0
+
+    def delay(self, retry) -> float:
+        """Get the seconds to wait before a retry, retry counting from 0.
+
+        Drawn uniformly between 0 and base * factor**retry, capped at max_delay.
+        """
+        return random.uniform(0, min(self.max_delay, self.base * self.factor**retry))
+
+
+class CircuitState(Enum):
+    """The states of a CircuitBreaker."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Fails requests fast while a server is known to be down.
+
+    The circuit opens after failure_threshold consecutive failures of the
+    SERVER or CONNECTION kind. While open, requests are refused without
+    being sent; after reset_timeout seconds a single request is let through
+    (half open) to probe the server, closing the circuit if it succeeds and
+    opening it again if it fails. Shared by the threads (or tasks) of a
+    client.
+    """
+
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 30.0
+
+    def __init__(
+        self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT
+    ):
+        """Create a closed circuit breaker."""
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> CircuitState:
+        """Get the current state of the circuit."""
+        with self._lock:
+            if self._state == CircuitState.OPEN and self._reset_due(time.monotonic()):
+                return CircuitState.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Indicate whether a request may be sent now.
+
+        Every allowed request must be followed by record_success or
+        record_failure.
+        """
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+            if self._state == CircuitState.OPEN:
+                if not self._reset_due(time.monotonic()):
+                    return False
+                self._state = CircuitState.HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        """Account for a request that reached the server."""
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                _LOGGER.info("ZoneMinder is reachable again, closing the circuit")
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Account for a request that failed because the server is down."""
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self._failures >= self._failure_threshold
+            ):
+                if self._state == CircuitState.CLOSED:
+                    _LOGGER.warning(
+                        "ZoneMinder failed %d requests in a row, failing fast for %gs",
+                        self._failures,
+                        self._reset_timeout,
+                    )
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Account for a request whose outcome says nothing about the server being down."""
+        with self._lock:
+            self._probing = False
+
+    def reset(self):
+        """Close the circuit."""
+        self.record_success()
+
+    def _reset_due(self, now) -> bool:
+        """Indicate whether the open circuit may be probed; the lock must be held."""
+        return now - self._opened_at >= self._reset_timeout
@@ -1,8 +1,19 @@
 """Classes that allow interacting with ZoneMinder RunStates."""
 
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
-class RunState:
-    """Represents a Run State from ZoneMinder."""
+from zoneminder.cache import StateKind
+from zoneminder.monitor import MonitorState
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class BaseRunState:
+    """Represents the parts of a ZoneMinder Run State that need no network I/O."""
 
     def __init__(self, client, raw_state):
         """Create a new RunState."""
@@ -10,6 +21,7 @@ class RunState:
         self._state_id = int(raw_state["Id"])
         self._state_url = "api/states.json"
         self._name = raw_state["Name"]
+        self._active = BaseRunState._is_active(raw_state)
 
     @property
     def id(self) -> int:
@@ -24,16 +36,331 @@ class RunState:
 
     @property
     def active(self) -> bool:
-        """Indicate if this RunState is currently active."""
-        states = self._client.get_state(self._state_url)["states"]
-        for state in states:
+        """Indicate if this RunState was active when the run states were fetched."""
+        return self._active
+
+    def update_state(self, raw_state):
+        """Update this RunState in place from its entry of a states.json response."""
+        self._name = raw_state["Name"]
+        self._active = BaseRunState._is_active(raw_state)
+
+    def _active_from_states(self, raw_states) -> bool:
+        """Find whether this RunState is the active one in a states.json response."""
+        for state in raw_states["states"]:
             state = state["State"]
             if int(state["Id"]) == self._state_id:
-                # yes, the ZM API uses the *string* "1" for this...
-                # Since ZM 1.36 this is now an *int*, provides support for legacy versions
-                return int(state["IsActive"]) == 1
+                self.update_state(state)
+                return self._active
+        self._active = False
         return False
 
+    @staticmethod
+    def _is_active(raw_state) -> bool:
+        """Decode the IsActive flag of a states.json entry."""
+        # yes, the ZM API uses the *string* "1" for this...
+        # Since ZM 1.36 this is now an *int*, provides support for legacy versions
+        return int(raw_state["IsActive"]) == 1
+
+
+class RunState(BaseRunState):
+    """Represents a Run State from ZoneMinder.
+
+    The active flag is a snapshot taken when the run states were fetched;
+    call refresh to fetch them again (a single request updates every
+    RunState of the client).
+    """
+
+    def refresh(self):
+        """Refresh the active flag of this and all other RunStates of the client."""
+        self._client.refresh_run_states()
+
     def activate(self):
         """Activate this RunState."""
         self._client.set_active_state(self._name)
+
+
+class MonitorProgress(NamedTuple):
+    """How far one Monitor got towards the function a run state gives it.
+
+    elapsed is the seconds from the start of the change until the Monitor
+    was seen converged, None while it is not.
+    """
+
+    monitor_id: int
+    function: MonitorState
+    enabled: bool
+    elapsed: Optional[float]
+
+    @property
+    def converged(self) -> bool:
+        """Indicate if the Monitor was seen with its function and capture daemon."""
+        return self.elapsed is not None
+
+
+def parse_definition(definition) -> Dict[int, Tuple[MonitorState, bool]]:
+    """Decode the Definition of a states.json entry into (function, enabled) by monitor id.
+
+    ZoneMinder stores it as comma separated id:function:enabled triples;
+    malformed entries are skipped.
+    """
+    targets = {}
+    for entry in (definition or "").split(","):
+        fields = entry.strip().split(":")
+        if len(fields) < 2:
+            continue
+        try:
+            enabled = len(fields) < 3 or int(fields[2]) == 1
+            targets[int(fields[0])] = (MonitorState(fields[1]), enabled)
+        except ValueError:
+            _LOGGER.debug("Skipping run state definition entry %s", entry)
+    return targets
+
+
+class BaseStateChangeJob:
+    """The bookkeeping of StateChangeJob and AsyncStateChangeJob, without any I/O.
+
+    ZoneMinder answers a run state change only once it restarted every
+    camera. A job sends that request in the background and meanwhile polls
+    the Monitors, counting one as converged once it has the function the
+    run state gives it and, unless that is None or the Monitor is disabled,
+    its capture daemon runs. A Monitor already in its target state counts
+    as converged as soon as it is polled. The job is done when the request
+    completes (or failed, or the job was cancelled).
+    """
+
+    DEFAULT_POLL_INTERVAL = 2.0
+
+    def __init__(self, client, state_name, poll_interval=DEFAULT_POLL_INTERVAL):
+        """Create a job changing the run state of a client to state_name."""
+        self._client = client
+        self._state_name = state_name
+        self._poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._targets = {}
+        self._converged = {}
+        self._result = None
+        self._finished_at = None
+        self._cancelled = False
+
+    @property
+    def state_name(self) -> str:
+        """Get the name of the run state being activated."""
+        return self._state_name
+
+    @property
+    def result(self) -> Optional[dict]:
+        """Get the response of the change request, None until it completes."""
+        return self._result
+
+    @property
+    def cancelled(self) -> bool:
+        """Indicate if the job was cancelled."""
+        return self._cancelled
+
+    @property
+    def elapsed(self) -> float:
+        """Get the seconds the job ran (or has been running)."""
+        end = self._finished_at if self._finished_at is not None else time.monotonic()
+        return end - self._started
+
+    def progress(self) -> List[MonitorProgress]:
+        """Get the progress of each Monitor the run state defines, by monitor id."""
+        with self._lock:
+            return [
+                MonitorProgress(monitor_id, function, enabled, self._converged.get(monitor_id))
+                for monitor_id, (function, enabled) in sorted(self._targets.items())
+            ]
+
+    def completion_times(self) -> Dict[int, float]:
+        """Get the seconds each converged Monitor took, by monitor id."""
+        with self._lock:
+            return dict(self._converged)
+
+    @property
+    def converged(self) -> bool:
+        """Indicate if every Monitor of the run state was seen converged."""
+        with self._lock:
+            return len(self._converged) == len(self._targets)
+
+    def _set_targets(self, raw_states):
+        """Find the Monitor targets in the Definition of the run state in states.json."""
+        for state in (raw_states or {}).get("states", []):
+            raw_state = state["State"]
+            if raw_state["Name"] == self._state_name:
+                with self._lock:
+                    self._targets = parse_definition(raw_state.get("Definition"))
+                return
+        _LOGGER.warning("Run state %s not found, not tracking monitors", self._state_name)
+
+    def _pending(self) -> Dict[int, Tuple[MonitorState, bool]]:
+        """Get the targets of the Monitors not seen converged yet."""
+        with self._lock:
+            return {
+                monitor_id: target
+                for monitor_id, target in self._targets.items()
+                if monitor_id not in self._converged
+            }
+
+    @staticmethod
+    def _needs_daemon(target) -> bool:
+        """Indicate if a Monitor must be capturing to have converged to a target."""
+        function, enabled = target
+        return enabled and function != MonitorState.NONE
+
+    def _observe(self, monitor_id):
+        """Record that a Monitor was seen converged."""
+        with self._lock:
+            if monitor_id in self._targets and monitor_id not in self._converged:
+                self._converged[monitor_id] = time.monotonic() - self._started
+                _LOGGER.debug("Monitor %s converged to run state %s", monitor_id, self._state_name)
+
+    def _finish(self, result):
+        """Record the response of the change request."""
+        self._result = result
+        self._finished_at = time.monotonic()
+        _LOGGER.info(
+            "Run state %s set in %.1fs, %d of %d monitors converged",
+            self._state_name,
+            self.elapsed,
+            len(self._converged),
+            len(self._targets),
+        )
+
+
+class StateChangeJob(BaseStateChangeJob):
+    """Changes the run state of a ZoneMinder client from background threads.
+
+    Returned by ZoneMinder.set_active_state(wait=False), already started.
+    Cancelling only stops the job from tracking the change: ZoneMinder
+    carries on with a change it received.
+    """
+
+    def __init__(self, client, state_name, **kwargs):
+        """Create a job, see BaseStateChangeJob for the options."""
+        super().__init__(client, state_name, **kwargs)
+        self._done = threading.Event()
+        self._request_done = threading.Event()
+        self._response = None
+
+    def start(self) -> "StateChangeJob":
+        """Send the change request and start tracking the Monitors."""
+        threading.Thread(target=self._change, name="zm-state-change", daemon=True).start()
+        threading.Thread(target=self._watch, name="zm-state-watch", daemon=True).start()
+        return self
+
+    def done(self) -> bool:
+        """Indicate if the job completed or was cancelled."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        """Wait for the job to be done, returning False on timeout."""
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Stop tracking the change and release the waiters."""
+        self._cancelled = True
+        self._done.set()
+        self._request_done.set()
+
+    def _change(self):
+        """Send the change request."""
+        try:
+            self._response = self._client.set_active_state(self._state_name)
+        finally:
+            self._request_done.set()
+
+    def _watch(self):
+        """Poll the Monitors until the change request completes, then once more."""
+        try:
+            self._set_targets(self._client.get_state("api/states.json"))
+            while self._pending() and not self._cancelled:
+                request_done = self._request_done.is_set()
+                self._poll()
+                if request_done:
+                    break
+                self._request_done.wait(self._poll_interval)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Could not track run state %s", self._state_name)
+        self._request_done.wait()
+        if not self._cancelled:
+            self._finish(self._response)
+        self._done.set()
+
+    def _poll(self):
+        """Look at the Monitors not converged yet."""
+        pending = self._pending()
+        for monitor in self._client.refresh_monitors():
+            target = pending.get(monitor.id)
+            if target is None or monitor.config.function != target[0].value:
+                continue
+            if self._needs_daemon(target):
+                monitor.invalidate(StateKind.DAEMON)
+                if not monitor.is_available:
+                    continue
+            self._observe(monitor.id)
+
+
+class AsyncStateChangeJob(BaseStateChangeJob):
+    """Changes the run state of an AsyncZoneMinder from tasks.
+
+    Returned by AsyncZoneMinder.set_active_state(wait=False), already
+    started; awaiting the job waits for it to be done. Cancelling cancels
+    the change request, but ZoneMinder carries on with a change it received.
+    """
+
+    def __init__(self, client, state_name, **kwargs):
+        """Create a job, see BaseStateChangeJob for the options."""
+        super().__init__(client, state_name, **kwargs)
+        self._request = None
+        self._task = None
+
+    def __await__(self):
+        """Wait for the job to be done."""
+        return self.wait().__await__()
+
+    def start(self) -> "AsyncStateChangeJob":
+        """Send the change request and start tracking the Monitors, in the running loop."""
+        self._request = asyncio.create_task(self._client.set_active_state(self._state_name))
+        self._task = asyncio.create_task(self._watch())
+        return self
+
+    def done(self) -> bool:
+        """Indicate if the job completed or was cancelled."""
+        return self._task is not None and self._task.done()
+
+    async def wait(self, timeout=None) -> bool:
+        """Wait for the job to be done, returning False on timeout."""
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        return bool(done)
+
+    def cancel(self):
+        """Stop tracking the change, cancelling the change request."""
+        self._cancelled = True
+        self._request.cancel()
+        self._task.cancel()
+
+    async def _watch(self):
+        """Poll the Monitors until the change request completes, then once more."""
+        try:
+            self._set_targets(await self._client.get_state("api/states.json"))
+            while self._pending():
+                request_done = self._request.done()
+                await self._poll()
+                if request_done:
+                    break
+                await asyncio.wait({self._request}, timeout=self._poll_interval)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Could not track run state %s", self._state_name)
+        self._finish(await self._request)
+
+    async def _poll(self):
+        """Look at the Monitors not converged yet."""
+        pending = self._pending()
+        for monitor in await self._client.get_monitors():
+            target = pending.get(monitor.id)
+            if target is None or monitor.config.function != target[0].value:
+                continue
+            if self._needs_daemon(target) and not await monitor.is_available():
+                continue
+            self._observe(monitor.id)
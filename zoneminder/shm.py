@@ -0,0 +1,222 @@
+"""Read the live Monitor state ZoneMinder publishes in shared memory."""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MonitorShmState(NamedTuple):
+    """The live state of a Monitor, as found in its shared memory."""
+
+    state: int
+    alarm: bool
+    last_event: int
+    capture_fps: float
+    analysis_fps: float
+    heartbeat_time: int
+    last_write_time: int
+    valid: bool
+    active: bool
+    signal: bool
+
+
+class ShmLayout(NamedTuple):
+    """The layout of the SharedData struct at the start of a Monitor's mmap file.
+
+    size is sizeof(SharedData), which zmc stores in its first field and
+    which tells the layouts of the ZoneMinder versions apart.
+    """
+
+    version: str
+    size: int
+    format: struct.Struct
+    fields: Tuple[str, ...]
+    alarm_state: int
+
+    def decode(self, buffer) -> MonitorShmState:
+        """Unpack the state from a buffer (such as an mmap) without copying it."""
+        values = dict(zip(self.fields, self.format.unpack_from(buffer)))
+        return MonitorShmState(
+            values["state"],
+            values["state"] == self.alarm_state,
+            values["last_event"],
+            values["capture_fps"],
+            values["analysis_fps"],
+            values["zmc_heartbeat_time"],
+            values["last_write_time"],
+            bool(values["valid"]),
+            bool(values["active"]),
+            bool(values["signal"]),
+        )
+
+    def pack(self, **values) -> bytes:
+        """Build a SharedData struct, padded to its size, with the given fields set.
+
+        Fields that are not given are zero; this is meant for synthetic files.
+        """
+        values.setdefault("size", self.size)
+        header = self.format.pack(*(values.get(field, 0) for field in self.fields))
+        return header.ljust(self.size, b"\0")
+
+
+# ZoneMinder 1.36 (zm_monitor.h), where State is UNKNOWN, IDLE, PREALARM,
+# ALARM, ALERT, TAPE. Only the fixed size fields before control_state are
+# described.
+LAYOUT_1_36 = ShmLayout(
+    "1.36",
+    760,
+    struct.Struct("<IiiIddQIiiiiiiBBBBIIIIqqqq"),
+    (
+        "size",
+        "last_write_index",
+        "last_read_index",
+        "state",
+        "capture_fps",
+        "analysis_fps",
+        "last_event",
+        "action",
+        "brightness",
+        "hue",
+        "colour",
+        "contrast",
+        "alarm_x",
+        "alarm_y",
+        "valid",
+        "active",
+        "signal",
+        "format",
+        "imagesize",
+        "last_frame_score",
+        "audio_frequency",
+        "audio_channels",
+        "startup_time",
+        "zmc_heartbeat_time",
+        "last_write_time",
+        "last_read_time",
+    ),
+    3,
+)
+
+LAYOUTS = (LAYOUT_1_36,)
+
+
+class ShmBackend:
+    """Reads Monitor state from the files zmc memory-maps under /dev/shm.
+
+    This only works on the ZoneMinder host itself, and needs read access to
+    the zm.mmap.<id> files. Each file is mapped once and decoded in place on
+    every read, so is_recording and is_available answer in microseconds.
+    The layout is picked from the size stored in the file unless one is
+    given. A Monitor whose file is missing or too small reads as None, so
+    callers can fall back to the API.
+    """
+
+    DEFAULT_PATH = "/dev/shm"
+    # Seconds without a zmc heartbeat after which a Monitor is unavailable
+    DEFAULT_STALE_AFTER = 10.0
+
+    def __init__(self, path=DEFAULT_PATH, layout=None, stale_after=DEFAULT_STALE_AFTER):
+        """Create a backend reading the mmap files in the directory at path."""
+        self._path = path
+        self._layout = layout
+        self._stale_after = stale_after
+        self._maps: Dict[int, Tuple[mmap.mmap, int, ShmLayout]] = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Unmap all files."""
+        with self._lock:
+            for mapping, _, _ in self._maps.values():
+                mapping.close()
+            self._maps.clear()
+
+    def read(self, monitor_id) -> Optional[MonitorShmState]:
+        """Read the live state of a Monitor, or None if it cannot be."""
+        mapped = self._maps.get(monitor_id) or self._map(monitor_id)
+        if mapped is None:
+            return None
+        try:
+            state = mapped[2].decode(mapped[0])
+            if not self._alive(state) and self._replaced(monitor_id, mapped[1]):
+                # zmc unlinks the file when it stops, and creates a new one
+                # when it starts again
+                mapped = self._map(monitor_id)
+                state = mapped[2].decode(mapped[0]) if mapped else None
+        except ValueError:
+            # Unmapped by another thread remapping or closing
+            return None
+        return state
+
+    def is_recording(self, monitor_id) -> Optional[bool]:
+        """Indicate if a Monitor is alarming, like Monitor.is_recording.
+
+        None when zmc is not running or beating, its last state being left
+        over: the ZM server is then asked instead.
+        """
+        state = self.read(monitor_id)
+        if state is None or not self._alive(state):
+            return None
+        return state.alarm
+
+    def is_available(self, monitor_id) -> Optional[bool]:
+        """Indicate if a Monitor is capturing, like Monitor.is_available."""
+        state = self.read(monitor_id)
+        if state is None:
+            return None
+        return self._alive(state) and state.capture_fps > 0
+
+    def _alive(self, state) -> bool:
+        """Indicate whether zmc is running and beating for a state."""
+        return state.valid and time.time() - state.heartbeat_time < self._stale_after
+
+    def _file(self, monitor_id) -> str:
+        """Get the path of the mmap file of a Monitor."""
+        return os.path.join(self._path, f"zm.mmap.{int(monitor_id)}")
+
+    def _replaced(self, monitor_id, inode) -> bool:
+        """Indicate whether the mmap file of a Monitor is no longer the one mapped."""
+        try:
+            return os.stat(self._file(monitor_id)).st_ino != inode
+        except OSError:
+            return True
+
+    def _map(self, monitor_id) -> Optional[Tuple[mmap.mmap, int, ShmLayout]]:
+        """Map the start of the mmap file of a Monitor, replacing any older mapping."""
+        with self._lock:
+            old = self._maps.pop(monitor_id, None)
+            if old is not None:
+                old[0].close()
+            try:
+                with open(self._file(monitor_id), "rb") as file:
+                    stat = os.fstat(file.fileno())
+                    length = min(stat.st_size, mmap.PAGESIZE)
+                    if length < min(layout.format.size for layout in LAYOUTS):
+                        return None
+                    mapping = mmap.mmap(file.fileno(), length, access=mmap.ACCESS_READ)
+            except OSError as err:
+                _LOGGER.debug("Could not map shared memory of monitor %s: %s", monitor_id, err)
+                return None
+            layout = self._layout or ShmBackend._detect_layout(mapping)
+            if len(mapping) < layout.format.size:
+                mapping.close()
+                return None
+            self._maps[monitor_id] = (mapping, stat.st_ino, layout)
+            return self._maps[monitor_id]
+
+    @staticmethod
+    def _detect_layout(mapping) -> ShmLayout:
+        """Pick the layout matching the size stored in a mapping."""
+        size = struct.unpack_from("<I", mapping)[0]
+        for layout in LAYOUTS:
+            if layout.size == size:
+                return layout
+        _LOGGER.warning(
+            "Unknown SharedData size %d, reading it as ZoneMinder %s", size, LAYOUTS[-1].version
+        )
+        return LAYOUTS[-1]
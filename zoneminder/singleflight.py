@@ -0,0 +1,66 @@
+"""Collapse concurrent calls for the same key into a single call."""
+
+import threading
+
+
+class _Call:
+    """A call in flight and the outcome its waiters are waiting for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time, sharing its outcome.
+
+    A caller arriving while a call for the same key is in flight waits for
+    that call instead of making its own, and gets its result (or its
+    exception raised).
+    """
+
+    def __init__(self, on_shared=None):
+        """Create a SingleFlight with no calls in flight.
+
+        on_shared is called with the key each time a caller joins a call in
+        flight instead of making its own.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._shared = 0
+        self._on_shared = on_shared
+
+    @property
+    def shared(self) -> int:
+        """Get how many callers were served by another caller's call."""
+        return self._shared
+
+    def do(self, key, func, *args):
+        """Call func(*args), unless a call for key is in flight already."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._shared += 1
+
+        if not leader:
+            if self._on_shared is not None:
+                self._on_shared(key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
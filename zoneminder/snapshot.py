@@ -0,0 +1,68 @@
+"""A bounded cache of the still images fetched from ZoneMinder Monitors."""
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Optional
+
+
+class FrameCache:
+    """Keeps the last still image of each Monitor, least recently used first out.
+
+    The cache is bounded by the total size of the images it holds: adding an
+    image evicts the least recently used ones until the total fits in
+    max_bytes. Images are served while younger than ttl seconds.
+    """
+
+    DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+    DEFAULT_TTL = 1.0
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        """Create an empty FrameCache."""
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._frames = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Get the total size in bytes of the images held."""
+        return self._size
+
+    def __len__(self) -> int:
+        """Get the number of images held."""
+        return len(self._frames)
+
+    def get(self, key, max_age=None) -> Optional[bytes]:
+        """Get the image of key if it is younger than max_age (default ttl)."""
+        max_age = self._ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None or time.monotonic() - entry[1] >= max_age:
+                return None
+            self._frames.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, frame):
+        """Store the image of key, evicting least recently used images as needed."""
+        with self._lock:
+            self._pop(key)
+            if len(frame) > self._max_bytes:
+                return
+            self._frames[key] = (frame, time.monotonic())
+            self._size += len(frame)
+            while self._size > self._max_bytes:
+                self._pop(next(iter(self._frames)))
+
+    def clear(self):
+        """Drop all images."""
+        with self._lock:
+            self._frames.clear()
+            self._size = 0
+
+    def _pop(self, key):
+        """Drop the image of key; the lock must be held."""
+        entry = self._frames.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
@@ -0,0 +1,319 @@
+"""Turn the frames of many Monitors into thumbnails in a pool of processes.
+
+Decoding and resizing JPEG images holds the GIL, so ThumbnailPipeline does
+it in worker processes. Frames are handed over through blocks of shared
+memory rather than pickled, and each Monitor has at most one frame being
+processed and one waiting: a newer frame replaces the waiting one, so a
+consumer that cannot keep up makes the pipeline drop frames instead of
+growing a queue. Resizing uses Pillow (the ``thumbnails`` extra of zm-py)
+unless another resize function is given.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import io
+import logging
+from multiprocessing.shared_memory import SharedMemory
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+_LOGGER = logging.getLogger(__name__)
+
+# The shared memory blocks attached by a worker process, by name
+_ATTACHED = {}
+
+
+def pillow_resize(frame, size, quality) -> Tuple[bytes, int, int]:
+    """Decode a JPEG frame, fit it in size and encode it again.
+
+    Returns (JPEG bytes, width, height). Only the DCT scale needed is
+    decoded, which is much faster than decoding the whole image.
+    """
+    with Image.open(io.BytesIO(frame)) as image:
+        image.draft("RGB", size)
+        thumbnail = image.convert("RGB")
+    thumbnail.thumbnail(size)
+    output = io.BytesIO()
+    thumbnail.save(output, "JPEG", quality=quality)
+    return output.getvalue(), thumbnail.width, thumbnail.height
+
+
+def _process(name, length, frame, resize, size, quality) -> tuple:
+    """Resize a frame in a worker process, from and to its shared memory block.
+
+    frame is None when the frame was written to the block, else the frame
+    itself (too large for the block). Returns (length, width, height,
+    thumbnail or None if written to the block, seconds taken).
+    """
+    started = time.perf_counter()
+    if frame is None:
+        block = _ATTACHED.get(name)
+        if block is None:
+            block = _ATTACHED[name] = SharedMemory(name=name)
+        with block.buf[:length] as view:
+            data, width, height = resize(view, size, quality)
+        if len(data) <= block.size:
+            block.buf[: len(data)] = data
+            return len(data), width, height, None, time.perf_counter() - started
+    else:
+        data, width, height = resize(frame, size, quality)
+    return len(data), width, height, data, time.perf_counter() - started
+
+
+class Thumbnail(NamedTuple):
+    """The thumbnail of a frame of a Monitor, with the time spent in each stage.
+
+    queued is the seconds the frame waited for a worker, process the
+    seconds the worker took to decode, resize and encode it, and total the
+    seconds from submit to the thumbnail being available.
+    """
+
+    monitor_id: int
+    data: bytes
+    width: int
+    height: int
+    queued: float
+    process: float
+    total: float
+
+
+class ThumbnailStats(NamedTuple):
+    """The totals of a ThumbnailPipeline.
+
+    dropped counts the frames replaced by a newer one before being
+    processed, oversized the frames too large for a shared memory block
+    (which were pickled to the worker instead).
+    """
+
+    submitted: int
+    processed: int
+    dropped: int
+    failed: int
+    oversized: int
+    process_time: float
+
+    @property
+    def mean_process_time(self) -> float:
+        """Get the mean seconds a worker took for a frame."""
+        return self.process_time / self.processed if self.processed else 0.0
+
+
+class _Lane:
+    """The frame of one Monitor waiting for a worker, and whether one is busy with it."""
+
+    __slots__ = ("frame", "submitted_at", "busy")
+
+    def __init__(self):
+        self.frame = None
+        self.submitted_at = 0.0
+        self.busy = False
+
+
+class ThumbnailPipeline:
+    """Resizes the frames of many Monitors to thumbnails in worker processes.
+
+    size is the (width, height) the thumbnails fit in. At most max_in_flight
+    frames (twice max_workers by default) are processed at a time, each in
+    a shared memory block of block_size bytes. resize is a picklable
+    function taking (frame, size, quality) and returning (data, width,
+    height), pillow_resize by default. Subscribers are called with each
+    Thumbnail from the thread collecting the results; the last thumbnail of
+    each Monitor is kept for get. Use as a context manager, or call close.
+    """
+
+    DEFAULT_SIZE = (320, 180)
+    DEFAULT_QUALITY = 75
+    DEFAULT_MAX_WORKERS = 2
+    DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(
+        self,
+        size=DEFAULT_SIZE,
+        quality=DEFAULT_QUALITY,
+        max_workers=DEFAULT_MAX_WORKERS,
+        max_in_flight=None,
+        block_size=DEFAULT_BLOCK_SIZE,
+        resize: Optional[Callable] = None,
+        mp_context=None,
+    ):
+        """Create a pipeline and start its worker processes."""
+        if resize is None:
+            if Image is None:
+                raise ImportError("Pillow is needed to resize frames, install zm-py[thumbnails]")
+            resize = pillow_resize
+        self._size = tuple(size)
+        self._quality = quality
+        self._resize = resize
+        self._executor = ProcessPoolExecutor(max_workers, mp_context=mp_context)
+        self._blocks = [
+            SharedMemory(create=True, size=block_size)
+            for _ in range(max_in_flight or 2 * max_workers)
+        ]
+        self._free = list(self._blocks)
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._thumbnails = {}
+        self._subscribers = []
+        self._closed = False
+        self._submitted = 0
+        self._processed = 0
+        self._dropped = 0
+        self._failed = 0
+        self._oversized = 0
+        self._process_time = 0.0
+
+    def __enter__(self):
+        """Enter the runtime context, returning this pipeline."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the pipeline."""
+        self.close()
+
+    def close(self):
+        """Stop the worker processes, waiting for the frames being processed."""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def submit(self, monitor_id, frame) -> bool:
+        """Queue a JPEG frame of a Monitor, returning right away.
+
+        Returns False if the frame replaced one of the Monitor still waiting
+        for a worker (which is dropped).
+        """
+        if not isinstance(frame, bytes):
+            # Frames may be views of a buffer that is about to be reused
+            frame = bytes(frame)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The thumbnail pipeline is closed")
+            lane = self._lanes.get(monitor_id)
+            if lane is None:
+                lane = self._lanes[monitor_id] = _Lane()
+            replaced = lane.frame is not None
+            if replaced:
+                self._dropped += 1
+            lane.frame = frame
+            lane.submitted_at = time.monotonic()
+            self._submitted += 1
+        self._dispatch()
+        return not replaced
+
+    def submit_all(self, frames: Dict[int, bytes]) -> int:
+        """Queue the frames of many Monitors, keyed by Monitor id; returns the number dropped."""
+        return sum(not self.submit(monitor_id, frame) for monitor_id, frame in frames.items())
+
+    def get(self, monitor_id) -> Optional[Thumbnail]:
+        """Get the last thumbnail of a Monitor, None if there is none yet."""
+        return self._thumbnails.get(monitor_id)
+
+    def subscribe(self, callback) -> Callable[[], None]:
+        """Call callback with each Thumbnail; returns its unsubscriber."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def pending(self) -> int:
+        """Get the number of frames waiting or being processed."""
+        with self._lock:
+            return sum(lane.frame is not None or lane.busy for lane in self._lanes.values())
+
+    def stats(self) -> ThumbnailStats:
+        """Get the totals of this pipeline."""
+        with self._lock:
+            return ThumbnailStats(
+                self._submitted,
+                self._processed,
+                self._dropped,
+                self._failed,
+                self._oversized,
+                self._process_time,
+            )
+
+    def _dispatch(self):
+        """Hand the waiting frames to the workers while shared memory blocks are free."""
+        dispatched = []
+        with self._lock:
+            for monitor_id, lane in self._lanes.items():
+                if not self._free or self._closed:
+                    break
+                if lane.frame is None or lane.busy:
+                    continue
+                block = self._free.pop()
+                frame, lane.frame, lane.busy = lane.frame, None, True
+                dispatched_at = time.monotonic()
+                if len(frame) <= block.size:
+                    block.buf[: len(frame)] = frame
+                    args = (block.name, len(frame), None)
+                else:
+                    self._oversized += 1
+                    args = (block.name, len(frame), frame)
+                try:
+                    future = self._executor.submit(
+                        _process, *args, self._resize, self._size, self._quality
+                    )
+                except RuntimeError:
+                    # The pool is broken or shutting down
+                    _LOGGER.exception("Could not hand the frame of monitor %s over", monitor_id)
+                    self._free.append(block)
+                    lane.busy = False
+                    self._failed += 1
+                    continue
+                dispatched.append(
+                    (
+                        future,
+                        partial(self._collect, monitor_id, block, lane.submitted_at, dispatched_at),
+                    )
+                )
+        # A future already done runs its callback right away, which takes the lock
+        for future, callback in dispatched:
+            future.add_done_callback(callback)
+
+    def _collect(self, monitor_id, block, submitted_at, dispatched_at, future):
+        """Read the thumbnail of a frame, free its block and dispatch the next frames."""
+        thumbnail = None
+        # A future cancelled by close still frees its block
+        cancelled = future.cancelled()
+        try:
+            if not cancelled:
+                length, width, height, data, process = future.result()
+                if data is None:
+                    data = bytes(block.buf[:length])
+                thumbnail = Thumbnail(
+                    monitor_id,
+                    data,
+                    width,
+                    height,
+                    dispatched_at - submitted_at,
+                    process,
+                    time.monotonic() - submitted_at,
+                )
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Could not make a thumbnail of monitor %s", monitor_id)
+        with self._lock:
+            self._free.append(block)
+            self._lanes[monitor_id].busy = False
+            if thumbnail is not None:
+                self._processed += 1
+                self._process_time += thumbnail.process
+                self._thumbnails[monitor_id] = thumbnail
+            elif not cancelled:
+                self._failed += 1
+        self._dispatch()
+        if thumbnail is None:
+            return
+        for callback in list(self._subscribers):
+            try:
+                callback(thumbnail)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Error in thumbnail callback %s", callback)
@@ -1,26 +1,109 @@
 """An API Client to interact with ZoneMinder."""
 
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from enum import Enum
+from functools import partial
 import logging
-from typing import List, Optional
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
 from urllib.parse import quote, urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from zoneminder.exceptions import ControlTypeError, MonitorControlTypeError
-from zoneminder.monitor import Monitor
-from zoneminder.run_state import RunState
+from zoneminder.auth import AuthTokens
+from zoneminder.cache import StateCache, StateKind
+from zoneminder.decoding import ArrayItemParser, loads
+from zoneminder.events import Event, EventQuery, paginate_events
+from zoneminder.exceptions import (
+    CircuitOpenError,
+    CommError,
+    ControlTypeError,
+    MonitorControlTypeError,
+)
+from zoneminder.metrics import Metrics
+from zoneminder.monitor import Monitor, MonitorState, TimePeriod
+from zoneminder.poller import RateLimiter
+from zoneminder.resilience import Backoff, CircuitBreaker, FailureKind, classify_status
+from zoneminder.run_state import RunState, StateChangeJob
+from zoneminder.shm import ShmBackend
+from zoneminder.singleflight import SingleFlight
+from zoneminder.snapshot import FrameCache
 
 _LOGGER = logging.getLogger(__name__)
 
+# Counts the requests sent on behalf of a call (refresh_all), across its threads
+_REQUEST_COUNTER: ContextVar[Optional["_RequestCounter"]] = ContextVar(
+    "zm_request_counter", default=None
+)
 
-class ZoneMinder:
-    """The ZoneMinder API client itself. Create one of these to begin."""
+
+class _RequestCounter:
+    """The number of requests sent to the server, counted from many threads."""
+
+    def __init__(self):
+        """Create a counter at 0."""
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self):
+        """Count a request."""
+        with self._lock:
+            self.count += 1
+
+
+class RefreshResult(NamedTuple):
+    """The outcome of ZoneMinder.refresh_all.
+
+    requests is the number of requests actually sent, retries included;
+    reads served by a ShmBackend or shared with a request in flight cost
+    none.
+    """
+
+    monitors: List[Monitor]
+    requests: int
+    elapsed: float
+
+
+class ChangeStatus(Enum):
+    """The outcome of the change of one Monitor by ZoneMinder.set_functions."""
+
+    OK = "ok"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+class FunctionChange(NamedTuple):
+    """The change of the function of one Monitor by ZoneMinder.set_functions.
+
+    latency is the seconds the request took, 0 if none was sent.
+    """
+
+    monitor_id: int
+    function: MonitorState
+    status: ChangeStatus
+    latency: float
+
+
+class BaseZoneMinder:
+    """The parts of a ZoneMinder API client that need no network I/O.
+
+    Shared by the blocking ZoneMinder client and the asyncio AsyncZoneMinder.
+    """
 
     DEFAULT_SERVER_PATH = "/zm/"
     DEFAULT_ZMS_PATH = "/zm/cgi-bin/nph-zms"
     DEFAULT_TIMEOUT = 10
     LOGIN_RETRIES = 2
     MONITOR_URL = "api/monitors.json"
+    # Bytes read at a time from the responses decoded as they arrive
+    DEFAULT_CHUNK_SIZE = 64 * 1024
+    # Retries of an idempotent GET failing with a server or connection error
+    SERVER_RETRIES = 2
+    # Seconds given to the requests the server takes long to carry out
+    LONG_TIMEOUT = 120
 
     def __init__(
         self,
@@ -32,33 +115,305 @@ class ZoneMinder:
         verify_ssl=True,
     ) -> None:
         """Create a ZoneMinder API Client."""
-        self._server_url = ZoneMinder._build_server_url(server_host, server_path)
-        self._zms_url = ZoneMinder._build_zms_url(server_host, zms_path)
+        self._server_url = BaseZoneMinder._build_server_url(server_host, server_path)
+        self._zms_url = BaseZoneMinder._build_zms_url(server_host, zms_path)
         self._username = username
         self._password = password
         self._verify_ssl = verify_ssl
-        self._cookies = None
         self._auth_token = None
+        self._tokens = None
+        # Bumped on every successful (re-)login so that callers which waited
+        # for a login in progress know not to start another one
+        self._auth_generation = 0
+        self._shm_backend = None
+        self._metrics = Metrics()
+        self._breaker = CircuitBreaker()
+        self._backoff = Backoff()
+        self._poll_limiter = None
+        self._poll_limiter_lock = threading.Lock()
 
-    def login(self):
-        """Login to the ZoneMinder API."""
-        _LOGGER.debug("Attempting to login to ZoneMinder")
+    @property
+    def metrics(self) -> Metrics:
+        """Get the Metrics counting the API requests of this client."""
+        return self._metrics
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        """Get the CircuitBreaker failing the API requests fast while the server is down."""
+        return self._breaker
+
+    def poll_limiter(self, max_rate) -> RateLimiter:
+        """Get the RateLimiter shared by the pollers of this client.
+
+        It is created at max_rate requests per second by the first poller
+        asking for it; the others share it at that rate.
+        """
+        with self._poll_limiter_lock:
+            if self._poll_limiter is None:
+                self._poll_limiter = RateLimiter(max_rate)
+            return self._poll_limiter
+
+    @property
+    def auth_generation(self) -> int:
+        """Get the number of successful (re-)logins, to pass to reauthenticate."""
+        return self._auth_generation
+
+    def _record_no_response(self, timed_out, timeout):
+        """Tell the circuit breaker about a request that got no response.
 
+        A request given LONG_TIMEOUT that timed out reached a server busy
+        carrying it out, which does not suggest the server is down.
+        """
+        if timed_out and timeout >= BaseZoneMinder.LONG_TIMEOUT:
+            self._breaker.release()
+        else:
+            self._breaker.record_failure()
+
+    def _record_status(self, status) -> Optional[FailureKind]:
+        """Classify the status of a response, telling the circuit breaker about it."""
+        failure = classify_status(status)
+        if failure is not None and failure.server_down:
+            self._breaker.record_failure()
+        else:
+            self._breaker.record_success()
+        return failure
+
+    @property
+    def shm_backend(self) -> Optional[ShmBackend]:
+        """Get the ShmBackend Monitors read their live state from, if any."""
+        return self._shm_backend
+
+    def _set_tokens(self, tokens):
+        """Use the tokens of a successful token login or refresh."""
+        self._tokens = tokens
+        self._auth_token = tokens.access_token if tokens else None
+        self._auth_generation += 1
+
+    def _login_data(self) -> dict:
+        """Build the form posted to the token login API."""
         login_post = {}
         if self._username:
             login_post["user"] = self._username
         if self._password:
             login_post["pass"] = self._password
+        return login_post
 
-        req = requests.post(
+    def _legacy_login_data(self) -> dict:
+        """Build the form posted to the legacy (cookie based) login page."""
+        login_post = {"view": "console", "action": "login"}
+        if self._username:
+            login_post["username"] = self._username
+        if self._password:
+            login_post["password"] = self._password
+        return login_post
+
+    def _api_url(self, api_url) -> str:
+        """Build the full url of an API call, including the auth token if any."""
+        token_url_suffix = ""
+        if self._auth_token:
+            separator = "&" if "?" in api_url else "?"
+            token_url_suffix = f"{separator}token={self._auth_token}"
+        return urljoin(self._server_url, api_url) + token_url_suffix
+
+    @staticmethod
+    def _raw_monitor_list(raw_monitors) -> list:
+        """Get the monitor entries of a monitors.json response."""
+        if not raw_monitors:
+            _LOGGER.warning("Could not fetch monitors from ZoneMinder")
+            return []
+
+        if "monitors" not in raw_monitors:
+            _LOGGER.warning("Could not parse list of monitors from ZoneMinder")
+            return []
+
+        for raw_result in raw_monitors["monitors"]:
+            _LOGGER.debug("Initializing camera %s", raw_result["Monitor"]["Id"])
+        return raw_monitors["monitors"]
+
+    @staticmethod
+    def _raw_state_list(raw_states) -> list:
+        """Get the run state entries of a states.json response."""
+        if not raw_states:
+            _LOGGER.warning("Could not fetch runstates from ZoneMinder")
+            return []
+
+        result = []
+        for i in raw_states["states"]:
+            raw_state = i["State"]
+            _LOGGER.info("Initializing runstate %s", raw_state["Id"])
+            result.append(raw_state)
+        return result
+
+    @staticmethod
+    def _console_events_url(time_period, include_archived) -> str:
+        """Build the consoleEvents API url for the TimePeriod."""
+        date_filter = f"1%20{time_period.period}"
+        if time_period == TimePeriod.ALL:
+            # The consoleEvents API uses DATE_SUB, so give it
+            # something large
+            date_filter = "100%20year"
+
+        archived_filter = "/Archived=:0"
+        if include_archived:
+            archived_filter = ""
+
+        return f"api/events/consoleEvents/{date_filter}{archived_filter}.json"
+
+    def get_zms_url(self) -> str:
+        """Get the url to the current ZMS instance."""
+        return self._zms_url
+
+    def get_url_with_auth(self, url) -> str:
+        """Add the auth credentials to a url (if needed)."""
+        if not self._username:
+            return url
+
+        url += f"&user={quote(self._username)}"
+
+        if not self._password:
+            return url
+        return url + f"&pass={quote(self._password)}"
+
+    def get_media_url(self, path) -> str:
+        """Get the full url of a file served by the web console, with auth.
+
+        The access token is added when logged in with one, the credentials
+        (see get_url_with_auth) otherwise.
+        """
+        if self._auth_token:
+            return self._api_url(path)
+        return self.get_url_with_auth(urljoin(self._server_url, path))
+
+    @property
+    def verify_ssl(self) -> bool:
+        """Indicate whether urls with http(s) should verify the certificate."""
+        return self._verify_ssl
+
+    @staticmethod
+    def _build_zms_url(server_host, zms_path) -> str:
+        """Build the ZMS url to the current ZMS instance."""
+        return urljoin(server_host, zms_path)
+
+    @staticmethod
+    def _build_server_url(server_host, server_path) -> str:
+        """Build the server url making sure it ends in a trailing slash."""
+        server_url = urljoin(server_host, server_path)
+        if server_url[-1] == "/":
+            return server_url
+        return f"{server_url}/"
+
+
+class ZoneMinder(BaseZoneMinder):
+    """The ZoneMinder API client itself. Create one of these to begin."""
+
+    DEFAULT_POOL_CONNECTIONS = 10
+    DEFAULT_POOL_MAXSIZE = 10
+    DEFAULT_REFRESH_WORKERS = DEFAULT_POOL_MAXSIZE
+    DEFAULT_SNAPSHOT_TTL = 30
+    DEFAULT_CACHE_TTL = {StateKind.EVENTS: 5}
+
+    def __init__(
+        self,
+        server_host,
+        username,
+        password,
+        server_path=BaseZoneMinder.DEFAULT_SERVER_PATH,
+        zms_path=BaseZoneMinder.DEFAULT_ZMS_PATH,
+        verify_ssl=True,
+        session=None,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        pool_block=False,
+        keep_alive=True,
+        snapshot_ttl=DEFAULT_SNAPSHOT_TTL,
+        cache_ttl=None,
+        frame_cache=None,
+        shm_backend=None,
+        metrics=None,
+        circuit_breaker=None,
+        backoff=None,
+    ) -> None:
+        """Create a ZoneMinder API Client.
+
+        All requests made by the client (and its Monitors) share a single
+        requests.Session so that connections are kept alive and reused. A
+        session can be passed in to share its pool between several clients,
+        and is left as configured (its verify setting applies rather than
+        verify_ssl); otherwise one is created with pool_connections host pools
+        of up to pool_maxsize connections each. With pool_block set, callers
+        wait for a free connection instead of opening one beyond pool_maxsize.
+
+        snapshot_ttl is how many seconds Monitors answer their properties from
+        the snapshot taken by refresh_all before going back to the server.
+        cache_ttl opts into caching the state read by Monitor properties: it
+        maps each StateKind to the seconds a value is reused (default 0, except
+        for the event counts shared by all Monitors, see get_console_events).
+        frame_cache is the FrameCache holding the still images fetched by
+        get_snapshot (by default one of FrameCache.DEFAULT_MAX_BYTES).
+        shm_backend is a ShmBackend answering is_recording and is_available
+        from shared memory, when running on the ZoneMinder host. metrics is
+        the Metrics recording the API requests, to share one between clients.
+        circuit_breaker is the CircuitBreaker failing requests fast while the
+        server is down, and backoff the Backoff between the retries of a GET
+        failing with a server or connection error.
+        """
+        super().__init__(server_host, username, password, server_path, zms_path, verify_ssl)
+        self._owns_session = session is None
+        if session is None:
+            session = ZoneMinder._build_session(
+                pool_connections, pool_maxsize, pool_block, keep_alive
+            )
+            session.verify = verify_ssl
+        self._session = session
+        self._snapshot_ttl = snapshot_ttl
+        self._login_lock = threading.Lock()
+        self._frame_cache = FrameCache() if frame_cache is None else frame_cache
+        self._shm_backend = shm_backend
+        if metrics is not None:
+            self._metrics = metrics
+        if circuit_breaker is not None:
+            self._breaker = circuit_breaker
+        if backoff is not None:
+            self._backoff = backoff
+        self._snapshot_flight = SingleFlight()
+        self._get_flight = SingleFlight(lambda api_url: self._metrics.record_shared("get", api_url))
+        self._run_states = {}
+        self._run_states_by_name = {}
+        self._monitors = {}
+        self._monitors_by_name = {}
+        self._state_cache = StateCache({**ZoneMinder.DEFAULT_CACHE_TTL, **(cache_ttl or {})})
+
+    def __enter__(self):
+        """Enter the runtime context, returning this client."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Exit the runtime context and release pooled connections."""
+        self.close()
+
+    def close(self):
+        """Close the pooled connections if this client created the session."""
+        if self._owns_session:
+            self._session.close()
+
+    def login(self):
+        """Login to the ZoneMinder API."""
+        with self._login_lock:
+            return self._login()
+
+    def _login(self):
+        """Login with the username and password; the login lock must be held."""
+        _LOGGER.debug("Attempting to login to ZoneMinder")
+        self._metrics.record_login()
+
+        req = self._session.post(
             urljoin(self._server_url, "api/host/login.json"),
-            data=login_post,
-            verify=self._verify_ssl,
+            data=self._login_data(),
             timeout=ZoneMinder.DEFAULT_TIMEOUT,
         )
         if req.ok:
             try:
-                self._auth_token = req.json()["access_token"]
+                self._set_tokens(AuthTokens.from_login_response(req.json()))
                 return True
             except KeyError:
                 # Try legacy auth below
@@ -66,124 +421,585 @@ class ZoneMinder:
 
         return self._legacy_auth()
 
-    def _legacy_auth(self):
-        login_post = {"view": "console", "action": "login"}
-        if self._username:
-            login_post["username"] = self._username
-        if self._password:
-            login_post["password"] = self._password
+    def _refresh_login(self):
+        """Renew the access token with the refresh token; the login lock must be held."""
+        _LOGGER.debug("Refreshing the ZoneMinder access token")
+        self._metrics.record_token_refresh()
+
+        req = self._session.post(
+            urljoin(self._server_url, "api/host/login.json"),
+            data={"token": self._tokens.refresh_token},
+            timeout=ZoneMinder.DEFAULT_TIMEOUT,
+        )
+        if req.ok:
+            try:
+                self._tokens.renew(req.json())
+                self._set_tokens(self._tokens)
+                return True
+            except (KeyError, ValueError):
+                pass
+
+        _LOGGER.debug("Could not refresh the access token, logging in again")
+        return False
+
+    def reauthenticate(self, generation) -> bool:
+        """Renew the credentials refused to a request sent at auth_generation generation.
+
+        Callers whose credentials were renewed by another one meanwhile, or
+        waiting for the login in flight, do not log in again.
+        """
+        return self._reauthenticate(generation)
+
+    def _reauthenticate(self, generation) -> bool:
+        """Renew the credentials seen at generation, unless another caller already did.
+
+        Concurrent callers wait for the single login in flight rather than
+        starting their own. The refresh token is used while it is valid and
+        a full login is only made when it is not.
+        """
+        with self._login_lock:
+            if generation != self._auth_generation:
+                return True
+            if self._tokens is not None and self._tokens.can_refresh and self._refresh_login():
+                return True
+            return self._login()
 
-        req = requests.post(
+    def _legacy_auth(self):
+        # The session keeps the cookies set by the login page and sends
+        # them along with every subsequent request.
+        self._session.post(
             urljoin(self._server_url, "index.php"),
-            data=login_post,
-            verify=self._verify_ssl,
+            data=self._legacy_login_data(),
             timeout=ZoneMinder.DEFAULT_TIMEOUT,
         )
-        self._cookies = req.cookies
 
         # Login calls returns a 200 response on both failure and success.
         # The only way to tell if you logged in correctly is to issue an api
         # call.
-        req = requests.get(
+        req = self._session.get(
             urljoin(self._server_url, "api/host/getVersion.json"),
-            cookies=self._cookies,
             timeout=ZoneMinder.DEFAULT_TIMEOUT,
-            verify=self._verify_ssl,
         )
 
         if not req.ok:
             _LOGGER.error("Connection error logging into ZoneMinder")
             return False
 
+        self._set_tokens(None)
         return True
 
     def get_state(self, api_url) -> dict:
-        """Perform a GET request on the specified ZoneMinder API URL."""
-        return self._zm_request("get", api_url)
+        """Perform a GET request on the specified ZoneMinder API URL.
+
+        Callers asking for the same url while a request for it is in flight
+        wait for that request and share its (read-only) result, or error.
+        """
+        return self._get_flight.do(
+            api_url,
+            partial(self._zm_request, retries=ZoneMinder.SERVER_RETRIES),
+            "get",
+            api_url,
+        )
 
     def change_state(self, api_url, post_data) -> dict:
         """Perform a POST request on the specific ZoneMinder API Url."""
         return self._zm_request("post", api_url, post_data)
 
-    def _zm_request(self, method, api_url, data=None, timeout=DEFAULT_TIMEOUT) -> dict:
-        """Perform a request to the ZoneMinder API."""
-        token_url_suffix = ""
-        if self._auth_token:
-            token_url_suffix = "?token=" + self._auth_token
-        try:
-            # Since the API uses sessions that expire, sometimes we need to
-            # re-auth if the call fails.
-            for _ in range(ZoneMinder.LOGIN_RETRIES):
-                req = requests.request(
-                    method,
-                    urljoin(self._server_url, api_url) + token_url_suffix,
-                    data=data,
-                    cookies=self._cookies,
-                    timeout=timeout,
-                    verify=self._verify_ssl,
-                )
-
-                if not req.ok:
-                    self.login()
-                else:
-                    break
-
-            else:
-                _LOGGER.error("Unable to get API response from ZoneMinder")
+    def _zm_request(
+        self, method, api_url, data=None, timeout=BaseZoneMinder.DEFAULT_TIMEOUT, retries=0
+    ) -> dict:
+        """Perform a request to the ZoneMinder API.
 
+        retries is how many times it is sent again after a server or
+        connection error, only worth it for requests without side effects.
+        """
+        probe = self._metrics.start(method, api_url)
+        try:
+            req = self._send(probe, method, api_url, data, timeout, retries)
+            probe.bytes_received = len(req.content)
+            decode_started = time.perf_counter()
             try:
-                return req.json()
+                return loads(req.content)
             except ValueError:
+                probe.error = "decode"
                 _LOGGER.exception(
                     'JSON decode exception caught while attempting to decode "%s"',
                     req.text,
                 )
                 return {}
-        except requests.exceptions.ConnectionError:
+            finally:
+                probe.decode_time = time.perf_counter() - decode_started
+        except CircuitOpenError:
+            probe.error = "circuit_open"
+            _LOGGER.debug("Not requesting %s, ZoneMinder is down", api_url)
+            return {}
+        except requests.exceptions.RequestException:
+            probe.error = "connection"
             _LOGGER.exception("Unable to connect to ZoneMinder")
             return {}
+        finally:
+            probe.finish()
+
+    def _iter_items(self, api_url, key) -> Iterator[dict]:
+        """Iterate over the items of an array of a ZoneMinder API response as it arrives.
+
+        The response to a GET on api_url is decoded one item of its key
+        array at a time, so large responses are never held whole. Errors
+        are logged, then CommError is raised once the items received were
+        yielded, so that callers can tell a partial response from a whole one.
+        """
+        probe = self._metrics.start("get", api_url)
+        complete = False
+        try:
+            req = self._send(probe, "get", api_url, retries=ZoneMinder.SERVER_RETRIES, stream=True)
+            with req:
+                if req.ok:
+                    parser = ArrayItemParser(key)
+                    for chunk in req.iter_content(ZoneMinder.DEFAULT_CHUNK_SIZE):
+                        probe.bytes_received += len(chunk)
+                        decode_started = time.perf_counter()
+                        items = parser.feed(chunk)
+                        probe.decode_time += time.perf_counter() - decode_started
+                        yield from items
+                    yield from parser.close()
+                    complete = parser.found
+                    if not complete:
+                        _LOGGER.warning('No "%s" in the response to %s', key, api_url)
+        except ValueError:
+            probe.error = "decode"
+            _LOGGER.exception('JSON decode exception caught while decoding "%s"', api_url)
+        except CircuitOpenError:
+            probe.error = "circuit_open"
+            _LOGGER.debug("Not requesting %s, ZoneMinder is down", api_url)
+        except requests.exceptions.RequestException:
+            probe.error = "connection"
+            _LOGGER.exception("Unable to connect to ZoneMinder")
+        finally:
+            probe.finish()
+        if not complete:
+            raise CommError(api_url)
+
+    def _send(
+        self,
+        probe,
+        method,
+        api_url,
+        data=None,
+        timeout=BaseZoneMinder.DEFAULT_TIMEOUT,
+        retries=0,
+        stream=False,
+    ) -> requests.Response:
+        """Send a request to the ZoneMinder API, retrying the failures worth it.
+
+        Refused credentials are renewed and the request sent again. A
+        request failing with a server or connection error is sent up to
+        retries more times after a jittered backoff. Raises CircuitOpenError
+        without sending anything while the server is known to be down.
+        """
+        tokens = self._tokens
+        if tokens is not None and tokens.access_expiring:
+            self._reauthenticate(self._auth_generation)
+        retried = 0
+        logins = 0
+        while True:
+            if not self._breaker.allow():
+                raise CircuitOpenError(self._server_url)
+            probe.attempts += 1
+            counter = _REQUEST_COUNTER.get()
+            if counter is not None:
+                counter.add()
+            generation = self._auth_generation
+            try:
+                req = self._session.request(
+                    method,
+                    self._api_url(api_url),
+                    data=data,
+                    timeout=timeout,
+                    stream=stream,
+                )
+            except requests.exceptions.RequestException as err:
+                self._record_no_response(isinstance(err, requests.exceptions.ReadTimeout), timeout)
+                if retried >= retries:
+                    raise
+                failure = FailureKind.CONNECTION
+            except BaseException:
+                # Cancelled or interrupted, which says nothing about the server
+                self._breaker.release()
+                raise
+            else:
+                probe.status = req.status_code
+                failure = self._record_status(req.status_code)
+                if failure == FailureKind.AUTH and logins < ZoneMinder.LOGIN_RETRIES - 1:
+                    req.close()
+                    logins += 1
+                    self._reauthenticate(generation)
+                    continue
+                if failure is None or not failure.server_down:
+                    break
+                if retried >= retries:
+                    break
+                req.close()
+            delay = self._backoff.delay(retried)
+            retried += 1
+            _LOGGER.debug("Retrying %s in %.2fs after a %s failure", api_url, delay, failure.value)
+            time.sleep(delay)
+
+        if failure is not None:
+            _LOGGER.error("Unable to get API response from ZoneMinder: %s failure", failure.value)
+        return req
 
     def get_monitors(self) -> List[Monitor]:
         """Get a list of Monitors from the ZoneMinder API."""
-        raw_monitors = self._zm_request("get", ZoneMinder.MONITOR_URL)
-        if not raw_monitors:
-            _LOGGER.warning("Could not fetch monitors from ZoneMinder")
-            return []
+        return self.refresh_monitors()
 
-        if "monitors" not in raw_monitors:
-            _LOGGER.warning("Could not parse list of monitors from ZoneMinder")
+    def refresh_monitors(self) -> List[Monitor]:
+        """Fetch the Monitors with a single request and update them in place.
+
+        Monitors already known to this client are updated rather than
+        replaced, so references held by callers see the new configuration.
+        """
+        return self._update_monitors(self._iter_items(ZoneMinder.MONITOR_URL, "monitors"))
+
+    def get_monitor(self, key) -> Optional[Monitor]:
+        """Get a Monitor by id (int) or name (str).
+
+        Looked up in the Monitors fetched last, which are fetched first if
+        that never happened.
+        """
+        if not self._monitors:
+            self.refresh_monitors()
+        if isinstance(key, int):
+            return self._monitors.get(key)
+        return self._monitors_by_name.get(key)
+
+    def _update_monitors(self, raw_monitors) -> List[Monitor]:
+        """Update the known Monitors from monitors.json entries.
+
+        The known Monitors are kept as they are if there are no entries, or
+        if raw_monitors raises CommError for a response that broke off.
+        """
+        monitors = {}
+        try:
+            for raw_result in raw_monitors:
+                monitor_id = int(raw_result["Monitor"]["Id"])
+                monitor = self._monitors.get(monitor_id)
+                if monitor is None:
+                    _LOGGER.debug("Initializing camera %s", monitor_id)
+                    monitor = Monitor(self, raw_result)
+                else:
+                    monitor.update_from_raw(raw_result)
+                monitors[monitor_id] = monitor
+        except CommError:
+            _LOGGER.warning("Could not fetch all the monitors, keeping the known ones")
+            return []
+        if not monitors:
             return []
 
-        monitors = []
-        for raw_result in raw_monitors["monitors"]:
-            _LOGGER.debug("Initializing camera %s", raw_result["Monitor"]["Id"])
-            monitors.append(Monitor(self, raw_result))
+        self._monitors = monitors
+        self._monitors_by_name = {monitor.name: monitor for monitor in monitors.values()}
+        return list(monitors.values())
+
+    def refresh_all(self, monitors=None, max_workers=DEFAULT_REFRESH_WORKERS) -> RefreshResult:
+        """Refresh the status of many Monitors with as few requests as possible.
+
+        A single request to monitors.json refreshes the configuration and
+        capture status of every Monitor, then the per-monitor alarm and daemon
+        status APIs are fetched with at most max_workers requests in flight.
+        The given Monitors (or all the Monitors known to this client when none
+        are given) are updated in place and serve their properties from the
+        snapshot. If monitors.json cannot be fetched the Monitors are
+        returned as they are, without being refreshed.
+        """
+        started = time.monotonic()
+        counter = _RequestCounter()
+        token = _REQUEST_COUNTER.set(counter)
+        try:
+            response = self.get_state(ZoneMinder.MONITOR_URL)
+            if "monitors" not in response:
+                _LOGGER.error("Could not fetch monitors.json, the Monitors are not refreshed")
+                monitors = list(self._monitors.values() if monitors is None else monitors)
+            else:
+                monitors = self._refresh_from(
+                    self._raw_monitor_list(response), monitors, max_workers
+                )
+        finally:
+            _REQUEST_COUNTER.reset(token)
+
+        result = RefreshResult(monitors, counter.count, time.monotonic() - started)
+        _LOGGER.debug(
+            "Refreshed %d monitors with %d requests in %.3fs",
+            len(result.monitors),
+            result.requests,
+            result.elapsed,
+        )
+        return result
 
+    def _refresh_from(self, raw_monitors, monitors, max_workers) -> List[Monitor]:
+        """Refresh Monitors from monitors.json entries, see refresh_all."""
+        raw_by_id = {int(raw_result["Monitor"]["Id"]): raw_result for raw_result in raw_monitors}
+        if monitors is None:
+            monitors = self._update_monitors(raw_monitors) if raw_monitors else []
+        else:
+            for monitor in monitors:
+                if monitor.id not in raw_by_id:
+                    _LOGGER.warning("Monitor %s is no longer known to ZoneMinder", monitor.id)
+            monitors = [monitor for monitor in monitors if monitor.id in raw_by_id]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Each task counts its requests in a copy of this context
+            futures = [
+                executor.submit(copy_context().run, monitor.refresh, raw_by_id[monitor.id])
+                for monitor in monitors
+            ]
+            # Raise errors to the caller
+            for future in futures:
+                future.result()
         return monitors
 
-    def get_run_states(self) -> List[RunState]:
-        """Get a list of RunStates from the ZoneMinder API."""
-        raw_states = self.get_state("api/states.json")
+    def set_functions(
+        self, functions, max_workers=DEFAULT_REFRESH_WORKERS
+    ) -> Dict[int, FunctionChange]:
+        """Set the MonitorState of many Monitors, keyed by Monitor id.
+
+        functions maps Monitors to their new MonitorState. A single request to
+        monitors.json finds the Monitors already in their new state, which are
+        skipped (and updated in place); the others are changed with at most
+        max_workers requests in flight, see Monitor.change_function. A Monitor
+        ZoneMinder no longer knows or failed to save is reported as FAILED
+        without affecting the others. When monitors.json cannot be fetched,
+        every change is sent.
+        """
+        started = time.monotonic()
+        response = self.get_state(ZoneMinder.MONITOR_URL)
+        raw_monitors = self._raw_monitor_list(response)
+        raw_by_id = {int(raw_result["Monitor"]["Id"]): raw_result for raw_result in raw_monitors}
+        # Without it, which Monitors are known or already changed is unknown
+        has_snapshot = "monitors" in response
+
+        results = {}
+        changes = []
+        for monitor, function in functions.items():
+            raw_result = raw_by_id.get(monitor.id)
+            if raw_result is None and not has_snapshot:
+                changes.append((monitor, function))
+                continue
+            if raw_result is None:
+                _LOGGER.warning("Monitor %s is no longer known to ZoneMinder", monitor.id)
+                results[monitor.id] = FunctionChange(monitor.id, function, ChangeStatus.FAILED, 0.0)
+                continue
+            monitor.update_from_raw(raw_result)
+            if monitor.config.function == function.value:
+                results[monitor.id] = FunctionChange(
+                    monitor.id, function, ChangeStatus.SKIPPED, 0.0
+                )
+            else:
+                changes.append((monitor, function))
+
+        def change(monitor, function) -> FunctionChange:
+            change_started = time.monotonic()
+            status = ChangeStatus.OK if monitor.change_function(function) else ChangeStatus.FAILED
+            return FunctionChange(monitor.id, function, status, time.monotonic() - change_started)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(copy_context().run, change, monitor, function)
+                for monitor, function in changes
+            ]
+            for future in futures:
+                result = future.result()
+                results[result.monitor_id] = result
+
+        _LOGGER.debug(
+            "Changed %d of %d monitor functions in %.3fs",
+            sum(result.status == ChangeStatus.OK for result in results.values()),
+            len(results),
+            time.monotonic() - started,
+        )
+        return results
+
+    def get_snapshot(self, monitor, max_age=None) -> Optional[bytes]:
+        """Get a still JPEG image of a Monitor.
+
+        Served from the frame cache while younger than max_age (the cache's
+        ttl by default). Otherwise a single request is made to nph-zms, shared
+        by all the callers asking for the same Monitor at the same time.
+        Returns None if the image could not be fetched.
+        """
+        frame = self._frame_cache.get(monitor.id, max_age)
+        if frame is not None:
+            return frame
+        return self._snapshot_flight.do(monitor.id, self._fetch_snapshot, monitor)
+
+    def get_snapshots(
+        self, monitors, max_age=None, max_workers=DEFAULT_REFRESH_WORKERS
+    ) -> Dict[int, Optional[bytes]]:
+        """Get still JPEG images of many Monitors, keyed by Monitor id.
+
+        Images are fetched as by get_snapshot with at most max_workers
+        requests in flight.
+        """
+        monitors = list(monitors)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(copy_context().run, self.get_snapshot, monitor, max_age)
+                for monitor in monitors
+            ]
+            return {monitor.id: future.result() for monitor, future in zip(monitors, futures)}
+
+    def _fetch_snapshot(self, monitor) -> Optional[bytes]:
+        """Fetch a still image of a Monitor from nph-zms and cache it."""
+        try:
+            req = self._session.get(monitor.still_image_url, timeout=ZoneMinder.DEFAULT_TIMEOUT)
+        except requests.exceptions.RequestException:
+            _LOGGER.exception("Unable to connect to ZoneMinder")
+            return None
+        if not req.ok:
+            _LOGGER.warning("Could not get a still image of monitor %s", monitor.id)
+            return None
+        self._frame_cache.put(monitor.id, req.content)
+        return req.content
+
+    @property
+    def frame_cache(self) -> FrameCache:
+        """Get the cache of still images fetched by get_snapshot."""
+        return self._frame_cache
+
+    def iter_events(
+        self,
+        monitor_id=None,
+        start=None,
+        end=None,
+        archived=None,
+        min_score=None,
+        page_size=EventQuery.DEFAULT_PAGE_SIZE,
+        read_ahead=True,
+        descending=False,
+        time_field=EventQuery.DEFAULT_TIME_FIELD,
+    ) -> Iterator[Event]:
+        """Iterate lazily over the Events recorded by ZoneMinder, oldest first.
+
+        The filters (Monitor id, start and end datetimes, archived flag and
+        minimum MaxScore) are applied by the server. Events are fetched
+        page_size at a time as the iteration progresses and, with
+        read_ahead, the next page is fetched while the current one is
+        consumed. See EventQuery for time_field.
+        """
+        query = EventQuery(
+            monitor_id=monitor_id,
+            start=start,
+            end=end,
+            archived=archived,
+            min_score=min_score,
+            page_size=page_size,
+            descending=descending,
+            time_field=time_field,
+        )
+        return paginate_events(self.get_state, query, read_ahead)
+
+    def get_console_events(self, time_period, include_archived=False) -> dict:
+        """Get the consoleEvents response counting the events of every Monitor.
+
+        The response covers all Monitors, so it is cached per TimePeriod and
+        include_archived for the EVENTS TTL and shared by Monitor.get_events.
+        """
+        key = (time_period, include_archived)
+        cached = self._state_cache.get(key, StateKind.EVENTS)
+        if cached is not None:
+            return cached.value
+
+        event = self.get_state(self._console_events_url(time_period, include_archived))
+        if isinstance(event, dict) and "results" in event:
+            self._state_cache.put(key, StateKind.EVENTS, event)
+        return event
+
+    def get_event_counts(
+        self, time_periods=None, include_archived=False, monitors=None
+    ) -> Dict[int, Dict[TimePeriod, int]]:
+        """Get the number of events of every Monitor in each TimePeriod.
+
+        Issues one consoleEvents request per TimePeriod (all of them by
+        default), in parallel, and returns a matrix keyed by Monitor id and
+        then TimePeriod. Monitors without events are only included when they
+        are passed in monitors.
+        """
+        time_periods = list(time_periods or TimePeriod)
+        with ThreadPoolExecutor(max_workers=len(time_periods)) as executor:
+            # Each request runs in a copy of this context, so request
+            # accounting (such as a Fleet's) follows it to the worker
+            futures = [
+                executor.submit(
+                    copy_context().run, self.get_console_events, time_period, include_archived
+                )
+                for time_period in time_periods
+            ]
+            responses = [future.result() for future in futures]
+
+        counts = {monitor.id: {} for monitor in monitors or []}
+        for time_period, event in zip(time_periods, responses):
+            events_by_monitor = event.get("results") if isinstance(event, dict) else None
+            if not isinstance(events_by_monitor, dict):
+                # An empty PHP array (no events at all) is encoded as a list
+                if not isinstance(events_by_monitor, list):
+                    _LOGGER.warning("Could not get %s from ZoneMinder", time_period.title)
+                continue
+            for monitor_id, count in events_by_monitor.items():
+                counts.setdefault(int(monitor_id), {})[time_period] = int(count)
+
+        for by_period in counts.values():
+            for time_period in time_periods:
+                by_period.setdefault(time_period, 0)
+        return counts
+
+    def refresh_run_states(self) -> List[RunState]:
+        """Fetch the RunStates with a single request and update them in place.
+
+        RunStates already known to this client are updated rather than
+        replaced, so references held by callers see the new active flag.
+        """
+        raw_states = self._raw_state_list(self.get_state("api/states.json"))
         if not raw_states:
-            _LOGGER.warning("Could not fetch runstates from ZoneMinder")
             return []
 
-        run_states = []
-        for i in raw_states["states"]:
-            raw_state = i["State"]
-            _LOGGER.info("Initializing runstate %s", raw_state["Id"])
-            run_states.append(RunState(self, raw_state))
+        run_states = {}
+        for raw_state in raw_states:
+            state_id = int(raw_state["Id"])
+            run_state = self._run_states.get(state_id)
+            if run_state is None:
+                run_state = RunState(self, raw_state)
+            else:
+                run_state.update_state(raw_state)
+            run_states[state_id] = run_state
+
+        self._run_states = run_states
+        self._run_states_by_name = {state.name: state for state in run_states.values()}
+        return list(run_states.values())
+
+    def get_run_states(self) -> List[RunState]:
+        """Get a list of RunStates from the ZoneMinder API."""
+        return self.refresh_run_states()
+
+    def get_run_state(self, key) -> Optional[RunState]:
+        """Get a RunState by id (int) or name (str).
 
-        return run_states
+        Looked up in the RunStates fetched last, which are fetched first if
+        that never happened.
+        """
+        if not self._run_states:
+            self.refresh_run_states()
+        if isinstance(key, int):
+            return self._run_states.get(key)
+        return self._run_states_by_name.get(key)
 
     def get_active_state(self) -> Optional[str]:
         """Get the name of the active run state from the ZoneMinder API."""
-        for state in self.get_run_states():
+        for state in self.refresh_run_states():
             if state.active:
                 return state.name
         return None
 
-    def set_active_state(self, state_name):
+    def set_active_state(
+        self, state_name, wait=True, poll_interval=StateChangeJob.DEFAULT_POLL_INTERVAL
+    ):
         """
         Set the ZoneMinder run state to the given state name, via ZM API.
 
@@ -191,25 +1007,23 @@ class ZoneMinder:
         of each camera in turn, and this GET does not receive a response until
         all cameras have been updated. Even on a reasonably powerful machine,
         this call can take ten (10) or more seconds **per camera**. This method
-        sets a timeout of 120, which should be adequate for most users.
+        sets a timeout of 120, which should be adequate for most users. The
+        request restarts the daemons, so it is never retried.
+
+        With wait False a started StateChangeJob is returned right away
+        instead, which polls the Monitors every poll_interval seconds to
+        report the progress of each one.
         """
+        if not wait:
+            return StateChangeJob(self, state_name, poll_interval=poll_interval).start()
         _LOGGER.info("Setting ZoneMinder run state to state %s", state_name)
-        return self._zm_request("GET", f"api/states/change/{state_name}.json", timeout=120)
-
-    def get_zms_url(self) -> str:
-        """Get the url to the current ZMS instance."""
-        return self._zms_url
-
-    def get_url_with_auth(self, url) -> str:
-        """Add the auth credentials to a url (if needed)."""
-        if not self._username:
-            return url
-
-        url += f"&user={quote(self._username)}"
-
-        if not self._password:
-            return url
-        return url + f"&pass={quote(self._password)}"
+        result = self._zm_request(
+            "GET", f"api/states/change/{state_name}.json", timeout=ZoneMinder.LONG_TIMEOUT
+        )
+        if self._run_states:
+            # Keep the active flag of the RunStates handed out current
+            self.refresh_run_states()
+        return result
 
     @property
     def is_available(self) -> bool:
@@ -221,33 +1035,58 @@ class ZoneMinder:
 
         return status_response.get("result") == 1
 
+    def invalidate_cache(self):
+        """Expire all cached Monitor state so the next reads hit the server."""
+        self._state_cache.invalidate()
+
     @property
-    def verify_ssl(self) -> bool:
-        """Indicate whether urls with http(s) should verify the certificate."""
-        return self._verify_ssl
+    def state_cache(self) -> StateCache:
+        """Get the cache of Monitor state shared by the Monitors of this client."""
+        return self._state_cache
 
-    @staticmethod
-    def _build_zms_url(server_host, zms_path) -> str:
-        """Build the ZMS url to the current ZMS instance."""
-        return urljoin(server_host, zms_path)
+    @property
+    def snapshot_ttl(self) -> float:
+        """Get how many seconds a Monitor snapshot taken by refresh_all is used."""
+        return self._snapshot_ttl
+
+    @property
+    def session(self) -> requests.Session:
+        """Get the pooled HTTP session shared by all requests of this client."""
+        return self._session
 
     @staticmethod
-    def _build_server_url(server_host, server_path) -> str:
-        """Build the server url making sure it ends in a trailing slash."""
-        server_url = urljoin(server_host, server_path)
-        if server_url[-1] == "/":
-            return server_url
-        return f"{server_url}/"
+    def _build_session(pool_connections, pool_maxsize, pool_block, keep_alive) -> requests.Session:
+        """Build a session with a connection pool mounted for http and https."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not keep_alive:
+            session.headers["Connection"] = "close"
+        return session
 
-    def move_monitor(self, monitor: Monitor, direction: str):
-        """Call Zoneminder to move."""
+    def move_monitor(
+        self, monitor: Monitor, direction: str, timeout=Monitor.DEFAULT_PTZ_TIMEOUT
+    ) -> bool:
+        """Call Zoneminder to move, returning whether it succeeded.
+
+        See zoneminder.ptz.PtzDispatcher to send many moves without waiting.
+        """
         try:
-            result = monitor.ptz_control_command(direction, self._auth_token, self._server_url)
+            result = monitor.ptz_control_command(
+                direction, self._auth_token, self._server_url, timeout
+            )
             if result:
                 _LOGGER.info("Success to move camera to %s", direction)
             else:
                 _LOGGER.error("Impossible to move camera to %s", direction)
+            return result
         except ControlTypeError:
             _LOGGER.exception("Impossible move monitor")
         except MonitorControlTypeError:
             _LOGGER.exception("Impossible to use direction")
+        return False